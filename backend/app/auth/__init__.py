@@ -6,6 +6,7 @@ from .firebase_auth import (
     initialize_firebase,
     verify_firebase_token,
     get_current_user_from_token,
+    get_current_admin_user,
     get_current_user_optional
 )
 
@@ -13,5 +14,6 @@ __all__ = [
     "initialize_firebase",
     "verify_firebase_token", 
     "get_current_user_from_token",
+    "get_current_admin_user",
     "get_current_user_optional"
 ] 
\ No newline at end of file
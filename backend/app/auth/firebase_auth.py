@@ -166,6 +166,31 @@ def get_current_user_from_token(
     return user
 
 
+def get_current_admin_user(
+    current_user: User = Depends(get_current_user_from_token)
+) -> User:
+    """
+    Get the current user, requiring them to be listed in ADMIN_FIREBASE_UIDS
+    
+    Args:
+        current_user: Authenticated user
+        
+    Returns:
+        User object
+        
+    Raises:
+        HTTPException: 403 if the user is not an admin
+    """
+    admin_uids = {uid.strip() for uid in settings.ADMIN_FIREBASE_UIDS.split(",") if uid.strip()}
+    if current_user.firebase_uid not in admin_uids:
+        raise HTTPException(
+            status_code=403,
+            detail="Admin access required"
+        )
+    
+    return current_user
+
+
 def get_current_user_optional(
     request: Request,
     db: Session = Depends(get_db)
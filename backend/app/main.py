@@ -1,7 +1,7 @@
 # backend/app/main.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 from datetime import datetime
 
@@ -9,6 +9,15 @@ from datetime import datetime
 from .routers import health, analysis, auth, products
 from .models import create_tables
 from .config import settings
+from .services.job_service import analysis_job_queue
+from .services.llm_service import llm_service
+from .services.persistence_service import analysis_writer
+from .services.usage_service import usage_recorder
+from .services.raw_output_service import raw_output_store
+from .services.product_index import product_index
+from .services.product_features import start_feature_refresh
+from .services.redis_client import close_async_redis, connect_redis
+from .services.metrics import ServerTimingMiddleware, metrics_registry
 
 # Create FastAPI app
 app = FastAPI(
@@ -24,8 +33,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Idempotent-Replayed"],
 )
 
+# Per-stage timings in a Server-Timing header, plus request/stage histograms
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(health.router, prefix="/api/v1", tags=["health"])
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
@@ -43,6 +56,39 @@ async def startup_event():
         print(f"❌ Error creating database tables: {e}")
         # Don't crash the app if DB tables fail
         pass
+    
+    # Connect shared Redis off the event loop so no request pays for it
+    await connect_redis()
+    
+    # Open the OpenAI connection pool before the first analysis
+    await llm_service.warm_up()
+    
+    # Start the write-behind analysis writer before anything can submit to it
+    await analysis_writer.start()
+    await usage_recorder.start()
+    
+    # Drop stored raw LLM outputs past their retention period
+    raw_output_store.start_purge()
+    
+    # Backfill stale product scoring features; SQL ranking waits for it
+    await start_feature_refresh()
+    
+    # Build the product ingredient index in the background (SQL is used until it is ready)
+    await product_index.start()
+    
+    # Start background analysis workers
+    await analysis_job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers on shutdown"""
+    await analysis_job_queue.stop()
+    await analysis_writer.stop()
+    await usage_recorder.stop()
+    await raw_output_store.flush()
+    await product_index.stop()
+    await llm_service.aclose()
+    await close_async_redis()
 
 # Health check endpoint
 @app.get("/health")
@@ -57,6 +103,12 @@ async def health_check():
         "features": ["skin-analysis", "survey-integration", "enhanced-recommendations"]
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Request and analysis stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint
 @app.get("/")
 async def root():
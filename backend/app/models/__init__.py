@@ -26,6 +26,8 @@ from .survey_schemas import (
 from .database import Base, get_db, create_tables, drop_tables
 from .user import User, UserSurvey, SkinAnalysis
 from .product import Product, LiveSnapshot
+from .usage import LLMUsage
+from .llm_output import LLMOutput
 
 __all__ = [
     # Core analysis models
@@ -53,5 +55,7 @@ __all__ = [
     "UserSurvey",
     "SkinAnalysis",
     "Product",
-    "LiveSnapshot"
+    "LiveSnapshot",
+    "LLMUsage",
+    "LLMOutput"
 ]
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+SQLAlchemy model for stored raw LLM completions
+"""
+from sqlalchemy import Column, String, DateTime, Integer, Boolean, Text, LargeBinary, Index
+from sqlalchemy.sql import func
+
+from .database import Base
+
+
+class LLMOutput(Base):
+    """Compressed raw model output for one analysis, keyed by the analysis cache key"""
+    __tablename__ = "llm_outputs"
+    
+    cache_key = Column(String(255), primary_key=True)  # make_analysis_key / make_multi_analysis_key
+    output_format = Column(String(20), nullable=False)  # "analysis" or "two_phase"
+    model = Column(String(100), nullable=False)
+    raw_output = Column(LargeBinary, nullable=False)  # zlib-compressed UTF-8 text
+    raw_size = Column(Integer, nullable=False)  # Uncompressed length in bytes
+    parse_ok = Column(Boolean, nullable=False, default=False)
+    parse_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    parsed_at = Column(DateTime(timezone=True), server_default=func.now())  # Last parse attempt
+    
+    __table_args__ = (
+        Index("idx_llm_outputs_parse_ok", "parse_ok"),
+    )
+    
+    def __repr__(self):
+        return f"<LLMOutput(cache_key={self.cache_key}, parse_ok={self.parse_ok})>"
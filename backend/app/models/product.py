@@ -3,7 +3,7 @@ SQLAlchemy models for product management and live verification
 """
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON, Numeric, Index
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON, Numeric, Index, Float, SmallInteger
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -34,6 +34,13 @@ class Product(Base):
     last_seen = Column(DateTime(timezone=True), server_default=func.now())
     last_live_verified = Column(DateTime(timezone=True), nullable=True)
     tsv = Column(TSVECTOR)  # Full-text search vector for name/brand
+    
+    # Scoring features, maintained on write (see services/product_features.py)
+    active_positions = Column(ARRAY(SmallInteger), nullable=True)  # First position of each canonical ingredient, -1 if absent
+    price_score = Column(Float, nullable=True)  # Price efficiency points
+    retailer_score = Column(SmallInteger, nullable=True)  # Retailer reputation points
+    features_version = Column(SmallInteger, nullable=True)  # Canonical id layout the features were computed with
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
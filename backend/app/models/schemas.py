@@ -56,6 +56,8 @@ class ProductMatchRequest(BaseModel):
     avoid_ingredients: Optional[List[str]] = Field(default=[], description="List of ingredients to avoid")
     max_price: Optional[float] = Field(None, description="Maximum price filter")
     currency: Optional[str] = Field(None, description="Preferred currency (inferred from country if not provided)")
+    page_size: Optional[int] = Field(None, description="Products per page (default TOP_N_LIVE_CHECK)")
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page of the same match")
 
 
 class MatchedProduct(BaseModel):
@@ -83,6 +85,7 @@ class ProductMatchResponse(BaseModel):
     generated_at: str = Field(..., description="Response generation timestamp")
     currency: str = Field(..., description="Currency used for pricing")
     results: List[MatchedProduct] = Field(..., description="List of matched products")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null on the last page")
 
 
 
@@ -0,0 +1,34 @@
+"""
+SQLAlchemy model for per-call LLM token and cost accounting
+"""
+from sqlalchemy import Column, String, DateTime, Integer, Boolean, Numeric, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+
+from .database import Base
+
+
+class LLMUsage(Base):
+    """Token usage, latency and cost of one LLM call"""
+    __tablename__ = "llm_usage"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    model = Column(String(100), nullable=False)
+    analysis_key = Column(String(32), nullable=True)  # Shared by every call of one analysis (two-phase makes two)
+    personalized = Column(Boolean, nullable=False, default=False)  # Survey context was sent
+    streamed = Column(Boolean, nullable=False, default=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False)  # Provider call only, excluding limiter queueing
+    image_bytes = Column(Integer, nullable=True)  # Size of the image sent to the model
+    finish_reason = Column(String(32), nullable=True)
+    cost_usd = Column(Numeric(12, 8), nullable=False, default=0)  # Priced when recorded
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("idx_llm_usage_created_at", "created_at"),
+    )
+    
+    def __repr__(self):
+        return f"<LLMUsage(id={self.id}, model={self.model}, tokens={self.prompt_tokens}+{self.completion_tokens})>"
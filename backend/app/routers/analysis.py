@@ -1,17 +1,26 @@
 # backend/app/routers/analysis.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from typing import Optional, List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Header, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+from typing import Optional, List, Dict, Any, Callable, Awaitable
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 
 # Import unified services and schemas
 from ..services.analysis_service import analysis_service
 from ..services.database_service import DatabaseService
+from ..services.job_service import analysis_job_queue
+from ..services.persistence_service import analysis_writer
+from ..services.metrics import timed_stage
+from ..services.usage_service import usage_recorder
+from ..services.idempotency import idempotency_service, fingerprint_request
+from ..services.rate_limiter import rate_limiter, client_ip
+from ..services.concurrency import set_authenticated_caller
 from ..models.schemas import SkinAnalysisResponse
+from ..config import settings
 from ..models import get_db, User, SkinAnalysis
-from ..auth import get_current_user_from_token, get_current_user_optional
+from ..auth import get_current_user_from_token, get_current_user_optional, get_current_admin_user
 
 router = APIRouter()
 
@@ -26,79 +35,379 @@ class AnalysisHistoryResponse(BaseModel):
     class Config:
         from_attributes = True
 
+def _build_survey_data(
+    userContext: Optional[str],
+    safetyWarnings: Optional[str],
+    ageRecommendations: Optional[str],
+    username: Optional[str],
+    current_user: Optional[User]
+) -> Optional[Dict[str, Any]]:
+    """Parse survey form fields into the survey data passed to the analysis service"""
+    if not userContext:
+        return None
+    
+    return {
+        'userContext': userContext,
+        'safetyWarnings': json.loads(safetyWarnings) if safetyWarnings else [],
+        'ageRecommendations': json.loads(ageRecommendations) if ageRecommendations else [],
+        'username': username or (current_user.display_name if current_user else 'User')
+    }
+
+async def _limit_analysis_rate(
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user_optional)
+) -> None:
+    """
+    Apply the caller's rate limit and record whether LLM calls run for a signed-in user
+    
+    Used as a dependency by routes without Idempotency-Key support; the
+    others call it from _run_idempotent so replays are not charged.
+    """
+    set_authenticated_caller(current_user is not None)
+    await rate_limiter.check(current_user.firebase_uid if current_user else None, client_ip(request))
+
+async def _save_analysis_for_user(user_id: str, result: SkinAnalysisResponse) -> None:
+    """Queue an analysis result for write-behind persistence against the user's latest survey"""
+    with timed_stage("persist"):
+        await analysis_writer.submit(user_id, result.dict())
+
+async def _run_idempotent(
+    idempotency_key: Optional[str],
+    route: str,
+    request: Request,
+    current_user: Optional[User],
+    files: List[UploadFile],
+    fields: Dict[str, Any],
+    handler: Callable[[], Awaitable[Any]],
+    status_code: int = 200
+) -> Any:
+    """
+    Run a route handler, honouring an Idempotency-Key header if one was sent
+    
+    Without a key the handler's result is returned as usual. With one, the
+    stored response is replayed for duplicates (marked with an
+    Idempotent-Replayed header) and the handler runs at most once. The
+    caller's rate limit is charged only when the handler actually runs. Keys
+    are scoped to the signed-in user, or to the client address for
+    anonymous callers so they cannot replay each other's responses.
+    """
+    async def limited_handler() -> Any:
+        await _limit_analysis_rate(request, current_user)
+        return await handler()
+    
+    if not idempotency_key or not idempotency_service.enabled:
+        return await limited_handler()
+    
+    caller = f"user:{current_user.id}" if current_user else f"ip:{client_ip(request)}"
+    scope = f"{route}:{caller}"
+    fingerprint = await fingerprint_request(files, fields)
+    record, replayed = await idempotency_service.run(idempotency_key, scope, fingerprint, limited_handler, status_code)
+    
+    return JSONResponse(
+        content=record["body"],
+        status_code=record["status_code"],
+        headers={"Idempotent-Replayed": "true" if replayed else "false"}
+    )
+
+def _format_sse(event: str, data: Any) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/analyze/skin", response_model=SkinAnalysisResponse)
 async def analyze_skin_with_survey(
+    request: Request,
     file: UploadFile = File(...),
     userContext: Optional[str] = Form(None),
     safetyWarnings: Optional[str] = Form(None),
     ageRecommendations: Optional[str] = Form(None),
     username: Optional[str] = Form(None),
-    current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: Optional[User] = Depends(get_current_user_optional)
 ):
-    """Enhanced skin analysis endpoint that accepts survey data"""
+    """
+    Enhanced skin analysis endpoint that accepts survey data
     
-    # Validate file
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    Send an Idempotency-Key header to make retries safe: duplicates get the
+    first request's response instead of a new analysis.
+    """
     
     try:
-        db_service = DatabaseService(db)
-        
-        # Parse survey data if provided
-        survey_data = None
-        if userContext:
-            survey_data = {
-                'userContext': userContext,
-                'safetyWarnings': json.loads(safetyWarnings) if safetyWarnings else [],
-                'ageRecommendations': json.loads(ageRecommendations) if ageRecommendations else [],
-                'username': username or (current_user.display_name if current_user else 'User')
-            }
+        survey_data = _build_survey_data(userContext, safetyWarnings, ageRecommendations, username, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid survey data: {str(e)}")
+    
+    async def run_analysis() -> SkinAnalysisResponse:
+        try:
+            # Perform analysis using unified service
+            result = await analysis_service.analyze_skin_image(file, survey_data)
+            
+            # Save analysis to database if user is authenticated (written in the background)
+            if current_user:
+                await _save_analysis_for_user(str(current_user.id), result)
+            
+            return result
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    fields = {
+        "userContext": userContext,
+        "safetyWarnings": safetyWarnings,
+        "ageRecommendations": ageRecommendations,
+        "username": username
+    }
+    return await _run_idempotent(idempotency_key, "analyze_skin", request, current_user, [file], fields, run_analysis)
+
+@router.post("/analyze/skin/stream", dependencies=[Depends(_limit_analysis_rate)])
+async def analyze_skin_stream(
+    file: UploadFile = File(...),
+    userContext: Optional[str] = Form(None),
+    safetyWarnings: Optional[str] = Form(None),
+    ageRecommendations: Optional[str] = Form(None),
+    username: Optional[str] = Form(None),
+    twoPhase: Optional[bool] = Form(None),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Streaming skin analysis endpoint (Server-Sent Events)
+    
+    Emits confidence, primaryCondition, secondaryConditions, skinType and
+    description events as each field completes, one ingredient event per
+    recommendation, and a final result event carrying the validated
+    SkinAnalysisResponse. Failures after the stream starts are sent as an
+    error event.
+    
+    With twoPhase (default from ANALYSIS_TWO_PHASE_STREAMING) the four
+    classification events arrive together from a short first call, before
+    a second call generates the ingredient and description events.
+    
+    Idempotency-Key is not supported here: a stream cannot be replayed, so
+    the header is ignored. Use /analyze/skin or /analyze/jobs for safe retries.
+    """
+    
+    analysis_service.validate_upload_file(file)
+    
+    try:
+        survey_data = _build_survey_data(userContext, safetyWarnings, ageRecommendations, username, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid survey data: {str(e)}")
+    
+    contents = await analysis_service.read_upload_file(file)
+    user_id = str(current_user.id) if current_user else None
+    two_phase = settings.ANALYSIS_TWO_PHASE_STREAMING if twoPhase is None else twoPhase
+    
+    async def event_stream():
+        try:
+            async for event, data in analysis_service.stream_image_bytes(contents, survey_data, two_phase=two_phase):
+                if event == "result":
+                    if user_id:
+                        await _save_analysis_for_user(user_id, data)
+                    data = data.model_dump()
+                
+                yield _format_sse(event, data)
+                
+        except HTTPException as e:
+            yield _format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            yield _format_sse("error", {"status_code": 500, "detail": f"Analysis failed: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/analyze/skin/multi", response_model=SkinAnalysisResponse)
+async def analyze_skin_multi_angle(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    views: Optional[str] = Form(None),
+    tile: Optional[bool] = Form(None),
+    userContext: Optional[str] = Form(None),
+    safetyWarnings: Optional[str] = Form(None),
+    ageRecommendations: Optional[str] = Form(None),
+    username: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Multi-angle skin analysis: several photos of one face, one consolidated result
+    
+    Accepts up to MULTI_IMAGE_MAX_FILES photos (e.g. front, left and right
+    profile) and analyses them in a single vision request. views is an
+    optional comma-separated label per photo; tile combines the photos into
+    one grid image (default MULTI_IMAGE_TILE).
+    """
+    
+    if not 1 <= len(files) <= settings.MULTI_IMAGE_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload between 1 and {settings.MULTI_IMAGE_MAX_FILES} photos."
+        )
+    
+    view_labels = [label.strip() for label in views.split(",")] if views else None
+    if view_labels and len(view_labels) != len(files):
+        raise HTTPException(status_code=400, detail="views must have one label per photo")
+    
+    for file in files:
+        analysis_service.validate_upload_file(file)
+    
+    try:
+        survey_data = _build_survey_data(userContext, safetyWarnings, ageRecommendations, username, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid survey data: {str(e)}")
+    
+    use_tiling = settings.MULTI_IMAGE_TILE if tile is None else tile
+    
+    async def run_analysis() -> SkinAnalysisResponse:
+        images = [await analysis_service.read_upload_file(file) for file in files]
         
-        # Perform analysis using unified service
-        result = await analysis_service.analyze_skin_image(file, survey_data)
+        result = await analysis_service.analyze_multi_image_bytes(
+            images,
+            survey_data,
+            views=view_labels,
+            tile=use_tiling
+        )
         
-        # Save analysis to database if user is authenticated
         if current_user:
-            # Get latest survey for context
-            latest_survey = db_service.get_latest_user_survey(str(current_user.id))
-            survey_id = str(latest_survey.id) if latest_survey else None
-            
-            # Save analysis
-            db_service.create_skin_analysis(
-                user_id=str(current_user.id),
-                analysis_data=result.dict(),
-                survey_id=survey_id
-            )
+            await _save_analysis_for_user(str(current_user.id), result)
         
         return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    fields = {
+        "views": view_labels,
+        "tile": use_tiling,
+        "userContext": userContext,
+        "safetyWarnings": safetyWarnings,
+        "ageRecommendations": ageRecommendations,
+        "username": username
+    }
+    return await _run_idempotent(
+        idempotency_key, "analyze_skin_multi", request, current_user, files, fields, run_analysis
+    )
 
 @router.post("/analyze/skin/basic", response_model=SkinAnalysisResponse)
 async def analyze_skin_basic(
-    file: UploadFile = File(...)
+    request: Request,
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     """Basic skin analysis without survey data"""
     
-    # Validate file
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    async def run_analysis() -> SkinAnalysisResponse:
+        try:
+            # Perform basic analysis using unified service
+            result = await analysis_service.analyze_skin_image_basic(file)
+            
+            return result
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    return await _run_idempotent(
+        idempotency_key, "analyze_skin_basic", request, current_user, [file], {}, run_analysis
+    )
+
+@router.post("/analyze/jobs", status_code=202)
+async def create_analysis_job(
+    request: Request,
+    file: UploadFile = File(...),
+    userContext: Optional[str] = Form(None),
+    safetyWarnings: Optional[str] = Form(None),
+    ageRecommendations: Optional[str] = Form(None),
+    username: Optional[str] = Form(None),
+    callbackUrl: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Queue a skin analysis and return a job ID immediately
+    
+    Poll /analyze/jobs/{job_id} for the result, or pass callbackUrl to have
+    the finished job record POSTed to it. With an Idempotency-Key header a
+    retried submission returns the original job instead of queuing another.
+    """
+    
+    analysis_service.validate_upload_file(file)
+    
+    if callbackUrl and not callbackUrl.startswith(("https://", "http://")):
+        raise HTTPException(status_code=400, detail="callbackUrl must be an http(s) URL")
     
     try:
-        # Perform basic analysis using unified service
-        result = await analysis_service.analyze_skin_image_basic(file)
+        survey_data = _build_survey_data(userContext, safetyWarnings, ageRecommendations, username, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid survey data: {str(e)}")
+    
+    async def queue_job() -> Dict[str, Any]:
+        contents = await analysis_service.read_upload_file(file)
         
-        return result
+        job = await analysis_job_queue.enqueue(
+            contents,
+            survey_data,
+            user_id=str(current_user.id) if current_user else None,
+            callback_url=callbackUrl
+        )
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "status_url": f"/api/v1/analyze/jobs/{job['id']}"
+        }
+    
+    fields = {
+        "userContext": userContext,
+        "safetyWarnings": safetyWarnings,
+        "ageRecommendations": ageRecommendations,
+        "username": username,
+        "callbackUrl": callbackUrl
+    }
+    return await _run_idempotent(
+        idempotency_key, "analyze_jobs", request, current_user, [file], fields, queue_job, status_code=202
+    )
+
+@router.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(
+    job_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """Get the status and, once finished, the result of a queued analysis"""
+    job = await analysis_job_queue.get_job(job_id)
+    
+    # Jobs submitted by a signed-in user are only visible to that user
+    if not job or (job["user_id"] and (not current_user or str(current_user.id) != job["user_id"])):
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    
+    return {key: value for key, value in job.items() if key not in ("user_id", "callback_url")}
 
 @router.get("/analyze/status")
 async def get_analysis_status():
     """Get analysis service status"""
-    return analysis_service.get_service_status()
+    status = analysis_service.get_service_status()
+    status["job_queue"] = await analysis_job_queue.get_status()
+    status["analysis_writer"] = analysis_writer.get_status()
+    status["llm_usage"] = usage_recorder.get_status()
+    status["idempotency"] = idempotency_service.get_status()
+    status["rate_limit"] = rate_limiter.get_status()
+    return status
+
+@router.get("/analyze/usage")
+async def get_llm_usage_report(
+    hours: float = Query(24, gt=0, le=24 * 90, description="Reporting window in hours"),
+    admin_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Get token throughput and cost per analysis, split by personalized and basic analyses (admins only)"""
+    # Include calls still waiting in the recorder's buffer
+    await usage_recorder.flush()
+    
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    totals = DatabaseService(db).get_llm_usage_totals(since)
+    return usage_recorder.build_report(totals, hours)
 
 # Analysis history endpoints
 @router.get("/analyze/history", response_model=List[AnalysisHistoryResponse])
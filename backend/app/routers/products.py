@@ -30,6 +30,9 @@ router = APIRouter()
     3. Perform live verification of availability and pricing
     4. Return sorted results with last verification timestamps
     
+    Results are paged: pass `page_size`, then the returned `next_cursor` as
+    `cursor` to get the next page from the same cached ranking.
+    
     The matching considers ingredient aliases (e.g., niacinamide = vitamin B3) 
     and returns only products that have been verified within the last 24 hours.
     """,
@@ -122,9 +125,13 @@ async def get_products_health() -> dict:
             "cache": "not_configured",
             "configuration": {
                 "top_n_live_check": product_service.top_n_live_check,
+                "max_page_size": product_service.max_page_size,
+                "ranking_size": product_service.ranking_size,
+                "cached_rankings": len(product_service.rankings),
                 "live_check_timeout": product_service.live_check_timeout,
                 "supported_countries": product_service.country_whitelist
-            }
+            },
+            "ingredient_index": product_service.index.get_status()
         }
         
         # Check retailer adapters
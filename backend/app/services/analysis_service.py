@@ -1,28 +1,69 @@
 """
 Analysis service for orchestrating skin condition analysis workflow
 """
-import base64
+import asyncio
+import json
 import random
 import logging
-from typing import BinaryIO, Optional, Dict, Any
+from typing import BinaryIO, Callable, Optional, Dict, Any, List, Tuple, AsyncIterator
 from fastapi import HTTPException, UploadFile
 
 from app.models.schemas import SkinAnalysisResponse
 from app.services.llm_service import llm_service
-from app.utils.parsing import parse_skin_analysis_response
+from app.services.cache_service import analysis_cache, make_analysis_key, make_multi_analysis_key
+from app.services.coalescing import SingleFlight
+from app.services.metrics import timed_stage
+from app.services.usage_service import begin_analysis_usage
+from app.services.raw_output_service import (
+    raw_output_store,
+    describe_parse_error,
+    FORMAT_ANALYSIS,
+    FORMAT_TWO_PHASE
+)
+from app.utils.parsing import (
+    parse_skin_analysis_response,
+    parse_skin_classification_response,
+    merge_two_phase_response
+)
+from app.utils.images import preprocess_image, tile_images
+from app.utils.quality import QualityReport, assess_image_bytes
+from app.utils.streaming import IncrementalAnalysisParser
+from app.utils.uploads import SNIFF_BYTES, encode_data_url, read_upload_bounded, sniff_image_type
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Fields produced by the first call of a two-phase analysis, in emission order
+CLASSIFICATION_FIELDS = ("confidence", "primaryCondition", "secondaryConditions", "skinType")
+
 class AnalysisService:
     """Service for managing the complete skin analysis workflow"""
     
     def __init__(self):
         self.llm_service = llm_service
+        self.cache = analysis_cache
+        self.single_flight = SingleFlight("analysis")
+        self.raw_outputs = raw_output_store
+        self.preprocessing_stats = {
+            "images_processed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "bytes_saved": 0,
+        }
+        self.quality_stats = {
+            "checked": 0,
+            "passed": 0,
+            "rejected": 0,
+            "hinted": 0,
+            "issues": {},
+        }
     
     def validate_upload_file(self, file: UploadFile) -> None:
         """
-        Validate uploaded file type and size
+        Reject uploads whose declared size is already over the limit
+        
+        The image type is checked from the file's magic bytes while it is
+        read (see read_upload_file), not from the client-supplied content type.
         
         Args:
             file: FastAPI UploadFile object
@@ -30,49 +71,64 @@ class AnalysisService:
         Raises:
             HTTPException: If file validation fails
         """
-        # Validate file type
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid file type. Please upload an image."
-            )
-        
-        # Check if content type is in allowed list
-        if file.content_type not in settings.ALLOWED_CONTENT_TYPES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported image format. Allowed formats: {', '.join(settings.ALLOWED_CONTENT_TYPES)}"
-            )
-        
         # Check file size
-        if file.size and file.size > settings.MAX_FILE_SIZE:
-            max_size_mb = settings.MAX_FILE_SIZE / (1024 * 1024)
+        with timed_stage("validate"):
+            if file.size and file.size > settings.MAX_FILE_SIZE:
+                max_size_mb = settings.MAX_FILE_SIZE / (1024 * 1024)
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"File too large. Maximum size is {max_size_mb:.0f}MB."
+                )
+    
+    async def read_upload_file(self, file: UploadFile) -> bytes:
+        """
+        Read the uploaded image into memory in bounded chunks
+        
+        Args:
+            file: FastAPI UploadFile object
+            
+        Returns:
+            Raw image bytes
+            
+        Raises:
+            HTTPException: If the upload is too large, not a supported image or reading fails
+        """
+        try:
+            with timed_stage("read"):
+                return await read_upload_bounded(
+                    file, settings.MAX_FILE_SIZE, settings.ALLOWED_CONTENT_TYPES
+                )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Failed to read uploaded image: {e}")
             raise HTTPException(
-                status_code=400, 
-                detail=f"File too large. Maximum size is {max_size_mb:.0f}MB."
+                status_code=500, 
+                detail=f"Failed to process image: {str(e)}"
             )
     
-    async def encode_image_to_base64(self, file: UploadFile) -> str:
+    def encode_image_data_url(self, contents: bytes, mime_type: str) -> str:
         """
-        Read and encode image file to base64
+        Encode image bytes as a base64 data URL
         
         Args:
-            file: FastAPI UploadFile object
+            contents: Raw image bytes
+            mime_type: MIME type of the image
             
         Returns:
-            Base64 encoded image string
+            Base64 data URL for the vision request
             
         Raises:
             HTTPException: If encoding fails
         """
         try:
-            contents = await file.read()
-            base64_str = base64.b64encode(contents).decode("utf-8")
+            with timed_stage("encode"):
+                image_url = encode_data_url(contents, mime_type)
             
             logger.info(f"✅ File encoded successfully - Original size: {len(contents)} bytes, "
-                       f"Base64 length: {len(base64_str)}")
+                       f"Data URL length: {len(image_url)}")
             
-            return base64_str
+            return image_url
             
         except Exception as e:
             logger.error(f"❌ Failed to encode image: {e}")
@@ -81,6 +137,85 @@ class AnalysisService:
                 detail=f"Failed to process image: {str(e)}"
             )
     
+    async def preprocess_image_bytes(
+        self,
+        contents: bytes,
+        max_edge: Optional[int] = None
+    ) -> Tuple[bytes, str, Optional[QualityReport]]:
+        """
+        Orient, strip metadata from and downscale an image off the event loop
+        
+        The photo quality checks run on the same decode when enabled.
+        
+        Args:
+            contents: Raw image bytes
+            max_edge: Longest edge to downscale to (default IMAGE_MAX_EDGE)
+            
+        Returns:
+            Tuple of (image bytes to upload, MIME type, quality report or None)
+        """
+        assess_quality = settings.IMAGE_QUALITY_CHECK_MODE != "off"
+        
+        if not settings.IMAGE_PREPROCESSING_ENABLED:
+            with timed_stage("preprocess"):
+                quality_report = await asyncio.to_thread(assess_image_bytes, contents) if assess_quality else None
+            return contents, sniff_image_type(contents[:SNIFF_BYTES]) or "image/jpeg", quality_report
+        
+        with timed_stage("preprocess"):
+            processed = await asyncio.to_thread(
+                preprocess_image,
+                contents,
+                max_edge=max_edge or settings.IMAGE_MAX_EDGE,
+                assess_quality=assess_quality
+            )
+        
+        self.preprocessing_stats["images_processed"] += 1
+        self.preprocessing_stats["bytes_in"] += processed.original_size
+        self.preprocessing_stats["bytes_out"] += len(processed.data)
+        self.preprocessing_stats["bytes_saved"] += processed.bytes_saved
+        
+        return processed.data, processed.mime_type, processed.quality
+    
+    def check_image_quality(self, report: Optional[QualityReport], analysis_id: int) -> Optional[str]:
+        """
+        Act on the photo quality report before the LLM call
+        
+        Args:
+            report: Quality report from preprocessing, if the check ran
+            analysis_id: Analysis identifier for logging
+            
+        Returns:
+            Quality hint for the prompt, or None
+            
+        Raises:
+            HTTPException: 422 with tips if the mode is "reject" and an issue other
+                than a hint-only one (no skin detected) was found
+        """
+        if report is None:
+            return None
+        
+        self.quality_stats["checked"] += 1
+        if report.passed:
+            self.quality_stats["passed"] += 1
+            return None
+        
+        for issue in report.issues:
+            self.quality_stats["issues"][issue] = self.quality_stats["issues"].get(issue, 0) + 1
+        
+        logger.info(f"📷 Photo quality issues for analysis {analysis_id}: {', '.join(report.issues)} "
+                   f"(sharpness {report.sharpness:.0f}, brightness {report.brightness:.0f}, "
+                   f"skin {report.skin_fraction:.0%}, min edge {report.min_edge}px)")
+        
+        if settings.IMAGE_QUALITY_CHECK_MODE == "reject" and report.rejectable:
+            self.quality_stats["rejected"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail=f"Photo quality is too low for an accurate analysis. {' '.join(report.tips)}"
+            )
+        
+        self.quality_stats["hinted"] += 1
+        return report.as_prompt_hint()
+    
     async def analyze_skin_image(
         self, 
         file: UploadFile, 
@@ -108,6 +243,42 @@ class AnalysisService:
         # Validate file
         self.validate_upload_file(file)
         
+        contents = await self.read_upload_file(file)
+        
+        return await self.analyze_image_bytes(contents, survey_data, analysis_id)
+    
+    async def analyze_image_bytes(
+        self,
+        contents: bytes,
+        survey_data: Optional[Dict[str, Any]] = None,
+        analysis_id: Optional[int] = None
+    ) -> SkinAnalysisResponse:
+        """
+        Analyze already-read image bytes, serving repeat submissions from the result cache
+        
+        Args:
+            contents: Raw image bytes
+            survey_data: Optional user survey data for personalization
+            analysis_id: Optional analysis identifier for logging
+            
+        Returns:
+            SkinAnalysisResponse with skin condition and ingredient recommendations
+            
+        Raises:
+            HTTPException: If analysis fails
+        """
+        if analysis_id is None:
+            analysis_id = random.randint(1000, 9999)
+        begin_analysis_usage()
+        
+        cache_key = make_analysis_key(contents, survey_data)
+        with timed_stage("cache"):
+            cached_response = await self.cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"⚡ Skin analysis {analysis_id} served from cache - "
+                       f"Primary condition: {cached_response.primaryCondition}")
+            return cached_response
+        
         # Check if LLM is available
         if not self.llm_service.is_available:
             raise HTTPException(
@@ -115,19 +286,48 @@ class AnalysisService:
                 detail="Skin analysis service is currently unavailable. Please try again later."
             )
         
+        # Identical requests already in flight share one LLM call
+        return await self.single_flight.run(
+            cache_key,
+            lambda: self._analyze_uncached(contents, survey_data, analysis_id, cache_key),
+            lookup=lambda: self.cache.get(cache_key, count_miss=False)
+        )
+    
+    async def _analyze_uncached(
+        self,
+        contents: bytes,
+        survey_data: Optional[Dict[str, Any]],
+        analysis_id: int,
+        cache_key: str
+    ) -> SkinAnalysisResponse:
+        """Run preprocessing, the LLM call and parsing, then cache the result"""
         try:
+            # A stored completion for this exact request costs no LLM call
+            repaired = await self._repair_from_storage(cache_key, analysis_id)
+            if repaired is not None:
+                return repaired
+            
+            # Downscale and re-encode before upload
+            image_bytes, mime_type, quality_report = await self.preprocess_image_bytes(contents)
+            
+            # Reject unusable photos before paying for an LLM call
+            quality_hint = self.check_image_quality(quality_report, analysis_id)
+            
             # Encode image
-            base64_image = await self.encode_image_to_base64(file)
+            image_url = self.encode_image_data_url(image_bytes, mime_type)
             
             # Get LLM analysis with survey data
             llm_response = await self.llm_service.analyze_skin_image(
-                base64_image, 
+                image_url, 
                 analysis_id, 
-                survey_data
+                survey_data,
+                quality_hint
             )
             
-            # Parse response
-            analysis_response = parse_skin_analysis_response(llm_response)
+            # Parse response, keeping the raw output either way
+            analysis_response = self._parse_and_store(cache_key, llm_response)
+            
+            await self.cache.set(cache_key, analysis_response)
             
             logger.info(f"✅ Skin analysis {analysis_id} completed successfully - "
                        f"Primary condition: {analysis_response.primaryCondition}, "
@@ -146,6 +346,325 @@ class AnalysisService:
                 detail=f"Analysis failed: {str(e)}"
             )
     
+    async def analyze_multi_image_bytes(
+        self,
+        images: List[bytes],
+        survey_data: Optional[Dict[str, Any]] = None,
+        views: Optional[List[str]] = None,
+        tile: bool = False,
+        analysis_id: Optional[int] = None
+    ) -> SkinAnalysisResponse:
+        """
+        Analyze several photos of one face (e.g. front and profiles) in a single LLM call
+        
+        Every photo is downscaled to MULTI_IMAGE_MAX_EDGE and sent as its own
+        image part, or tiled into one grid image when tile is set, so the
+        system prompt and round-trip are paid once per session.
+        
+        Args:
+            images: Raw image bytes, one per view
+            survey_data: Optional user survey data for personalization
+            views: Optional view labels in upload order (e.g. "front", "left profile")
+            tile: Combine the photos into one grid image
+            analysis_id: Optional analysis identifier for logging
+            
+        Returns:
+            One consolidated SkinAnalysisResponse
+            
+        Raises:
+            HTTPException: If analysis fails
+        """
+        if analysis_id is None:
+            analysis_id = random.randint(1000, 9999)
+        begin_analysis_usage()
+        
+        variant = f"{'tiled' if tile else 'parts'}:{'|'.join(views or [])}"
+        cache_key = make_multi_analysis_key(images, survey_data, variant)
+        with timed_stage("cache"):
+            cached_response = await self.cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"⚡ Multi-angle skin analysis {analysis_id} served from cache")
+            return cached_response
+        
+        if not self.llm_service.is_available:
+            raise HTTPException(
+                status_code=503, 
+                detail="Skin analysis service is currently unavailable. Please try again later."
+            )
+        
+        return await self.single_flight.run(
+            cache_key,
+            lambda: self._analyze_multi_uncached(images, survey_data, views, tile, analysis_id, cache_key),
+            lookup=lambda: self.cache.get(cache_key, count_miss=False)
+        )
+    
+    async def _analyze_multi_uncached(
+        self,
+        images: List[bytes],
+        survey_data: Optional[Dict[str, Any]],
+        views: Optional[List[str]],
+        tile: bool,
+        analysis_id: int,
+        cache_key: str
+    ) -> SkinAnalysisResponse:
+        """Preprocess every view, make one LLM call and cache the consolidated result"""
+        try:
+            repaired = await self._repair_from_storage(cache_key, analysis_id)
+            if repaired is not None:
+                return repaired
+            
+            processed = await asyncio.gather(*(
+                self.preprocess_image_bytes(contents, max_edge=settings.MULTI_IMAGE_MAX_EDGE)
+                for contents in images
+            ))
+            
+            # Quality is judged per photo; a rejection names the photo at fault
+            hints = []
+            for index, (_, _, quality_report) in enumerate(processed, start=1):
+                try:
+                    hint = self.check_image_quality(quality_report, analysis_id)
+                except HTTPException as e:
+                    raise HTTPException(status_code=e.status_code, detail=f"Photo {index}: {e.detail}")
+                if hint:
+                    hints.append(f"Photo {index}: {hint}")
+            
+            if tile:
+                with timed_stage("tile"):
+                    grid = await asyncio.to_thread(tile_images, [image_bytes for image_bytes, _, _ in processed])
+                image_urls = [self.encode_image_data_url(grid.data, grid.mime_type)]
+            else:
+                image_urls = [
+                    self.encode_image_data_url(image_bytes, mime_type)
+                    for image_bytes, mime_type, _ in processed
+                ]
+            
+            llm_response = await self.llm_service.analyze_skin_images(
+                image_urls,
+                analysis_id,
+                survey_data,
+                "\n".join(hints) or None,
+                self._describe_views(len(images), views, tile)
+            )
+            
+            analysis_response = self._parse_and_store(cache_key, llm_response)
+            
+            await self.cache.set(cache_key, analysis_response)
+            
+            logger.info(f"✅ Multi-angle skin analysis {analysis_id} completed successfully - "
+                       f"Images: {len(images)}{' (tiled)' if tile else ''}, "
+                       f"Primary condition: {analysis_response.primaryCondition}")
+            
+            return analysis_response
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Multi-angle skin analysis {analysis_id} failed: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Analysis failed: {str(e)}"
+            )
+    
+    @staticmethod
+    def _describe_views(count: int, views: Optional[List[str]], tile: bool) -> Optional[str]:
+        """Tell the model how the photos relate, so it returns one consolidated assessment"""
+        if count < 2:
+            return None
+        
+        layout = (f"The image is a grid of {count} photos of the same person's face, "
+                  f"ordered left to right, top to bottom" if tile
+                  else f"The {count} images are photos of the same person's face")
+        labels = f" ({', '.join(views)})" if views else ""
+        return (f"{layout}{labels}, taken from different angles. Assess them together and return "
+                f"ONE consolidated analysis that accounts for every view.")
+    
+    async def stream_image_bytes(
+        self,
+        contents: bytes,
+        survey_data: Optional[Dict[str, Any]] = None,
+        analysis_id: Optional[int] = None,
+        two_phase: bool = False
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream an analysis, yielding fields as soon as the model produces them
+        
+        In two-phase mode the classification fields come from a short, capped
+        call and are yielded before the recommendations are generated, so the
+        user sees the result of the analysis well before the full response.
+        
+        Args:
+            contents: Raw image bytes
+            survey_data: Optional user survey data for personalization
+            analysis_id: Optional analysis identifier for logging
+            two_phase: Classify first, then generate recommendations
+            
+        Yields:
+            (event name, value) tuples for completed fields and ingredient
+            recommendations, ending with ("result", SkinAnalysisResponse)
+            
+        Raises:
+            HTTPException: If analysis fails
+        """
+        if analysis_id is None:
+            analysis_id = random.randint(1000, 9999)
+        begin_analysis_usage()
+        
+        cache_key = make_analysis_key(contents, survey_data)
+        with timed_stage("cache"):
+            cached_response = await self.cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"⚡ Streamed skin analysis {analysis_id} served from cache")
+            yield "result", cached_response
+            return
+        
+        if not self.llm_service.is_available:
+            raise HTTPException(
+                status_code=503, 
+                detail="Skin analysis service is currently unavailable. Please try again later."
+            )
+        
+        try:
+            repaired = await self._repair_from_storage(cache_key, analysis_id)
+            if repaired is not None:
+                yield "result", repaired
+                return
+            
+            image_bytes, mime_type, quality_report = await self.preprocess_image_bytes(contents)
+            quality_hint = self.check_image_quality(quality_report, analysis_id)
+            image_url = self.encode_image_data_url(image_bytes, mime_type)
+            
+            if two_phase:
+                events = self._stream_two_phase(image_url, survey_data, analysis_id, quality_hint, cache_key)
+            else:
+                events = self._stream_single_call(image_url, survey_data, analysis_id, quality_hint, cache_key)
+            
+            analysis_response = None
+            async for event, value in events:
+                if event == "result":
+                    analysis_response = value
+                else:
+                    yield event, value
+            
+            await self.cache.set(cache_key, analysis_response)
+            
+            logger.info(f"✅ Streamed skin analysis {analysis_id} completed successfully - "
+                       f"Mode: {'two-phase' if two_phase else 'single call'}, "
+                       f"Primary condition: {analysis_response.primaryCondition}, "
+                       f"Ingredients: {len(analysis_response.ingredientRecommendations)}")
+            
+            yield "result", analysis_response
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Streamed skin analysis {analysis_id} failed: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Analysis failed: {str(e)}"
+            )
+    
+    async def _stream_single_call(
+        self,
+        image_url: str,
+        survey_data: Optional[Dict[str, Any]],
+        analysis_id: int,
+        quality_hint: Optional[str],
+        cache_key: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream one combined classification and recommendation call"""
+        parser = IncrementalAnalysisParser()
+        async for chunk in self.llm_service.stream_skin_analysis(
+            image_url,
+            analysis_id,
+            survey_data,
+            quality_hint
+        ):
+            for event in parser.feed(chunk):
+                yield event
+        
+        # Validate the complete response exactly as the blocking path does
+        analysis_response = self._parse_and_store(cache_key, parser.buffer)
+        
+        yield "result", analysis_response
+    
+    async def _stream_two_phase(
+        self,
+        image_url: str,
+        survey_data: Optional[Dict[str, Any]],
+        analysis_id: int,
+        quality_hint: Optional[str],
+        cache_key: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Classify with a short call, yield the classification, then stream recommendations"""
+        classification_text = await self.llm_service.classify_skin_image(
+            image_url,
+            analysis_id,
+            quality_hint,
+            personalized=survey_data is not None
+        )
+        with timed_stage("parse"):
+            classification = parse_skin_classification_response(classification_text)
+        
+        for field in CLASSIFICATION_FIELDS:
+            yield field, classification[field]
+        
+        parser = IncrementalAnalysisParser()
+        async for chunk in self.llm_service.stream_recommendations(classification, analysis_id, survey_data):
+            for event, value in parser.feed(chunk):
+                # Already sent; a model that repeats them does not override phase one
+                if event not in CLASSIFICATION_FIELDS:
+                    yield event, value
+        
+        raw_output = json.dumps({"classification": classification_text, "recommendations": parser.buffer})
+        analysis_response = self._parse_and_store(
+            cache_key,
+            raw_output,
+            FORMAT_TWO_PHASE,
+            lambda: merge_two_phase_response(classification, parser.buffer)
+        )
+        
+        yield "result", analysis_response
+    
+    async def _repair_from_storage(self, cache_key: str, analysis_id: int) -> Optional[SkinAnalysisResponse]:
+        """Serve a request from its stored raw output, caching the result"""
+        with timed_stage("raw_lookup"):
+            repaired = await self.raw_outputs.repair(cache_key, analysis_id)
+        if repaired is not None:
+            await self.cache.set(cache_key, repaired)
+        return repaired
+    
+    def _parse_and_store(
+        self,
+        cache_key: str,
+        raw_output: str,
+        output_format: str = FORMAT_ANALYSIS,
+        parse: Optional[Callable[[], SkinAnalysisResponse]] = None
+    ) -> SkinAnalysisResponse:
+        """
+        Parse a completion and store the raw output, recording any parse failure
+        
+        Args:
+            cache_key: Analysis cache key the output answers
+            raw_output: Raw model text as stored
+            output_format: Storage format of raw_output
+            parse: Parser to use instead of parse_skin_analysis_response(raw_output)
+            
+        Returns:
+            Parsed SkinAnalysisResponse
+            
+        Raises:
+            HTTPException: If parsing fails (the raw output is still stored)
+        """
+        try:
+            with timed_stage("parse"):
+                analysis_response = parse() if parse else parse_skin_analysis_response(raw_output)
+        except Exception as e:
+            self.raw_outputs.save(cache_key, raw_output, output_format, parse_error=describe_parse_error(e))
+            raise
+        
+        self.raw_outputs.save(cache_key, raw_output, output_format)
+        return analysis_response
+    
     # Legacy method for backward compatibility
     async def analyze_skin_image_basic(self, file: UploadFile) -> SkinAnalysisResponse:
         """
@@ -171,9 +690,28 @@ class AnalysisService:
         return {
             "analysis_service": "available",
             "llm_service": llm_status,
+            "result_cache": self.cache.get_status(),
+            "coalescing": self.single_flight.get_status(),
+            "raw_outputs": self.raw_outputs.get_status(),
+            "image_preprocessing": {
+                "enabled": settings.IMAGE_PREPROCESSING_ENABLED,
+                "max_edge": settings.IMAGE_MAX_EDGE,
+                "output_format": settings.IMAGE_OUTPUT_FORMAT,
+                "quality": settings.IMAGE_QUALITY,
+                **self.preprocessing_stats
+            },
+            "quality_check": {
+                "mode": settings.IMAGE_QUALITY_CHECK_MODE,
+                "min_edge": settings.IMAGE_QUALITY_MIN_EDGE,
+                "min_sharpness": settings.IMAGE_QUALITY_MIN_SHARPNESS,
+                "brightness_range": [settings.IMAGE_QUALITY_MIN_BRIGHTNESS, settings.IMAGE_QUALITY_MAX_BRIGHTNESS],
+                "max_clipped_fraction": settings.IMAGE_QUALITY_MAX_CLIPPED_FRACTION,
+                "min_skin_fraction": settings.IMAGE_QUALITY_MIN_SKIN_FRACTION,
+                **self.quality_stats
+            },
             "supported_formats": settings.ALLOWED_CONTENT_TYPES,
             "max_file_size_mb": settings.MAX_FILE_SIZE / (1024 * 1024),
-            "features": ["basic_analysis", "enhanced_analysis", "survey_integration"],
+            "features": ["basic_analysis", "enhanced_analysis", "survey_integration", "streaming_analysis", "two_phase_streaming", "multi_angle_analysis"],
             "skin_conditions": [
                 "Normal skin",
                 "Oily skin", 
@@ -0,0 +1,200 @@
+"""
+Content-addressed result cache for skin analyses
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.models.schemas import SkinAnalysisResponse
+from app.services.redis_client import get_redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def survey_fingerprint(survey_data: Optional[Dict[str, Any]]) -> str:
+    """
+    Build a canonical fingerprint of survey data
+
+    Args:
+        survey_data: Optional user survey data used for personalisation
+
+    Returns:
+        Hex digest that is stable across key order and whitespace
+    """
+    if not survey_data:
+        return "none"
+
+    canonical = json.dumps(survey_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def make_analysis_key(image_bytes: bytes, survey_data: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the cache key for an analysis request
+
+    Args:
+        image_bytes: Raw uploaded image bytes
+        survey_data: Optional user survey data used for personalisation
+
+    Returns:
+        Cache key combining model, image hash and survey fingerprint
+    """
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    return f"{settings.OPENAI_MODEL}:{image_hash}:{survey_fingerprint(survey_data)}"
+
+
+def make_multi_analysis_key(
+    images: List[bytes],
+    survey_data: Optional[Dict[str, Any]] = None,
+    variant: str = ""
+) -> str:
+    """
+    Build the cache key for a multi-angle analysis request
+
+    Args:
+        images: Raw uploaded image bytes, in upload order
+        survey_data: Optional user survey data used for personalisation
+        variant: Request options that change the model input (views, tiling)
+
+    Returns:
+        Cache key combining model, ordered image hashes, options and survey fingerprint
+    """
+    combined = hashlib.sha256()
+    for image_bytes in images:
+        combined.update(hashlib.sha256(image_bytes).digest())
+    combined.update(variant.encode("utf-8"))
+    return f"{settings.OPENAI_MODEL}:multi:{combined.hexdigest()}:{survey_fingerprint(survey_data)}"
+
+
+class AnalysisCache:
+    """Two-tier (in-process LRU + optional Redis) cache of analysis responses"""
+
+    def __init__(self):
+        self.enabled = settings.ANALYSIS_CACHE_ENABLED
+        self.ttl_seconds = settings.ANALYSIS_CACHE_TTL_SECONDS
+        self.max_entries = settings.ANALYSIS_CACHE_MAX_ENTRIES
+        self.key_prefix = "analysis:result:"
+
+        # key -> (expires_at, serialised response)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        self.stats = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def redis_client(self):
+        """Redis tier, if configured"""
+        return get_redis_client()
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        """Read from the in-process tier, expiring stale entries"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return payload
+
+    def _set_memory(self, key: str, payload: str) -> None:
+        """Write to the in-process tier, evicting least recently used entries"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, key: str, count_miss: bool = True) -> Optional[SkinAnalysisResponse]:
+        """
+        Look up a cached analysis response
+
+        Args:
+            key: Cache key from make_analysis_key
+            count_miss: Whether a miss should be counted (False for polling)
+
+        Returns:
+            Cached SkinAnalysisResponse, or None on miss
+        """
+        if not self.enabled:
+            return None
+
+        payload = self._get_memory(key)
+        if payload is not None:
+            self.stats["memory_hits"] += 1
+            return SkinAnalysisResponse.model_validate_json(payload)
+
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                payload = await asyncio.to_thread(redis_client.get, self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to read analysis cache from Redis: {e}")
+                payload = None
+
+            if payload:
+                self.stats["redis_hits"] += 1
+                self._set_memory(key, payload)
+                return SkinAnalysisResponse.model_validate_json(payload)
+
+        if count_miss:
+            self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: SkinAnalysisResponse) -> None:
+        """
+        Store an analysis response in both tiers
+
+        Args:
+            key: Cache key from make_analysis_key
+            response: Parsed analysis response to cache
+        """
+        if not self.enabled:
+            return
+
+        payload = response.model_dump_json()
+        self._set_memory(key, payload)
+        self.stats["stores"] += 1
+
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                await asyncio.to_thread(
+                    redis_client.setex, self.key_prefix + key, self.ttl_seconds, payload
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to write analysis cache to Redis: {e}")
+
+    def get_status(self) -> dict:
+        """Get cache configuration and hit/miss counters"""
+        hits = self.stats["memory_hits"] + self.stats["redis_hits"]
+        lookups = hits + self.stats["misses"]
+
+        return {
+            "enabled": self.enabled,
+            "backend": "memory+redis" if self.redis_client else "memory",
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.stats,
+        }
+
+
+# Global cache instance
+analysis_cache = AnalysisCache()
@@ -0,0 +1,162 @@
+"""
+Request coalescing (single-flight) for duplicate in-flight work
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.services.redis_client import get_redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Delete the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution
+
+    Within a process, later callers await the leader's task. When a lookup
+    function is supplied and Redis is configured, a short-lived Redis lock
+    elects one leader across worker processes; followers poll the lookup
+    (typically the shared result cache) until the leader's result appears.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock_prefix = f"{name}:lock:"
+        self.lock_ttl_ms = settings.ANALYSIS_COALESCE_LOCK_TTL_SECONDS * 1000
+        self.wait_timeout = settings.ANALYSIS_COALESCE_WAIT_SECONDS
+        self.poll_interval = 0.25
+
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        self.stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "remote_waits": 0,
+            "remote_hits": 0,
+        }
+
+    @property
+    def redis_client(self):
+        """Redis client for cross-worker locks, if enabled"""
+        if not settings.ANALYSIS_COALESCE_REDIS:
+            return None
+        return get_redis_client()
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        lookup: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Run factory once per key, sharing its result with concurrent callers
+
+        Args:
+            key: Identity of the work (callers with equal keys are coalesced)
+            factory: Coroutine function that performs the work
+            lookup: Optional coroutine function returning a result stored by
+                another process, or None if not yet available
+
+        Returns:
+            Result of the (possibly shared) execution
+        """
+        existing = self._in_flight.get(key)
+        if existing is not None:
+            self.stats["coalesced"] += 1
+            logger.info(f"🔗 Coalesced duplicate {self.name} request onto in-flight call")
+            return await asyncio.shield(existing)
+
+        task = asyncio.ensure_future(self._lead(key, factory, lookup))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+
+        # Shield so a disconnecting leader does not cancel the work for its followers
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        """Forget a finished task and mark its exception as retrieved"""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def _lead(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        lookup: Optional[Callable[[], Awaitable[Any]]]
+    ) -> Any:
+        """Run the work, coordinating with other processes when possible"""
+        redis_client = self.redis_client
+        if lookup is None or redis_client is None:
+            self.stats["leaders"] += 1
+            return await factory()
+
+        lock_key = self.lock_prefix + key
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+
+        while True:
+            try:
+                acquired = await asyncio.to_thread(
+                    redis_client.set, lock_key, token, nx=True, px=self.lock_ttl_ms
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ {self.name} lock unavailable, running without coordination: {e}")
+                self.stats["leaders"] += 1
+                return await factory()
+
+            if acquired:
+                break
+
+            if not waited:
+                waited = True
+                self.stats["remote_waits"] += 1
+
+            if time.monotonic() >= deadline:
+                logger.warning(f"⚠️ Timed out waiting for remote {self.name} leader, running locally")
+                self.stats["leaders"] += 1
+                return await factory()
+
+            await asyncio.sleep(self.poll_interval)
+            result = await lookup()
+            if result is not None:
+                self.stats["remote_hits"] += 1
+                return result
+
+        try:
+            # Another process may have finished between our lookup and acquiring the lock
+            if waited:
+                result = await lookup()
+                if result is not None:
+                    self.stats["remote_hits"] += 1
+                    return result
+
+            self.stats["leaders"] += 1
+            return await factory()
+        finally:
+            try:
+                await asyncio.to_thread(redis_client.eval, _RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to release {self.name} lock: {e}")
+
+    def get_status(self) -> dict:
+        """Get coalescing counters"""
+        return {
+            "backend": "memory+redis" if self.redis_client else "memory",
+            "in_flight": len(self._in_flight),
+            **self.stats,
+        }
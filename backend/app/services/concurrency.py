@@ -0,0 +1,327 @@
+"""
+Adaptive concurrency limiting for upstream LLM calls
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Scheduling classes for queued LLM calls, highest priority first
+PRIORITY_HIGH = "priority"  # Signed-in users with survey context
+PRIORITY_NORMAL = "standard"  # Signed-in without a survey, or anonymous with one
+PRIORITY_LOW = "basic"  # Anonymous analyses without a survey
+PRIORITY_CLASSES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Whether the request being handled comes from a signed-in user
+_authenticated_caller: contextvars.ContextVar[bool] = contextvars.ContextVar("authenticated_caller", default=False)
+
+
+def set_authenticated_caller(authenticated: bool) -> None:
+    """Record for the current request (or job) whether the caller is signed in"""
+    _authenticated_caller.set(authenticated)
+
+
+def request_priority(personalized: bool) -> str:
+    """
+    Scheduling class of an LLM call made for the current request
+
+    Args:
+        personalized: Whether the call carries survey context
+
+    Returns:
+        One of PRIORITY_CLASSES
+    """
+    authenticated = _authenticated_caller.get()
+    if authenticated and personalized:
+        return PRIORITY_HIGH
+    if authenticated or personalized:
+        return PRIORITY_NORMAL
+    return PRIORITY_LOW
+
+
+def parse_priority_weights(spec: str) -> Dict[str, int]:
+    """
+    Parse "priority=6,standard=3,basic=1" into per-class weights
+
+    Unknown classes are ignored and missing ones default to 1.
+    """
+    weights = {name: 1 for name in PRIORITY_CLASSES}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name in weights and value.strip():
+            weights[name] = max(1, int(value))
+    return weights
+
+
+class LimiterPermit:
+    """A held concurrency slot; reports the call outcome on release"""
+
+    def __init__(self, started_at: float, kind: str):
+        self.started_at = started_at
+        self.kind = kind
+        self.overloaded = False
+        self.failed = False
+
+    def mark_overloaded(self) -> None:
+        """Record that the provider rejected the call as rate limited"""
+        self.overloaded = True
+
+    def mark_failed(self) -> None:
+        """Record a non-overload failure (does not affect the limit)"""
+        self.failed = True
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit with a bounded, weighted fair wait queue
+
+    The limit grows by roughly one slot per limit's worth of healthy calls and
+    shrinks multiplicatively when the provider returns 429 or latency rises
+    well above its smoothed baseline. Each kind of call (e.g. full analysis
+    vs. a short classification) keeps its own baseline, so short calls do
+    not make normal long ones look slow. Callers beyond the limit wait in one
+    FIFO queue per priority class; freed slots are shared between the
+    backlogged classes in proportion to their weights (smooth weighted
+    round robin), so signed-in personalized analyses get most of a tight
+    budget without starving anonymous ones. Once the queue is full a caller
+    displaces the newest waiter of a lower class, or is turned away
+    immediately with 503 and a Retry-After estimate instead of piling up
+    behind timeouts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = settings.LLM_CONCURRENCY_INITIAL,
+        min_limit: int = settings.LLM_CONCURRENCY_MIN,
+        max_limit: int = settings.LLM_CONCURRENCY_MAX,
+        max_queue: int = settings.LLM_QUEUE_MAX,
+        queue_timeout: float = settings.LLM_QUEUE_TIMEOUT_SECONDS,
+        latency_tolerance: float = settings.LLM_LATENCY_TOLERANCE,
+        backoff_ratio: float = 0.7,
+        priority_weights: str = settings.LLM_PRIORITY_WEIGHTS
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.weights = parse_priority_weights(priority_weights)
+
+        self.in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in PRIORITY_CLASSES}
+        self._credit: Dict[str, int] = {name: 0 for name in PRIORITY_CLASSES}
+        self._baseline_latency: Dict[str, float] = {}
+        self._last_decrease = 0.0
+
+        self.stats = {
+            "acquired": 0,
+            "queued": 0,
+            "rejected": 0,
+            "preempted": 0,
+            "queue_timeouts": 0,
+            "overloads": 0,
+            "latency_spikes": 0,
+            "limit_decreases": 0,
+            "queue_wait_total_seconds": 0.0,
+            "queue_wait_max_seconds": 0.0,
+            "acquired_by_priority": {name: 0 for name in PRIORITY_CLASSES},
+        }
+
+    @property
+    def _capacity(self) -> int:
+        """Whole number of slots currently allowed"""
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def queue_depth(self) -> int:
+        """Callers waiting in all priority classes"""
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def retry_after_seconds(self) -> int:
+        """Estimate how long a rejected caller should wait before retrying"""
+        latency = max(self._baseline_latency.values(), default=5.0)
+        queued_rounds = (self.queue_depth / self._capacity) + 1
+        return max(1, math.ceil(latency * queued_rounds))
+
+    def _overloaded(self, detail: str) -> HTTPException:
+        """Build the 503 returned when the limiter sheds load"""
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after_seconds())}
+        )
+
+    @asynccontextmanager
+    async def acquire(self, priority: str = PRIORITY_NORMAL, kind: str = "default") -> AsyncIterator[LimiterPermit]:
+        """
+        Hold a concurrency slot for the duration of an upstream call
+
+        Args:
+            priority: Scheduling class used if the call has to queue
+            kind: Kind of call; latency is compared with the baseline of the same kind
+
+        Yields:
+            LimiterPermit used to report rate limiting back to the limiter
+
+        Raises:
+            HTTPException: 503 with Retry-After if the wait queue is full or times out
+        """
+        await self._wait_for_slot(priority)
+
+        permit = LimiterPermit(time.monotonic(), kind)
+        try:
+            yield permit
+        except BaseException:
+            permit.mark_failed()
+            raise
+        finally:
+            self._release(permit)
+
+    async def _wait_for_slot(self, priority: str) -> None:
+        """Take a slot now, or wait in the bounded queue for one"""
+        if self.in_flight < self._capacity and not self.queue_depth:
+            self.in_flight += 1
+            self.stats["acquired"] += 1
+            self.stats["acquired_by_priority"][priority] += 1
+            return
+
+        if self.queue_depth >= self.max_queue and not self._preempt_lower(priority):
+            self.stats["rejected"] += 1
+            logger.warning(f"⚠️ {self.name} queue full ({self.queue_depth} waiting) - shedding {priority} request")
+            raise self._overloaded("Analysis service is at capacity. Please try again shortly.")
+
+        queue = self._waiters[priority]
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.stats["queued"] += 1
+        queued_at = time.monotonic()
+
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["queue_timeouts"] += 1
+            raise self._overloaded("Analysis service is busy. Please try again shortly.")
+        except BaseException:
+            # Cancelled after being granted a slot: pass it on
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.in_flight -= 1
+                self._wake_waiters()
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+
+        waited = time.monotonic() - queued_at
+        self.stats["queue_wait_total_seconds"] += waited
+        self.stats["queue_wait_max_seconds"] = max(self.stats["queue_wait_max_seconds"], waited)
+        self.stats["acquired"] += 1
+        self.stats["acquired_by_priority"][priority] += 1
+
+    def _preempt_lower(self, priority: str) -> bool:
+        """Turn away the newest waiter of the lowest class below priority to make room"""
+        for name in reversed(PRIORITY_CLASSES[PRIORITY_CLASSES.index(priority) + 1:]):
+            queue = self._waiters[name]
+            while queue:
+                waiter = queue.pop()
+                if waiter.done():
+                    continue
+                waiter.set_exception(self._overloaded("Analysis service is at capacity. Please try again shortly."))
+                self.stats["preempted"] += 1
+                logger.warning(f"⚠️ {self.name} queue full - displaced a queued {name} request for a {priority} one")
+                return True
+        return False
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Pick the next queued caller by smooth weighted round robin over the backlogged classes"""
+        backlogged = [name for name in PRIORITY_CLASSES if self._waiters[name]]
+        if not backlogged:
+            return None
+
+        total_weight = 0
+        for name in PRIORITY_CLASSES:
+            if name in backlogged:
+                self._credit[name] += self.weights[name]
+                total_weight += self.weights[name]
+            else:
+                # Idle classes do not bank credit
+                self._credit[name] = 0
+
+        # Ties go to the higher priority class
+        chosen = max(backlogged, key=lambda name: self._credit[name])
+        self._credit[chosen] -= total_weight
+        return self._waiters[chosen].popleft()
+
+    def _wake_waiters(self) -> None:
+        """Hand free slots to queued callers, FIFO within each priority class"""
+        while self.in_flight < self._capacity:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _release(self, permit: LimiterPermit) -> None:
+        """Return a slot and adapt the limit to the call outcome"""
+        self.in_flight -= 1
+        now = time.monotonic()
+        latency = now - permit.started_at
+
+        baseline = self._baseline_latency.get(permit.kind)
+        if permit.overloaded:
+            self.stats["overloads"] += 1
+            self._decrease(now, "provider rate limit", baseline)
+        elif not permit.failed:
+            if baseline is not None and latency > baseline * self.latency_tolerance:
+                self.stats["latency_spikes"] += 1
+                self._decrease(now, f"{permit.kind} latency {latency:.1f}s vs baseline {baseline:.1f}s", baseline)
+            else:
+                # Additive increase: about one slot per full window of healthy calls
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self._baseline_latency[permit.kind] = latency if baseline is None else baseline * 0.9 + latency * 0.1
+
+        self._wake_waiters()
+
+    def _decrease(self, now: float, reason: str, baseline: Optional[float] = None) -> None:
+        """Multiplicative decrease, at most once per baseline latency window"""
+        window = baseline or 1.0
+        if now - self._last_decrease < window:
+            return
+
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+        self.stats["limit_decreases"] += 1
+        logger.warning(f"⚠️ {self.name} concurrency limit reduced to {self._capacity} ({reason})")
+
+    def get_status(self) -> dict:
+        """Get current limit, queue state and counters"""
+        waited = self.stats["queued"] - self.stats["queue_timeouts"] - self.stats["preempted"]
+        return {
+            "limit": self._capacity,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_depth_by_priority": {name: len(queue) for name, queue in self._waiters.items()},
+            "priority_weights": self.weights,
+            "max_queue": self.max_queue,
+            "baseline_latency_seconds": {kind: round(value, 3) for kind, value in self._baseline_latency.items()},
+            "queue_wait_avg_seconds": round(self.stats["queue_wait_total_seconds"] / waited, 3) if waited else 0.0,
+            **self.stats,
+        }
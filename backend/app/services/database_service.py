@@ -2,11 +2,14 @@
 Database service layer for user and survey operations
 """
 import logging
+from datetime import datetime
 from typing import Optional, List, Dict, Any
+from sqlalchemy import String, cast, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
-from ..models import User, UserSurvey, SkinAnalysis
+from ..models import User, UserSurvey, SkinAnalysis, LLMUsage, LLMOutput
 
 logger = logging.getLogger(__name__)
 
@@ -150,6 +153,61 @@ class DatabaseService:
             self.db.rollback()
             return None
     
+    def create_skin_analysis_with_latest_survey(
+        self,
+        user_id: str,
+        analysis_data: Dict[str, Any],
+        image_path: Optional[str] = None
+    ) -> Optional[SkinAnalysis]:
+        """Create new skin analysis linked to the user's latest survey"""
+        latest_survey = self.get_latest_user_survey(user_id)
+        survey_id = str(latest_survey.id) if latest_survey else None
+        
+        return self.create_skin_analysis(
+            user_id=user_id,
+            analysis_data=analysis_data,
+            survey_id=survey_id,
+            image_path=image_path
+        )
+    
+    def create_skin_analyses_batch(self, records: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Insert several analyses in one transaction, each linked to its user's latest survey
+        
+        Args:
+            records: Dicts with user_id, analysis_data and optional image_path
+        
+        Returns:
+            Number of analyses inserted, or None if the transaction failed
+        """
+        try:
+            user_ids = {record["user_id"] for record in records}
+            
+            # One query for the latest survey of every user in the batch
+            latest_surveys = self.db.query(UserSurvey.user_id, UserSurvey.id).filter(
+                UserSurvey.user_id.in_(user_ids)
+            ).distinct(UserSurvey.user_id).order_by(
+                UserSurvey.user_id, UserSurvey.created_at.desc()
+            ).all()
+            survey_ids = {str(user_id): str(survey_id) for user_id, survey_id in latest_surveys}
+            
+            self.db.add_all([
+                SkinAnalysis(
+                    user_id=record["user_id"],
+                    survey_id=survey_ids.get(str(record["user_id"])),
+                    image_path=record.get("image_path"),
+                    analysis_data=record["analysis_data"]
+                )
+                for record in records
+            ])
+            self.db.commit()
+            logger.info(f"Created {len(records)} analyses for {len(user_ids)} users")
+            return len(records)
+        except SQLAlchemyError as e:
+            logger.error(f"Error creating analyses batch: {e}")
+            self.db.rollback()
+            return None
+    
     def get_user_analyses(self, user_id: str) -> List[SkinAnalysis]:
         """Get all analyses for a user"""
         try:
@@ -201,4 +259,182 @@ class DatabaseService:
             return self.db.query(SkinAnalysis).count()
         except SQLAlchemyError as e:
             logger.error(f"Error getting analysis count: {e}")
-            return 0 
\ No newline at end of file
+            return 0
+    
+    # LLM usage accounting
+    def create_llm_usage_batch(self, records: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Insert several LLM usage records in one transaction
+        
+        Args:
+            records: Dicts with the LLMUsage column values
+        
+        Returns:
+            Number of records inserted, or None if the transaction failed
+        """
+        try:
+            self.db.add_all([LLMUsage(**record) for record in records])
+            self.db.commit()
+            return len(records)
+        except SQLAlchemyError as e:
+            logger.error(f"Error creating LLM usage batch: {e}")
+            self.db.rollback()
+            return None
+    
+    def get_llm_usage_totals(self, since: datetime) -> List[Dict[str, Any]]:
+        """
+        Aggregate LLM usage since a point in time, split by personalized and basic calls
+        
+        Args:
+            since: Start of the reporting window
+        
+        Returns:
+            One dict of totals per personalized flag
+        """
+        try:
+            rows = self.db.query(
+                LLMUsage.personalized,
+                func.count(LLMUsage.id),
+                # Rows recorded before analysis keys existed count as one analysis each
+                func.count(func.distinct(func.coalesce(LLMUsage.analysis_key, cast(LLMUsage.id, String)))),
+                func.coalesce(func.sum(LLMUsage.prompt_tokens), 0),
+                func.coalesce(func.sum(LLMUsage.completion_tokens), 0),
+                func.coalesce(func.sum(LLMUsage.latency_ms), 0),
+                func.coalesce(func.sum(LLMUsage.cost_usd), 0),
+                func.avg(LLMUsage.image_bytes),
+                func.count(LLMUsage.id).filter(LLMUsage.finish_reason == "length")
+            ).filter(
+                LLMUsage.created_at >= since
+            ).group_by(LLMUsage.personalized).all()
+            
+            return [
+                {
+                    "personalized": personalized,
+                    "calls": calls,
+                    "analyses": analyses,
+                    "prompt_tokens": int(prompt_tokens),
+                    "completion_tokens": int(completion_tokens),
+                    "latency_ms": int(latency_ms),
+                    "cost_usd": float(cost_usd),
+                    "avg_image_bytes": float(avg_image_bytes) if avg_image_bytes is not None else None,
+                    "truncated": truncated
+                }
+                for personalized, calls, analyses, prompt_tokens, completion_tokens, latency_ms, cost_usd, avg_image_bytes, truncated in rows
+            ]
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting LLM usage totals: {e}")
+            return []
+    
+    # Raw LLM output storage
+    def upsert_llm_output(self, record: Dict[str, Any]) -> bool:
+        """
+        Store a raw LLM output, replacing any earlier output for the same cache key
+        
+        Args:
+            record: Dict with the LLMOutput column values
+        
+        Returns:
+            True if stored, False if the transaction failed
+        """
+        try:
+            statement = insert(LLMOutput).values(**record)
+            statement = statement.on_conflict_do_update(
+                index_elements=[LLMOutput.cache_key],
+                set_={
+                    **{key: value for key, value in record.items() if key != "cache_key"},
+                    "created_at": func.now(),
+                    "parsed_at": func.now()
+                }
+            )
+            self.db.execute(statement)
+            self.db.commit()
+            return True
+        except SQLAlchemyError as e:
+            logger.error(f"Error storing LLM output: {e}")
+            self.db.rollback()
+            return False
+    
+    def get_llm_output(self, cache_key: str, only_failed: bool = False) -> Optional[LLMOutput]:
+        """Get the stored raw LLM output for a cache key (only_failed: only if its last parse failed)"""
+        try:
+            query = self.db.query(LLMOutput).filter(LLMOutput.cache_key == cache_key)
+            if only_failed:
+                query = query.filter(LLMOutput.parse_ok.is_(False))
+            return query.first()
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting LLM output: {e}")
+            return None
+    
+    def get_llm_outputs_page(
+        self,
+        after_key: Optional[str] = None,
+        limit: int = 500,
+        only_failed: bool = False
+    ) -> List[LLMOutput]:
+        """
+        Get stored raw LLM outputs in cache key order (keyset pagination)
+        
+        Args:
+            after_key: Last cache key of the previous page
+            limit: Maximum rows to return
+            only_failed: Only outputs whose last parse failed
+        
+        Returns:
+            Up to limit outputs after after_key
+        """
+        try:
+            query = self.db.query(LLMOutput)
+            if after_key is not None:
+                query = query.filter(LLMOutput.cache_key > after_key)
+            if only_failed:
+                query = query.filter(LLMOutput.parse_ok.is_(False))
+            return query.order_by(LLMOutput.cache_key).limit(limit).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting LLM outputs: {e}")
+            return []
+    
+    def delete_llm_outputs_before(self, cutoff: datetime) -> Optional[int]:
+        """
+        Delete raw LLM outputs stored before a cutoff
+        
+        Args:
+            cutoff: Outputs created before this time are deleted
+        
+        Returns:
+            Number of outputs deleted, or None if the transaction failed
+        """
+        try:
+            deleted = self.db.query(LLMOutput).filter(LLMOutput.created_at < cutoff).delete(synchronize_session=False)
+            self.db.commit()
+            return deleted
+        except SQLAlchemyError as e:
+            logger.error(f"Error deleting LLM outputs: {e}")
+            self.db.rollback()
+            return None
+    
+    def update_llm_output_parse_results(self, results: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Record re-parse outcomes in one transaction
+        
+        Args:
+            results: Dicts with cache_key, parse_ok and parse_error
+        
+        Returns:
+            Number of outputs updated, or None if the transaction failed
+        """
+        try:
+            for result in results:
+                self.db.query(LLMOutput).filter(LLMOutput.cache_key == result["cache_key"]).update(
+                    {
+                        LLMOutput.parse_ok: result["parse_ok"],
+                        LLMOutput.parse_error: result["parse_error"],
+                        LLMOutput.parsed_at: func.now()
+                    },
+                    synchronize_session=False
+                )
+            self.db.commit()
+            return len(results)
+        except SQLAlchemyError as e:
+            logger.error(f"Error updating LLM output parse results: {e}")
+            self.db.rollback()
+            return None
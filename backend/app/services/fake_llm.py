@@ -0,0 +1,178 @@
+"""
+Offline stand-in for ChatOpenAI, used for load testing without OpenAI calls
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import Any, AsyncIterator, List, Optional
+
+import httpx
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from openai import APIStatusError, RateLimitError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Used when no response corpus is available
+_DEFAULT_RESPONSE = json.dumps({
+    "confidence": 82,
+    "primaryCondition": "Mild acne",
+    "secondaryConditions": ["Enlarged pores"],
+    "skinType": "Combination",
+    "ingredientRecommendations": [
+        {
+            "ingredient": "Niacinamide",
+            "purpose": "Regulates oil production and calms inflammation",
+            "concentration": "4-5%",
+            "application": "Apply to clean skin once daily",
+            "benefits": "Smaller-looking pores and fewer breakouts"
+        }
+    ],
+    "description": "Scattered papules on the cheeks with an oilier T-zone."
+})
+
+# Characters per streamed chunk, roughly one token each
+_STREAM_CHUNK_CHARS = 4
+
+
+def _load_responses(path: str) -> List[str]:
+    """Load canned responses from a JSONL file with a "response" field per line"""
+    if not path or not os.path.exists(path):
+        return [_DEFAULT_RESPONSE]
+
+    with open(path, encoding="utf-8") as f:
+        responses = [json.loads(line)["response"] for line in f if line.strip()]
+
+    return responses or [_DEFAULT_RESPONSE]
+
+
+class FakeChatModel:
+    """
+    Minimal async ChatOpenAI replacement with configurable behaviour
+
+    Latency is drawn from a log-normal distribution (median and sigma from
+    settings); a configurable fraction of calls fail with 429 or 500 errors
+    raised as the same openai exceptions the real client raises, so the
+    limiter and error handling paths are exercised. Responses are drawn from
+    a corpus of recorded model outputs.
+    """
+
+    def __init__(self):
+        self.latency_median = settings.FAKE_LLM_LATENCY_MEDIAN_MS / 1000
+        self.latency_sigma = settings.FAKE_LLM_LATENCY_SIGMA
+        self.error_rate = settings.FAKE_LLM_ERROR_RATE
+        self.rate_limit_rate = settings.FAKE_LLM_RATE_LIMIT_RATE
+        self.responses = _load_responses(settings.FAKE_LLM_RESPONSES_PATH)
+        self._random = random.Random(settings.FAKE_LLM_SEED)
+
+        self.stats = {
+            "calls": 0,
+            "rate_limited": 0,
+            "errors": 0,
+        }
+
+    def _latency(self, max_tokens: Optional[int] = None) -> float:
+        """
+        Sample one call's total latency in seconds
+
+        A third of the latency is time to first token; the generation part
+        shrinks with a per-call max_tokens below the default cap, roughly as
+        a shorter completion would.
+        """
+        latency = self.latency_median * self._random.lognormvariate(0, self.latency_sigma)
+        if max_tokens and max_tokens < settings.OPENAI_MAX_COMPLETION_TOKENS:
+            latency = latency / 3 + latency * 2 / 3 * max_tokens / settings.OPENAI_MAX_COMPLETION_TOKENS
+        return latency
+
+    def _maybe_fail(self) -> None:
+        """Raise a provider error for the configured fraction of calls"""
+        request = httpx.Request("POST", f"{settings.OPENAI_BASE_URL}/chat/completions")
+        roll = self._random.random()
+
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            raise RateLimitError(
+                "Rate limit reached (fake)",
+                response=httpx.Response(429, request=request),
+                body=None
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            raise APIStatusError(
+                "Internal server error (fake)",
+                response=httpx.Response(500, request=request),
+                body=None
+            )
+
+    def _response_metadata(self, text: str) -> dict:
+        """Metadata shaped like a chat completion's"""
+        return {
+            "model_name": settings.OPENAI_MODEL,
+            "finish_reason": "stop",
+            "token_usage": {
+                "prompt_tokens": 1000,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": 1000 + len(text) // 4,
+            },
+        }
+
+    @staticmethod
+    def _usage_metadata(text: str) -> dict:
+        """Token counts shaped like LangChain's usage_metadata"""
+        return {
+            "input_tokens": 1000,
+            "output_tokens": len(text) // 4,
+            "total_tokens": 1000 + len(text) // 4,
+        }
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        """Return one canned response after a sampled delay"""
+        self.stats["calls"] += 1
+        latency = self._latency(kwargs.get("max_tokens"))
+        text = self._random.choice(self.responses)
+
+        await asyncio.sleep(latency)
+        self._maybe_fail()
+
+        return AIMessage(
+            content=text,
+            response_metadata=self._response_metadata(text),
+            usage_metadata=self._usage_metadata(text)
+        )
+
+    async def astream(self, messages: List[BaseMessage], **kwargs: Any) -> AsyncIterator[AIMessageChunk]:
+        """Stream a canned response, spreading the sampled delay over its chunks"""
+        self.stats["calls"] += 1
+        latency = self._latency(kwargs.get("max_tokens"))
+        text = self._random.choice(self.responses)
+
+        # A third of the time goes to the first token, the rest to generation
+        await asyncio.sleep(latency / 3)
+        self._maybe_fail()
+
+        chunks = [text[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(text), _STREAM_CHUNK_CHARS)]
+        per_chunk = (latency * 2 / 3) / max(len(chunks), 1)
+
+        for chunk in chunks:
+            await asyncio.sleep(per_chunk)
+            yield AIMessageChunk(content=chunk)
+
+        yield AIMessageChunk(
+            content="",
+            response_metadata=self._response_metadata(text),
+            usage_metadata=self._usage_metadata(text)
+        )
+
+    def get_status(self) -> dict:
+        """Get the fake's configuration and counters"""
+        return {
+            "latency_median_ms": settings.FAKE_LLM_LATENCY_MEDIAN_MS,
+            "latency_sigma": self.latency_sigma,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "responses": len(self.responses),
+            **self.stats,
+        }
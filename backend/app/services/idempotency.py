@@ -0,0 +1,162 @@
+"""
+Idempotency keys for analysis requests
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+
+from app.services.coalescing import SingleFlight
+from app.services.ttl_store import TTLStore
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Read uploads in chunks when fingerprinting so large files are never held twice
+_FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+
+async def fingerprint_request(files: List[UploadFile], fields: Dict[str, Any]) -> str:
+    """
+    Hash the uploaded files and form fields of a request
+
+    The files are rewound afterwards so the handler can read them as usual.
+
+    Args:
+        files: Uploaded files, in request order
+        fields: Form fields that change the result
+
+    Returns:
+        Hex digest identifying the request body
+    """
+    digest = hashlib.sha256()
+    for file in files:
+        while True:
+            chunk = await file.read(_FINGERPRINT_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+        await file.seek(0)
+        digest.update(b"\x00")
+
+    digest.update(json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IdempotencyService:
+    """
+    Runs a request at most once per Idempotency-Key
+
+    The first request with a key runs; concurrent duplicates wait for it
+    (across workers too, through the coalescing lock when Redis is
+    configured) and duplicates within the retention window get the stored
+    response back. Only successful responses are stored, so a retry after
+    a failure runs again. Reusing a key for a different request body is
+    rejected with 422.
+    """
+
+    def __init__(self):
+        self.enabled = settings.IDEMPOTENCY_ENABLED
+        self.store = TTLStore(
+            "analysis:idempotency:",
+            settings.IDEMPOTENCY_TTL_SECONDS,
+            settings.IDEMPOTENCY_MAX_ENTRIES
+        )
+        self.single_flight = SingleFlight("idempotency")
+
+        self.stats = {
+            "executed": 0,
+            "replayed": 0,
+            "conflicts": 0,
+        }
+
+    def validate_key(self, key: str) -> None:
+        """
+        Validate a client-supplied Idempotency-Key
+
+        Raises:
+            HTTPException: If the key is empty or too long
+        """
+        if not key.strip() or len(key) > settings.IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Idempotency-Key must be 1 to {settings.IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+            )
+
+    async def run(
+        self,
+        key: str,
+        scope: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+        status_code: int = 200
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run handler once for this key, or return the stored response
+
+        Args:
+            key: Client-supplied Idempotency-Key
+            scope: Route and caller the key belongs to
+            fingerprint: Request fingerprint from fingerprint_request
+            handler: Coroutine function producing the response body
+            status_code: Status code of a successful response
+
+        Returns:
+            Stored record (status_code and body) and whether it was replayed
+
+        Raises:
+            HTTPException: If the key was used for a different request, or the handler fails
+        """
+        self.validate_key(key)
+        store_key = hashlib.sha256(f"{scope}:{key}".encode("utf-8")).hexdigest()
+
+        async def lookup() -> Optional[Dict[str, Any]]:
+            payload = await self.store.get(store_key)
+            return json.loads(payload) if payload else None
+
+        executed = False
+
+        async def execute() -> Dict[str, Any]:
+            nonlocal executed
+            executed = True
+            body = jsonable_encoder(await handler())
+            record = {"fingerprint": fingerprint, "status_code": status_code, "body": body}
+            await self.store.set(store_key, json.dumps(record))
+            return record
+
+        record = await lookup()
+        if record is None:
+            record = await self.single_flight.run(store_key, execute, lookup)
+
+        if record["fingerprint"] != fingerprint:
+            self.stats["conflicts"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request"
+            )
+
+        if executed:
+            self.stats["executed"] += 1
+        else:
+            self.stats["replayed"] += 1
+            logger.info(f"♻️ Replayed stored response for idempotent {scope.split(':')[0]} request")
+
+        return record, not executed
+
+    def get_status(self) -> dict:
+        """Get idempotency configuration and counters"""
+        return {
+            "enabled": self.enabled,
+            "backend": "memory+redis" if self.store.redis_client else "memory",
+            "ttl_seconds": self.store.ttl_seconds,
+            "entries": len(self.store),
+            "in_flight": self.single_flight.get_status()["in_flight"],
+            **self.stats,
+        }
+
+
+# Global idempotency service instance
+idempotency_service = IdempotencyService()
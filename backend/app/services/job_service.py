@@ -0,0 +1,325 @@
+"""
+Asynchronous analysis job queue with a bounded worker pool
+"""
+import asyncio
+import base64
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+import aiohttp
+from fastapi import HTTPException
+
+from app.services.analysis_service import analysis_service
+from app.services.persistence_service import analysis_writer
+from app.services.concurrency import set_authenticated_caller
+from app.services.redis_client import get_async_redis_client, get_redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class AnalysisJobQueue:
+    """
+    Runs skin analyses outside the request/response cycle
+
+    Jobs are queued in-process by default. With ANALYSIS_JOB_BACKEND=redis and
+    a reachable REDIS_URL, the queue and job records live in Redis so every
+    worker process pulls from the same queue and can answer status polls.
+    """
+
+    def __init__(self):
+        self.worker_count = settings.ANALYSIS_JOB_WORKERS
+        self.max_queue_size = settings.ANALYSIS_JOB_QUEUE_SIZE
+        self.result_ttl = settings.ANALYSIS_JOB_RESULT_TTL_SECONDS
+        self.callback_timeout = settings.ANALYSIS_JOB_CALLBACK_TIMEOUT_SECONDS
+        self.queue_key = "analysis:jobs:queue"
+        self.job_key_prefix = "analysis:job:"
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+
+        self.stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "callbacks_sent": 0,
+            "callbacks_failed": 0,
+        }
+
+    @property
+    def redis_client(self):
+        """Redis backend, if selected and reachable"""
+        if settings.ANALYSIS_JOB_BACKEND != "redis":
+            return None
+        return get_redis_client()
+
+    @property
+    def async_redis_client(self):
+        """asyncio client for the Redis backend, used for BRPOP and LLEN"""
+        if settings.ANALYSIS_JOB_BACKEND != "redis":
+            return None
+        return get_async_redis_client()
+
+    @property
+    def is_running(self) -> bool:
+        """Check if the worker pool has been started"""
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Start the worker pool"""
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"analysis-job-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+
+        backend = "redis" if self.redis_client else "memory"
+        logger.info(f"✅ Analysis job queue started - Workers: {self.worker_count}, Backend: {backend}")
+
+    async def stop(self) -> None:
+        """Stop the worker pool"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # Job records
+    async def _save_job(self, job: Dict[str, Any]) -> None:
+        """Persist a job record"""
+        redis_client = self.redis_client
+        if redis_client:
+            await asyncio.to_thread(
+                redis_client.setex,
+                self.job_key_prefix + job["id"],
+                self.result_ttl,
+                json.dumps(job, default=str)
+            )
+            return
+
+        self._jobs[job["id"]] = job
+        self._jobs.move_to_end(job["id"])
+
+        # Keep finished jobs for polling, bounded by queue capacity
+        max_records = self.max_queue_size * 4
+        while len(self._jobs) > max_records:
+            oldest_id = next(iter(self._jobs))
+            if self._jobs[oldest_id]["status"] in (JOB_QUEUED, JOB_RUNNING):
+                break
+            self._jobs.popitem(last=False)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job record by ID
+
+        Args:
+            job_id: Job identifier returned by enqueue
+
+        Returns:
+            Job record, or None if unknown or expired
+        """
+        redis_client = self.redis_client
+        if redis_client:
+            payload = await asyncio.to_thread(redis_client.get, self.job_key_prefix + job_id)
+            return json.loads(payload) if payload else None
+
+        return self._jobs.get(job_id)
+
+    async def enqueue(
+        self,
+        contents: bytes,
+        survey_data: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+        callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue an analysis for background processing
+
+        Args:
+            contents: Raw image bytes
+            survey_data: Optional user survey data for personalization
+            user_id: Optional user to save the analysis against
+            callback_url: Optional URL that receives the finished job record
+
+        Returns:
+            The queued job record
+
+        Raises:
+            HTTPException: If the queue is full or not running
+        """
+        if not self.is_running:
+            raise HTTPException(
+                status_code=503,
+                detail="Analysis job queue is not running"
+            )
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": JOB_QUEUED,
+            "user_id": user_id,
+            "callback_url": callback_url,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "completed_at": None,
+            "result": None,
+            "error": None,
+        }
+        payload = {
+            "job_id": job["id"],
+            "image": contents,
+            "survey_data": survey_data,
+        }
+
+        redis_client = self.redis_client
+        if redis_client:
+            queue_depth = await self.async_redis_client.llen(self.queue_key)
+            if queue_depth >= self.max_queue_size:
+                self._reject()
+            await self._save_job(job)
+            payload["image"] = base64.b64encode(contents).decode("ascii")
+            await asyncio.to_thread(redis_client.lpush, self.queue_key, json.dumps(payload))
+        else:
+            if self._queue.full():
+                self._reject()
+            await self._save_job(job)
+            self._queue.put_nowait(payload)
+
+        self.stats["enqueued"] += 1
+        logger.info(f"📥 Analysis job {job['id']} queued")
+
+        return job
+
+    def _reject(self) -> None:
+        """Reject a job because the queue is at capacity"""
+        self.stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full. Please try again shortly.",
+            headers={"Retry-After": "5"}
+        )
+
+    async def _next_payload(self) -> Optional[Dict[str, Any]]:
+        """Wait for the next queued job payload"""
+        redis_client = self.async_redis_client
+        if redis_client:
+            item = await redis_client.brpop(self.queue_key, timeout=1)
+            if not item:
+                return None
+            payload = json.loads(item[1])
+            payload["image"] = base64.b64decode(payload["image"])
+            return payload
+
+        return await self._queue.get()
+
+    async def _worker(self, worker_index: int) -> None:
+        """Pull jobs off the queue until cancelled"""
+        while True:
+            try:
+                payload = await self._next_payload()
+                if payload is None:
+                    continue
+                await self._run_job(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Analysis job worker {worker_index} error: {e}")
+                await asyncio.sleep(1)
+
+    async def _run_job(self, payload: Dict[str, Any]) -> None:
+        """Run one analysis job and record its outcome"""
+        job = await self.get_job(payload["job_id"])
+        if job is None:
+            logger.warning(f"⚠️ Analysis job {payload['job_id']} expired before it ran")
+            return
+
+        # Queued LLM calls are scheduled by the submitter's sign-in state
+        set_authenticated_caller(bool(job["user_id"]))
+
+        job["status"] = JOB_RUNNING
+        job["started_at"] = datetime.now().isoformat()
+        await self._save_job(job)
+
+        try:
+            result = await analysis_service.analyze_image_bytes(payload["image"], payload["survey_data"])
+
+            if job["user_id"]:
+                await analysis_writer.submit(job["user_id"], result.dict())
+
+            job["status"] = JOB_COMPLETED
+            job["result"] = result.dict()
+            self.stats["completed"] += 1
+            logger.info(f"✅ Analysis job {job['id']} completed")
+
+        except HTTPException as e:
+            job["status"] = JOB_FAILED
+            job["error"] = {"status_code": e.status_code, "detail": e.detail}
+            self.stats["failed"] += 1
+            logger.error(f"❌ Analysis job {job['id']} failed: {e.detail}")
+        except Exception as e:
+            job["status"] = JOB_FAILED
+            job["error"] = {"status_code": 500, "detail": f"Analysis failed: {str(e)}"}
+            self.stats["failed"] += 1
+            logger.error(f"❌ Analysis job {job['id']} failed: {str(e)}")
+
+        job["completed_at"] = datetime.now().isoformat()
+        await self._save_job(job)
+
+        if job["callback_url"]:
+            await self._send_callback(job)
+
+    async def _send_callback(self, job: Dict[str, Any]) -> None:
+        """POST the finished job record to the client's callback URL"""
+        body = {key: value for key, value in job.items() if key not in ("user_id", "callback_url")}
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    job["callback_url"],
+                    json=body,
+                    timeout=aiohttp.ClientTimeout(total=self.callback_timeout)
+                ) as response:
+                    if response.status >= 400:
+                        raise RuntimeError(f"callback returned status {response.status}")
+            self.stats["callbacks_sent"] += 1
+        except Exception as e:
+            self.stats["callbacks_failed"] += 1
+            logger.warning(f"⚠️ Callback for analysis job {job['id']} failed: {e}")
+
+    async def get_status(self) -> dict:
+        """Get queue configuration, depth and counters"""
+        redis_client = self.async_redis_client
+        queue_depth = 0
+        try:
+            if redis_client:
+                queue_depth = await redis_client.llen(self.queue_key)
+            elif self._queue is not None:
+                queue_depth = self._queue.qsize()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to read analysis job queue depth: {e}")
+
+        return {
+            "running": self.is_running,
+            "backend": "redis" if redis_client else "memory",
+            "workers": self.worker_count,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": queue_depth,
+            **self.stats,
+        }
+
+
+# Global job queue instance
+analysis_job_queue = AnalysisJobQueue()
@@ -1,36 +1,176 @@
 """
 LLM service for handling OpenAI model interactions - Skin Condition Analysis
 """
+import asyncio
 import logging
 import base64
-from typing import Optional, Dict, Any
+import importlib.util
+import time
+from typing import Optional, Dict, Any, List, AsyncIterator
+import httpx
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from fastapi import HTTPException
+from openai import RateLimitError
 
+from app.services.concurrency import AdaptiveConcurrencyLimiter, request_priority
+from app.services.prompt_budget import PromptBudget
+from app.services.fake_llm import FakeChatModel
+from app.services.metrics import record_stage
+from app.services.usage_service import usage_recorder, extract_token_usage
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Static instructions, kept as the first and byte-identical part of every request
+SKIN_ANALYSIS_SYSTEM_PROMPT = """You are an expert dermatologist and skincare specialist. Analyze the provided facial image and provide detailed skin condition assessment with personalized ingredient recommendations.
+
+Your analysis should be professional, accurate, and evidence-based. Consider both what you see in the image and the user's personal information provided.
+
+IMPORTANT GUIDELINES:
+1. Always prioritize safety based on user's medical history
+2. Consider user's age, skin type, and experience level
+3. Provide specific, actionable recommendations
+4. Include concentration ranges and application instructions
+5. Warn about potential interactions or contraindications
+
+SKIN CONDITIONS TO ASSESS:
+- Normal skin (balanced, healthy appearance)
+- Oily skin (visible shine, enlarged pores, excess sebum)
+- Dry skin (flaking, roughness, tightness, dullness)
+- Combination skin (oily T-zone, dry cheeks)
+- Sensitive skin (redness, irritation, reactivity)
+- Acne-prone skin (active breakouts, blackheads, whiteheads)
+- Hyperpigmentation (dark spots, uneven skin tone, melasma)
+- Rosacea (facial redness, visible blood vessels, persistent flushing)
+- Eczema/Atopic dermatitis (dry patches, inflammation, rough texture)
+
+CONFIDENCE RATING: Rate your confidence based on photo quality (always an INT):
+- Excellent photo (crystal clear, perfect lighting, ideal angle): 90-98
+- Good photo (clear, decent lighting, good angle): 80-89  
+- Average photo (somewhat blurry, okay lighting, slight angle): 65-79
+- Poor photo (very blurry, bad lighting, difficult to see): 0-64
+
+INGREDIENT RECOMMENDATIONS should focus on evidence-based skincare ingredients like:
+- Retinol/Retinoids (for acne, aging, hyperpigmentation)
+- Niacinamide (for oily skin, large pores, redness)
+- Hyaluronic Acid (for hydration, dry skin)
+- Salicylic Acid (for acne, oily skin, blackheads)
+- Vitamin C (for hyperpigmentation, antioxidant protection)
+- Ceramides (for dry, sensitive skin, barrier repair)
+- Azelaic Acid (for rosacea, acne, hyperpigmentation)
+- Glycolic Acid (for texture, hyperpigmentation)
+- Peptides (for aging, collagen support)
+- Zinc Oxide/Titanium Dioxide (for sensitive skin, sun protection)
+
+Response Format: Return valid JSON with the following structure:
+{
+    "confidence": <1-100>,
+    "primaryCondition": "<main condition>",
+    "secondaryConditions": ["<condition1>", "<condition2>"],
+    "skinType": "<skin type>",
+    "ingredientRecommendations": [
+        {
+            "ingredient": "<ingredient name>",
+            "purpose": "<what it does>",
+            "concentration": "<recommended %>",
+            "application": "<how to use>",
+            "benefits": "<specific benefits>"
+        }
+    ],
+    "description": "<detailed analysis>"
+}"""
+
+# Two-phase mode, phase one: a short vision call that only classifies
+SKIN_CLASSIFICATION_SYSTEM_PROMPT = """You are an expert dermatologist. Classify the skin in the provided facial image.
+
+Choose conditions from: Normal skin, Oily skin, Dry skin, Combination skin, Sensitive skin, Acne-prone skin, Hyperpigmentation, Rosacea, Eczema/Atopic dermatitis.
+
+CONFIDENCE RATING: Rate your confidence based on photo quality (always an INT):
+- Excellent photo (crystal clear, perfect lighting, ideal angle): 90-98
+- Good photo (clear, decent lighting, good angle): 80-89
+- Average photo (somewhat blurry, okay lighting, slight angle): 65-79
+- Poor photo (very blurry, bad lighting, difficult to see): 0-64
+
+Return only valid JSON with this structure and nothing else:
+{
+    "confidence": <1-100>,
+    "primaryCondition": "<main condition>",
+    "secondaryConditions": ["<condition1>", "<condition2>"],
+    "skinType": "<skin type>"
+}"""
+
+# Two-phase mode, phase two: a text-only call that writes recommendations for a classification
+SKIN_RECOMMENDATION_SYSTEM_PROMPT = """You are an expert dermatologist and skincare specialist. A facial skin assessment has already been made; recommend skincare ingredients for it and describe the assessment.
+
+IMPORTANT GUIDELINES:
+1. Always prioritize safety based on user's medical history
+2. Consider user's age, skin type, and experience level
+3. Provide specific, actionable recommendations
+4. Include concentration ranges and application instructions
+5. Warn about potential interactions or contraindications
+
+INGREDIENT RECOMMENDATIONS should focus on evidence-based skincare ingredients like:
+- Retinol/Retinoids (for acne, aging, hyperpigmentation)
+- Niacinamide (for oily skin, large pores, redness)
+- Hyaluronic Acid (for hydration, dry skin)
+- Salicylic Acid (for acne, oily skin, blackheads)
+- Vitamin C (for hyperpigmentation, antioxidant protection)
+- Ceramides (for dry, sensitive skin, barrier repair)
+- Azelaic Acid (for rosacea, acne, hyperpigmentation)
+- Glycolic Acid (for texture, hyperpigmentation)
+- Peptides (for aging, collagen support)
+- Zinc Oxide/Titanium Dioxide (for sensitive skin, sun protection)
+
+Response Format: Return valid JSON with the following structure:
+{
+    "ingredientRecommendations": [
+        {
+            "ingredient": "<ingredient name>",
+            "purpose": "<what it does>",
+            "concentration": "<recommended %>",
+            "application": "<how to use>",
+            "benefits": "<specific benefits>"
+        }
+    ],
+    "description": "<detailed analysis>"
+}"""
+
 class LLMService:
     """Service for managing OpenAI LLM interactions for skin analysis"""
     
     def __init__(self):
         self._client: Optional[ChatOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self.http2_enabled = False
+        self.limiter = AdaptiveConcurrencyLimiter("LLM")
+        self.budget = PromptBudget()
         self._initialize_client()
     
     def _initialize_client(self) -> None:
         """Initialize the OpenAI client with error handling"""
         try:
+            if self.uses_fake_backend:
+                self._client = FakeChatModel()
+                logger.warning("⚠️ LLM service using the offline fake backend - no OpenAI calls will be made")
+                return
+            
             if not settings.openai_key_available:
                 logger.warning("⚠️ OpenAI API key not available - LLM service disabled")
                 self._client = None
                 return
             
+            self._http_client = self._create_http_client()
+            
             self._client = ChatOpenAI(
                 model=settings.OPENAI_MODEL,
                 temperature=settings.OPENAI_TEMPERATURE,
-                api_key=settings.OPENAI_API_KEY  # type: ignore
+                max_tokens=settings.OPENAI_MAX_COMPLETION_TOKENS,
+                api_key=settings.OPENAI_API_KEY,  # type: ignore
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=self._http_client.timeout,
+                http_async_client=self._http_client,
+                stream_usage=True  # Token counts on the final streamed chunk
             )
             
             logger.info(f"✅ LLM service initialized with model: {settings.OPENAI_MODEL}")
@@ -39,10 +179,90 @@ class LLMService:
             logger.error(f"❌ Failed to initialize LLM client: {e}")
             self._client = None
     
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """Create the shared keep-alive connection pool used for every OpenAI call"""
+        # HTTP/2 needs the optional h2 package (httpx[http2])
+        self.http2_enabled = settings.OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None
+        
+        return httpx.AsyncClient(
+            http2=self.http2_enabled,
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.OPENAI_POOL_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(
+                settings.OPENAI_READ_TIMEOUT_SECONDS,
+                connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+    
+    async def warm_up(self) -> None:
+        """Load the tokenizer and open a pooled connection (DNS, TCP and TLS) before the first analysis"""
+        # The tokenizer may download its encoding; requests estimate token counts until it is ready
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self.budget.load_encoding), timeout=settings.OPENAI_CONNECT_TIMEOUT_SECONDS * 2)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Tokenizer still loading, estimating token counts until it is ready")
+        
+        if not self.is_available or self._http_client is None:
+            return
+        
+        started = time.perf_counter()
+        try:
+            response = await self._http_client.get(
+                f"{settings.OPENAI_BASE_URL.rstrip('/')}/models",
+                headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
+                timeout=settings.OPENAI_CONNECT_TIMEOUT_SECONDS * 2
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logger.info(f"🔥 OpenAI connection warmed in {elapsed_ms:.0f}ms "
+                       f"(status {response.status_code}, {response.http_version})")
+        except Exception as e:
+            logger.warning(f"⚠️ OpenAI connection warm-up failed: {e}")
+    
+    async def aclose(self) -> None:
+        """Close the shared connection pool"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+    
+    def _get_pool_status(self) -> dict:
+        """Report connection pool configuration and utilisation"""
+        if self._http_client is None:
+            return {"status": "not_initialized"}
+        
+        pool_status = {
+            "http2": self.http2_enabled,
+            "max_connections": settings.OPENAI_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.OPENAI_POOL_MAX_KEEPALIVE,
+            "connect_timeout_seconds": settings.OPENAI_CONNECT_TIMEOUT_SECONDS,
+            "read_timeout_seconds": settings.OPENAI_READ_TIMEOUT_SECONDS,
+        }
+        
+        # httpx does not expose pool state publicly; read it from httpcore when present
+        try:
+            connections = self._http_client._transport._pool.connections  # type: ignore[attr-defined]
+            idle = sum(1 for connection in connections if connection.is_idle())
+            pool_status.update({
+                "open_connections": len(connections),
+                "idle_connections": idle,
+                "active_connections": len(connections) - idle,
+                "utilisation": round((len(connections) - idle) / settings.OPENAI_POOL_MAX_CONNECTIONS, 3)
+            })
+        except Exception:
+            pass
+        
+        return pool_status
+    
     @property
     def is_available(self) -> bool:
         """Check if the LLM service is available"""
-        return self._client is not None and settings.openai_key_available
+        return self._client is not None and (settings.openai_key_available or self.uses_fake_backend)
+    
+    @property
+    def uses_fake_backend(self) -> bool:
+        """Whether calls go to the offline fake instead of OpenAI"""
+        return settings.LLM_BACKEND == "fake"
     
     def get_status(self) -> dict:
         """Get service status information"""
@@ -50,22 +270,55 @@ class LLMService:
             "status": "available" if self.is_available else "unavailable",
             "model": settings.OPENAI_MODEL if self.is_available else None,
             "temperature": settings.OPENAI_TEMPERATURE if self.is_available else None,
-            "api_key_configured": settings.openai_key_available
+            "api_key_configured": settings.openai_key_available,
+            "concurrency": self.limiter.get_status(),
+            "connection_pool": self._get_pool_status(),
+            "prompt_budget": self.budget.get_status(),
+            "backend": "fake" if self.uses_fake_backend else "openai",
+            **({"fake": self._client.get_status()} if isinstance(self._client, FakeChatModel) else {})
         }
     
     async def analyze_skin_image(
         self, 
-        base64_image: str, 
+        image_url: str, 
         analysis_id: int,
-        survey_data: Optional[Dict[str, Any]] = None
+        survey_data: Optional[Dict[str, Any]] = None,
+        quality_hint: Optional[str] = None
     ) -> str:
         """
         Analyze an image for skin condition assessment using OpenAI's vision model
         
         Args:
-            base64_image: Base64 encoded image string
+            image_url: Base64 data URL of the image
+            analysis_id: Unique analysis identifier for logging
+            survey_data: Optional user survey data for personalization
+            quality_hint: Optional note about detected photo quality issues
+            
+        Returns:
+            Raw response from the LLM
+            
+        Raises:
+            HTTPException: If analysis fails or service unavailable
+        """
+        return await self.analyze_skin_images([image_url], analysis_id, survey_data, quality_hint)
+    
+    async def analyze_skin_images(
+        self,
+        image_urls: List[str],
+        analysis_id: int,
+        survey_data: Optional[Dict[str, Any]] = None,
+        quality_hint: Optional[str] = None,
+        image_note: Optional[str] = None
+    ) -> str:
+        """
+        Analyze one or more photos of the same face in a single vision request
+        
+        Args:
+            image_urls: Base64 data URLs, one image part each
             analysis_id: Unique analysis identifier for logging
             survey_data: Optional user survey data for personalization
+            quality_hint: Optional note about detected photo quality issues
+            image_note: Optional description of the views (multi-angle sessions)
             
         Returns:
             Raw response from the LLM
@@ -81,118 +334,423 @@ class LLMService:
             )
         
         try:
-            logger.info(f"🤖 Starting skin analysis {analysis_id} with {'personalized' if survey_data else 'basic'} context")
+            logger.info(f"🤖 Starting skin analysis {analysis_id} with {'personalized' if survey_data else 'basic'} context"
+                       f"{f', {len(image_urls)} images' if len(image_urls) > 1 else ''}")
+            
+            messages = self._build_messages(image_urls, survey_data, analysis_id, quality_hint, image_note)
+            
+            # Get response from LLM
+            response_text = await self._invoke(
+                messages,
+                analysis_id,
+                image_urls,
+                personalized=survey_data is not None
+            )
+            
+            logger.info(f"✅ Skin analysis {analysis_id} completed - Response length: {len(response_text)}")
+            
+            return response_text
+            
+        except HTTPException:
+            raise
+        except RateLimitError as e:
+            raise self._rate_limited(analysis_id, e)
+        except Exception as e:
+            logger.error(f"❌ Skin analysis {analysis_id} failed: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Skin analysis failed: {str(e)}"
+            )
+    
+    async def stream_skin_analysis(
+        self,
+        image_url: str,
+        analysis_id: int,
+        survey_data: Optional[Dict[str, Any]] = None,
+        quality_hint: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a skin condition analysis as it is generated
+        
+        Args:
+            image_url: Base64 data URL of the image
+            analysis_id: Unique analysis identifier for logging
+            survey_data: Optional user survey data for personalization
+            quality_hint: Optional note about detected photo quality issues
+            
+        Yields:
+            Text chunks of the raw LLM response
+            
+        Raises:
+            HTTPException: If analysis fails or service unavailable
+        """
+        if not self.is_available:
+            logger.error(f"❌ Analysis {analysis_id} failed - LLM service unavailable")
+            raise HTTPException(
+                status_code=503,
+                detail="LLM service is currently unavailable"
+            )
+        
+        try:
+            logger.info(f"🤖 Starting streamed skin analysis {analysis_id} with {'personalized' if survey_data else 'basic'} context")
+            
+            messages = self._build_messages([image_url], survey_data, analysis_id, quality_hint)
             
-            # Create the system prompt with user data
-            system_prompt = self._create_enhanced_system_prompt(survey_data)
+            response_length = 0
+            async for text in self._stream(
+                messages,
+                analysis_id,
+                [image_url],
+                personalized=survey_data is not None
+            ):
+                response_length += len(text)
+                yield text
+            
+            logger.info(f"✅ Streamed skin analysis {analysis_id} completed - Response length: {response_length}")
+            
+        except HTTPException:
+            raise
+        except RateLimitError as e:
+            raise self._rate_limited(analysis_id, e)
+        except Exception as e:
+            logger.error(f"❌ Streamed skin analysis {analysis_id} failed: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Skin analysis failed: {str(e)}"
+            )
+    
+    async def classify_skin_image(
+        self,
+        image_url: str,
+        analysis_id: int,
+        quality_hint: Optional[str] = None,
+        personalized: bool = False
+    ) -> str:
+        """
+        Phase one of a two-phase analysis: classify the skin only
+        
+        A short, tightly capped vision call returning confidence,
+        primaryCondition, secondaryConditions and skinType, so the
+        classification reaches the user before recommendations are written.
+        
+        Args:
+            image_url: Base64 data URL of the image
+            analysis_id: Unique analysis identifier for logging
+            quality_hint: Optional note about detected photo quality issues
+            personalized: Whether the analysis has survey data (scheduling and usage accounting)
             
-            # Create the user prompt for analysis
-            user_prompt = self._create_analysis_prompt(survey_data)
+        Returns:
+            Raw classification response from the LLM
+            
+        Raises:
+            HTTPException: If classification fails or service unavailable
+        """
+        if not self.is_available:
+            logger.error(f"❌ Analysis {analysis_id} failed - LLM service unavailable")
+            raise HTTPException(
+                status_code=503,
+                detail="LLM service is currently unavailable"
+            )
+        
+        try:
+            logger.info(f"🤖 Starting skin classification {analysis_id}")
+            
+            user_prompt = "Please classify the skin in this facial image."
+            if quality_hint:
+                user_prompt += f"\n\n{quality_hint}"
             
-            # Create the messages
             messages = [
-                SystemMessage(content=system_prompt),
+                SystemMessage(content=SKIN_CLASSIFICATION_SYSTEM_PROMPT),
                 HumanMessage(
                     content=[
-                        {
-                            "type": "text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
+                        {"type": "text", "text": user_prompt},
+                        {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 )
             ]
             
-            # Get response from LLM
-            response = await self._client.ainvoke(messages)  # type: ignore
-            response_text = str(response.content)
+            response_text = await self._invoke(
+                messages,
+                analysis_id,
+                [image_url],
+                personalized=personalized,
+                stage="llm_classify",
+                max_tokens=settings.TWO_PHASE_CLASSIFY_MAX_TOKENS
+            )
             
-            logger.info(f"✅ Skin analysis {analysis_id} completed - Response length: {len(response_text)}")
+            logger.info(f"✅ Skin classification {analysis_id} completed - Response length: {len(response_text)}")
             
             return response_text
             
+        except HTTPException:
+            raise
+        except RateLimitError as e:
+            raise self._rate_limited(analysis_id, e)
         except Exception as e:
-            logger.error(f"❌ Skin analysis {analysis_id} failed: {str(e)}")
+            logger.error(f"❌ Skin classification {analysis_id} failed: {str(e)}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Skin analysis failed: {str(e)}"
             )
     
-    def _create_enhanced_system_prompt(self, survey_data: Optional[Dict[str, Any]]) -> str:
-        """Create enhanced system prompt including user survey data"""
-        base_prompt = """You are an expert dermatologist and skincare specialist. Analyze the provided facial image and provide detailed skin condition assessment with personalized ingredient recommendations.
-
-Your analysis should be professional, accurate, and evidence-based. Consider both what you see in the image and the user's personal information provided.
-
-IMPORTANT GUIDELINES:
-1. Always prioritize safety based on user's medical history
-2. Consider user's age, skin type, and experience level
-3. Provide specific, actionable recommendations
-4. Include concentration ranges and application instructions
-5. Warn about potential interactions or contraindications
-
-SKIN CONDITIONS TO ASSESS:
-- Normal skin (balanced, healthy appearance)
-- Oily skin (visible shine, enlarged pores, excess sebum)
-- Dry skin (flaking, roughness, tightness, dullness)
-- Combination skin (oily T-zone, dry cheeks)
-- Sensitive skin (redness, irritation, reactivity)
-- Acne-prone skin (active breakouts, blackheads, whiteheads)
-- Hyperpigmentation (dark spots, uneven skin tone, melasma)
-- Rosacea (facial redness, visible blood vessels, persistent flushing)
-- Eczema/Atopic dermatitis (dry patches, inflammation, rough texture)
-
-CONFIDENCE RATING: Rate your confidence based on photo quality (always an INT):
-- Excellent photo (crystal clear, perfect lighting, ideal angle): 90-98
-- Good photo (clear, decent lighting, good angle): 80-89  
-- Average photo (somewhat blurry, okay lighting, slight angle): 65-79
-- Poor photo (very blurry, bad lighting, difficult to see): 0-64
-
-INGREDIENT RECOMMENDATIONS should focus on evidence-based skincare ingredients like:
-- Retinol/Retinoids (for acne, aging, hyperpigmentation)
-- Niacinamide (for oily skin, large pores, redness)
-- Hyaluronic Acid (for hydration, dry skin)
-- Salicylic Acid (for acne, oily skin, blackheads)
-- Vitamin C (for hyperpigmentation, antioxidant protection)
-- Ceramides (for dry, sensitive skin, barrier repair)
-- Azelaic Acid (for rosacea, acne, hyperpigmentation)
-- Glycolic Acid (for texture, hyperpigmentation)
-- Peptides (for aging, collagen support)
-- Zinc Oxide/Titanium Dioxide (for sensitive skin, sun protection)
-
-Response Format: Return valid JSON with the following structure:
-{
-    "confidence": <1-100>,
-    "primaryCondition": "<main condition>",
-    "secondaryConditions": ["<condition1>", "<condition2>"],
-    "skinType": "<skin type>",
-    "ingredientRecommendations": [
-        {
-            "ingredient": "<ingredient name>",
-            "purpose": "<what it does>",
-            "concentration": "<recommended %>",
-            "application": "<how to use>",
-            "benefits": "<specific benefits>"
-        }
-    ],
-    "description": "<detailed analysis>"
-}"""
+    async def stream_recommendations(
+        self,
+        classification: Dict[str, Any],
+        analysis_id: int,
+        survey_data: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Phase two of a two-phase analysis: stream recommendations for a classification
         
-        if survey_data and survey_data.get('userContext'):
-            # Add personalized context
-            user_context = survey_data['userContext']
-            safety_warnings = survey_data.get('safetyWarnings', [])
-            age_recs = survey_data.get('ageRecommendations', [])
-            username = survey_data.get('username', 'User')
+        This is a text-only call; the image was already read in phase one, so
+        its tokens are not paid for twice.
+        
+        Args:
+            classification: Parsed phase one result
+            analysis_id: Unique analysis identifier for logging
+            survey_data: Optional user survey data for personalization
             
-            base_prompt += f"""
-
-USER PROFILE:
+        Yields:
+            Text chunks of the raw LLM response
+            
+        Raises:
+            HTTPException: If generation fails or service unavailable
+        """
+        if not self.is_available:
+            logger.error(f"❌ Analysis {analysis_id} failed - LLM service unavailable")
+            raise HTTPException(
+                status_code=503,
+                detail="LLM service is currently unavailable"
+            )
+        
+        try:
+            logger.info(f"🤖 Starting streamed recommendations {analysis_id} with {'personalized' if survey_data else 'basic'} context")
+            
+            survey_data, _ = self.budget.fit_survey_data(survey_data)
+            messages = [
+                SystemMessage(content=SKIN_RECOMMENDATION_SYSTEM_PROMPT),
+                HumanMessage(content=self._create_recommendation_prompt(classification, survey_data))
+            ]
+            
+            response_length = 0
+            async for text in self._stream(
+                messages,
+                analysis_id,
+                [],
+                personalized=survey_data is not None,
+                stage="llm_recommend",
+                max_tokens=settings.TWO_PHASE_RECOMMEND_MAX_TOKENS
+            ):
+                response_length += len(text)
+                yield text
+            
+            logger.info(f"✅ Streamed recommendations {analysis_id} completed - Response length: {response_length}")
+            
+        except HTTPException:
+            raise
+        except RateLimitError as e:
+            raise self._rate_limited(analysis_id, e)
+        except Exception as e:
+            logger.error(f"❌ Streamed recommendations {analysis_id} failed: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Skin analysis failed: {str(e)}"
+            )
+    
+    async def _invoke(
+        self,
+        messages: List[BaseMessage],
+        analysis_id: int,
+        image_urls: List[str],
+        personalized: bool,
+        stage: str = "llm",
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Make one limited, timed and accounted completion call"""
+        options = {"max_tokens": max_tokens} if max_tokens else {}
+        
+        queued_at = time.perf_counter()
+        async with self.limiter.acquire(request_priority(personalized), stage) as permit:
+            record_stage("llm_queue", time.perf_counter() - queued_at)
+            llm_started = time.perf_counter()
+            try:
+                response = await self._client.ainvoke(messages, **options)  # type: ignore
+            except RateLimitError:
+                permit.mark_overloaded()
+                raise
+            finally:
+                llm_seconds = time.perf_counter() - llm_started
+                record_stage(stage, llm_seconds)
+        
+        self._check_completion_cap(analysis_id, response.response_metadata, max_tokens)
+        self._record_usage(
+            extract_token_usage(response),
+            response.response_metadata.get("finish_reason"),
+            llm_seconds,
+            image_urls,
+            personalized=personalized
+        )
+        return str(response.content)
+    
+    async def _stream(
+        self,
+        messages: List[BaseMessage],
+        analysis_id: int,
+        image_urls: List[str],
+        personalized: bool,
+        stage: str = "llm",
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Make one limited, timed and accounted streaming call, yielding text chunks"""
+        options = {"max_tokens": max_tokens} if max_tokens else {}
+        usage = None
+        finish_reason = None
+        
+        queued_at = time.perf_counter()
+        async with self.limiter.acquire(request_priority(personalized), stage) as permit:
+            record_stage("llm_queue", time.perf_counter() - queued_at)
+            llm_started = time.perf_counter()
+            try:
+                async for chunk in self._client.astream(messages, **options):  # type: ignore
+                    text = str(chunk.content)
+                    if text:
+                        yield text
+                    if chunk.response_metadata:
+                        self._check_completion_cap(analysis_id, chunk.response_metadata, max_tokens)
+                        finish_reason = chunk.response_metadata.get("finish_reason") or finish_reason
+                    if chunk.usage_metadata or chunk.response_metadata.get("token_usage"):
+                        usage = extract_token_usage(chunk)
+            except RateLimitError:
+                permit.mark_overloaded()
+                raise
+            finally:
+                llm_seconds = time.perf_counter() - llm_started
+                record_stage(stage, llm_seconds)
+        
+        self._record_usage(
+            usage or {"prompt_tokens": 0, "completion_tokens": 0},
+            finish_reason,
+            llm_seconds,
+            image_urls,
+            personalized=personalized,
+            streamed=True
+        )
+    
+    def _check_completion_cap(
+        self,
+        analysis_id: int,
+        response_metadata: Dict[str, Any],
+        max_tokens: Optional[int] = None
+    ) -> None:
+        """Warn when a completion was cut off by the max_tokens cap"""
+        if response_metadata.get("finish_reason") == "length":
+            self.budget.record_truncated_completion()
+            logger.warning(f"⚠️ Skin analysis {analysis_id} hit the completion cap of "
+                          f"{max_tokens or settings.OPENAI_MAX_COMPLETION_TOKENS} tokens")
+    
+    def _record_usage(
+        self,
+        usage: Dict[str, int],
+        finish_reason: Optional[str],
+        latency_seconds: float,
+        image_urls: List[str],
+        personalized: bool,
+        streamed: bool = False
+    ) -> None:
+        """Record a completed call's tokens, latency and cost"""
+        # Decoded size of the base64 payloads after each "data:<mime>;base64," header
+        image_bytes = sum((len(url) - url.find(",") - 1) * 3 // 4 for url in image_urls) if image_urls else None
+        usage_recorder.record(
+            model=settings.OPENAI_MODEL,
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            latency_seconds=latency_seconds,
+            personalized=personalized,
+            streamed=streamed,
+            image_bytes=image_bytes,
+            finish_reason=finish_reason
+        )
+    
+    def _rate_limited(self, analysis_id: int, error: RateLimitError) -> HTTPException:
+        """Translate a provider 429 into a 503 the client can back off from"""
+        logger.warning(f"⚠️ Skin analysis {analysis_id} rate limited by provider: {error}")
+        return HTTPException(
+            status_code=503,
+            detail="Analysis service is temporarily busy. Please try again shortly.",
+            headers={"Retry-After": str(self.limiter.retry_after_seconds())}
+        )
+    
+    def _build_messages(
+        self,
+        image_urls: List[str],
+        survey_data: Optional[Dict[str, Any]],
+        analysis_id: int,
+        quality_hint: Optional[str] = None,
+        image_note: Optional[str] = None
+    ) -> List[BaseMessage]:
+        """Build the system and vision messages for an analysis request"""
+        # Trim oversized survey fields before they reach the prompt
+        survey_data, trimmed_fields = self.budget.fit_survey_data(survey_data)
+        
+        # Static system prompt first, so the cached prefix is shared by every request
+        system_prompt = self._create_system_prompt()
+        
+        # Create the user prompt for analysis
+        user_prompt = self._create_analysis_prompt(survey_data)
+        if image_note:
+            user_prompt += f"\n\n{image_note}"
+        if quality_hint:
+            user_prompt += f"\n\n{quality_hint}"
+        
+        budget_report = self.budget.measure(system_prompt, user_prompt, trimmed_fields)
+        logger.info(f"📏 Prompt budget for analysis {analysis_id} - "
+                   f"Prompt text tokens: {budget_report['prompt_text_tokens']} "
+                   f"(static prefix {budget_report['static_prefix_tokens']}), "
+                   f"Completion cap: {budget_report['max_completion_tokens']}, "
+                   f"Trimmed: {', '.join(trimmed_fields) or 'none'}")
+        
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(
+                content=[
+                    {
+                        "type": "text",
+                        "text": user_prompt
+                    },
+                    *(
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url
+                            }
+                        }
+                        for image_url in image_urls
+                    )
+                ]
+            )
+        ]
+    
+    def _create_system_prompt(self) -> str:
+        """
+        Create the static system prompt
+        
+        This must stay byte-identical across requests so the provider can
+        reuse its cached prefix; anything user-specific belongs in the
+        analysis prompt instead.
+        """
+        return SKIN_ANALYSIS_SYSTEM_PROMPT
+    
+    def _create_user_profile_prompt(self, survey_data: Optional[Dict[str, Any]]) -> str:
+        """Create the personalised profile block from (budget-fitted) survey data"""
+        if not survey_data or not survey_data.get('userContext'):
+            return ""
+        
+        user_context = survey_data['userContext']
+        safety_warnings = survey_data.get('safetyWarnings', [])
+        age_recs = survey_data.get('ageRecommendations', [])
+        username = survey_data.get('username', 'User')
+        
+        return f"""USER PROFILE:
 {user_context}
 
 SAFETY CONSIDERATIONS:
@@ -209,8 +767,6 @@ PERSONALIZATION INSTRUCTIONS:
 - Include specific safety warnings where relevant
 - If user profile mentions pregnancy/nursing, only recommend pregnancy-safe ingredients
 - Prioritize gentle, suitable products based on user's condition and experience"""
-        
-        return base_prompt
     
     def _create_analysis_prompt(self, survey_data: Optional[Dict[str, Any]]) -> str:
         """Create analysis prompt with survey context"""
@@ -226,10 +782,33 @@ This analysis is for {username}. Please provide recommendations that consider th
 - Age and experience level
 - Special considerations (pregnancy, medical conditions, etc.)
 
-Ensure all recommendations are safe and appropriate for this specific user based on their survey responses."""
+Ensure all recommendations are safe and appropriate for this specific user based on their survey responses.
+
+{self._create_user_profile_prompt(survey_data)}"""
         
         return base_prompt
     
+    def _create_recommendation_prompt(
+        self,
+        classification: Dict[str, Any],
+        survey_data: Optional[Dict[str, Any]]
+    ) -> str:
+        """Create the phase two prompt from the phase one classification and survey context"""
+        secondary = ", ".join(classification.get('secondaryConditions') or []) or "none"
+        prompt = f"""SKIN ASSESSMENT:
+- Primary condition: {classification.get('primaryCondition')}
+- Secondary conditions: {secondary}
+- Skin type: {classification.get('skinType')}
+- Assessment confidence: {classification.get('confidence')}%
+
+Please provide skincare recommendations for this assessment."""
+        
+        profile = self._create_user_profile_prompt(survey_data)
+        if profile:
+            prompt += f"\n\nEnsure all recommendations are safe and appropriate for this specific user.\n\n{profile}"
+        
+        return prompt
+    
     def _create_skin_analysis_prompt(self) -> str:
         """Legacy method for backward compatibility - use _create_analysis_prompt instead"""
         return self._create_analysis_prompt(None)
@@ -0,0 +1,191 @@
+"""
+Per-stage request timing, Server-Timing headers and Prometheus histograms
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) covering sub-millisecond parsing up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record one observation"""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[label_values] = series
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _labels(self, label_values: Tuple[str, ...], extra: str = "") -> str:
+        """Format a label set"""
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, label_values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        """Render all series as exposition-format lines"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            series_items = [(labels, list(buckets), total, count) for labels, (buckets, total, count) in self._series.items()]
+
+        for label_values, bucket_counts, total, count in sorted(series_items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{self._labels(label_values, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(label_values, le)} {count}")
+            lines.append(f"{self.name}_sum{self._labels(label_values)} {total:.6f}")
+            lines.append(f"{self.name}_count{self._labels(label_values)} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the application's histograms"""
+
+    def __init__(self):
+        self.stage_duration = Histogram(
+            "analysis_stage_duration_seconds",
+            "Time spent in each stage of the skin analysis pipeline",
+            ("stage",)
+        )
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "HTTP request duration until the response headers are sent",
+            ("method", "route", "status")
+        )
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        lines = self.stage_duration.render() + self.request_duration.render()
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Durations of the pipeline stages run for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Add time to a stage (repeated stages accumulate)"""
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Format the spans as a Server-Timing header value (milliseconds)"""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.spans.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# Timer for the request being handled, set by ServerTimingMiddleware
+_current_timer: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar("stage_timer", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Record a stage duration against the histogram and the current request
+
+    Args:
+        stage: Stage name (e.g. "preprocess", "llm")
+        seconds: Time spent in the stage
+    """
+    metrics_registry.stage_duration.observe(seconds, stage)
+
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a pipeline stage (usable in sync and async code)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that times each request's stages
+
+    A StageTimer is bound to the request's context so services can record
+    spans without it being passed around; the spans are returned in a
+    Server-Timing header and the request duration is observed in the
+    request histogram. For streamed responses the header only covers the
+    stages finished before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = _current_timer.set(timer)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+
+                route = scope.get("route")
+                metrics_registry.request_duration.observe(
+                    time.perf_counter() - timer.started,
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    str(message["status"])
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timer.reset(token)
+
+
+# Global metrics registry
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,282 @@
+"""
+Write-behind persistence of analysis results
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional, Dict, Any, List
+
+from app.models.database import SessionLocal
+from app.services.database_service import DatabaseService
+from app.services.metrics import record_stage
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# What to do with a record when the write queue is full
+OVERFLOW_SPILL = "spill"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+
+
+class AnalysisWriter:
+    """
+    Persists analysis results to skin_analyses outside the request path
+
+    Handlers submit finished analyses and respond immediately; a background
+    writer drains the bounded queue in batches, inserting each batch in one
+    transaction off the event loop and retrying with backoff on failure.
+    When the queue is full, or a batch exhausts its retries, records are
+    spilled to a JSONL file (replayed on the next start) or dropped,
+    depending on ANALYSIS_WRITE_OVERFLOW_POLICY. A batch that keeps failing
+    is retried one record at a time first, so a single record the database
+    rejects (e.g. its user was deleted) is dropped on its own instead of
+    taking the rest of the batch with it.
+    """
+
+    def __init__(self):
+        self.enabled = settings.ANALYSIS_WRITE_BEHIND_ENABLED
+        self.max_queue_size = settings.ANALYSIS_WRITE_QUEUE_SIZE
+        self.batch_size = settings.ANALYSIS_WRITE_BATCH_SIZE
+        self.flush_interval = settings.ANALYSIS_WRITE_FLUSH_INTERVAL_SECONDS
+        self.max_retries = settings.ANALYSIS_WRITE_MAX_RETRIES
+        self.overflow_policy = settings.ANALYSIS_WRITE_OVERFLOW_POLICY
+        self.spill_path = settings.ANALYSIS_WRITE_SPILL_PATH
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._unflushed: List[Dict[str, Any]] = []
+        self._spill_lock = asyncio.Lock()
+
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "write_seconds_total": 0.0,
+            "last_batch_size": 0,
+        }
+
+    async def start(self) -> None:
+        """Start the background writer and replay any spilled records"""
+        if not self.enabled or self._writer is not None:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._writer = asyncio.create_task(self._run(), name="analysis-writer")
+
+        await self._replay_spill()
+
+        logger.info(f"✅ Analysis writer started - Batch size: {self.batch_size}, "
+                   f"Queue: {self.max_queue_size}, Overflow: {self.overflow_policy}")
+
+    async def stop(self) -> None:
+        """Flush queued records and stop the writer"""
+        if self._writer is None:
+            return
+
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+
+        # Write whatever is left; anything that still fails is spilled
+        remaining, self._unflushed = self._unflushed, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            await self._write_with_retry(remaining[start:start + self.batch_size])
+
+    async def submit(
+        self,
+        user_id: str,
+        analysis_data: Dict[str, Any],
+        image_path: Optional[str] = None
+    ) -> None:
+        """
+        Queue an analysis for persistence
+
+        Args:
+            user_id: Owner of the analysis
+            analysis_data: Analysis result to store
+            image_path: Optional path of the uploaded image
+        """
+        record = {
+            "user_id": user_id,
+            "analysis_data": analysis_data,
+            "image_path": image_path,
+        }
+        self.stats["submitted"] += 1
+
+        if self._writer is None:
+            # Writer not running (disabled or outside the app lifecycle): write inline
+            await self._write_with_retry([record])
+            return
+
+        try:
+            self._queue.put_nowait(record)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.put_nowait(record)
+            self.stats["dropped"] += 1
+            logger.warning("⚠️ Analysis write queue full - dropped oldest record")
+        elif self.overflow_policy == OVERFLOW_DROP_NEWEST:
+            self.stats["dropped"] += 1
+            logger.warning(f"⚠️ Analysis write queue full - dropped analysis for user {user_id}")
+        else:
+            await self._spill([record])
+
+    async def _run(self) -> None:
+        """Drain the queue in batches"""
+        while True:
+            batch = [await self._queue.get()]
+
+            try:
+                # Gather more records until the batch is full or the flush interval passes
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._write_with_retry(batch)
+            except asyncio.CancelledError:
+                # Shutting down mid-batch: hand the records back for stop() to flush
+                self._unflushed = batch
+                raise
+            except Exception as e:
+                logger.error(f"❌ Analysis writer error: {e}")
+
+    async def _write_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch, backing off between attempts, then isolate and spill or drop what fails"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 10))
+
+            if await self._write_once(batch):
+                return
+
+        self.stats["failed_batches"] += 1
+        failed = batch
+
+        if len(batch) > 1:
+            # The batch is one transaction, so one bad record fails them all
+            failed = [record for record in batch if not await self._write_once([record])]
+            if len(failed) < len(batch):
+                # The database is up and rejected these records: replaying them would fail again
+                self.stats["rejected"] += len(failed)
+                for record in failed:
+                    logger.error(f"❌ Dropping analysis for user {record['user_id']} rejected by the database")
+                return
+
+        logger.error(f"❌ Giving up on {len(failed)} analyses after {self.max_retries} retries")
+
+        if self.overflow_policy == OVERFLOW_SPILL:
+            await self._spill(failed)
+        else:
+            self.stats["dropped"] += len(failed)
+
+    async def _write_once(self, batch: List[Dict[str, Any]]) -> bool:
+        """Make one write attempt off the event loop, recording its timing"""
+        started = time.monotonic()
+        try:
+            written = await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"❌ Analysis batch write failed: {e}")
+            written = None
+        elapsed = time.monotonic() - started
+        self.stats["write_seconds_total"] += elapsed
+        record_stage("db_write", elapsed)
+
+        if written is None:
+            return False
+
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = written
+        return True
+
+    @staticmethod
+    def _write_batch(batch: List[Dict[str, Any]]) -> Optional[int]:
+        """Insert a batch in one transaction (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            return DatabaseService(db).create_skin_analyses_batch(batch)
+        finally:
+            db.close()
+
+    # Spill file
+    async def _spill(self, records: List[Dict[str, Any]]) -> None:
+        """Append records to the spill file for replay on the next start"""
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+        async with self._spill_lock:
+            try:
+                await asyncio.to_thread(self._append_spill, lines)
+                self.stats["spilled"] += len(records)
+                logger.warning(f"⚠️ Spilled {len(records)} analyses to {self.spill_path}")
+            except OSError as e:
+                self.stats["dropped"] += len(records)
+                logger.error(f"❌ Failed to spill analyses, dropping {len(records)}: {e}")
+
+    def _append_spill(self, lines: str) -> None:
+        """Append to the spill file (runs in a worker thread)"""
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def _replay_spill(self) -> None:
+        """Queue records spilled by a previous run"""
+        async with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+
+            replay_path = f"{self.spill_path}.replay"
+            try:
+                os.replace(self.spill_path, replay_path)
+                with open(replay_path, encoding="utf-8") as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+                os.remove(replay_path)
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Failed to replay spilled analyses: {e}")
+                return
+
+        for record in records:
+            await self.submit(record["user_id"], record["analysis_data"], record.get("image_path"))
+        self.stats["submitted"] -= len(records)
+        self.stats["replayed"] += len(records)
+
+        if records:
+            logger.info(f"🔁 Replaying {len(records)} spilled analyses")
+
+    def get_status(self) -> dict:
+        """Get writer configuration, queue depth and counters"""
+        batches = self.stats["batches"]
+        return {
+            "enabled": self.enabled,
+            "running": self._writer is not None,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "batch_size": self.batch_size,
+            "overflow_policy": self.overflow_policy,
+            "avg_batch_size": round(self.stats["written"] / batches, 1) if batches else 0.0,
+            **self.stats,
+        }
+
+
+# Global writer instance
+analysis_writer = AnalysisWriter()
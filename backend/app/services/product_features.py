@@ -0,0 +1,248 @@
+"""
+Scoring features materialised on the products table
+"""
+import asyncio
+import logging
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, FrozenSet
+
+from sqlalchemy import DateTime, Float, Numeric, bindparam, case, cast, event, extract, func, inspect, literal, or_, update
+from sqlalchemy.sql import ColumnElement
+
+from ..models.database import SessionLocal
+from ..models.product import Product
+from ..utils.ingredients import INCI_ALIASES, get_ingredient_aliases
+from .product_scoring import LEADING_POSITIONS, retailer_score
+
+logger = logging.getLogger(__name__)
+
+# Columns the features are computed from
+FEATURE_INPUTS = ("ingredients_norm", "price_per_ml", "retailer")
+
+# Set once stale rows have been backfilled; until then SQL ranking is not used
+_features_current = False
+_refresh_task: Optional[asyncio.Task] = None
+
+
+@lru_cache(maxsize=1)
+def canonical_ingredients() -> Tuple[FrozenSet[str], ...]:
+    """
+    Alias sets of the ingredients known to the alias dictionary, in a stable order
+
+    _calculate_score looks a required ingredient up by its alias set, so
+    ingredients sharing one (e.g. niacinamide and vitamin b3) share a
+    canonical id: the index of their set in this tuple.
+    """
+    known_terms = set(INCI_ALIASES)
+    for alias_list in INCI_ALIASES.values():
+        known_terms.update(alias_list)
+
+    return tuple(sorted({frozenset(get_ingredient_aliases(term)) for term in known_terms}, key=sorted))
+
+
+@lru_cache(maxsize=1)
+def features_version() -> int:
+    """
+    Version of the canonical id layout, stored with each row's features
+
+    Derived from the catalogue itself, so editing the alias dictionary
+    marks every stored feature row stale.
+    """
+    layout = "|".join(",".join(sorted(alias_set)) for alias_set in canonical_ingredients())
+    return zlib.crc32(layout.encode("utf-8")) & 0x7FFF
+
+
+@lru_cache(maxsize=2048)
+def canonical_id(ingredient: str) -> Optional[int]:
+    """Canonical id of a normalised ingredient, or None if it has no stored feature"""
+    try:
+        return canonical_ingredients().index(frozenset(get_ingredient_aliases(ingredient)))
+    except ValueError:
+        return None
+
+
+def active_positions(ingredients_norm: Optional[List[str]]) -> List[int]:
+    """
+    First position of each canonical ingredient in an INCI list
+
+    Args:
+        ingredients_norm: Ordered normalised ingredient list
+
+    Returns:
+        One entry per canonical id: the first position below LEADING_POSITIONS
+        holding one of its aliases ("water" never counts), or -1
+    """
+    positions = [-1] * len(canonical_ingredients())
+    for position, ingredient in enumerate((ingredients_norm or [])[:LEADING_POSITIONS]):
+        if ingredient == 'water':
+            continue
+        for index, alias_set in enumerate(canonical_ingredients()):
+            if positions[index] < 0 and ingredient in alias_set:
+                positions[index] = position
+    return positions
+
+
+def price_score(price_per_ml: Any) -> float:
+    """Price efficiency points (max 20), 0 when price per ml is unknown"""
+    if price_per_ml is None or float(price_per_ml) <= 0:
+        return 0.0
+    return min(20.0, 100 / float(price_per_ml))
+
+
+def compute_features(ingredients_norm: Optional[List[str]], price_per_ml: Any, retailer: Optional[str]) -> Dict[str, Any]:
+    """Feature column values for one product"""
+    return {
+        "active_positions": active_positions(ingredients_norm),
+        "price_score": price_score(price_per_ml),
+        "retailer_score": int(retailer_score(retailer)),
+        "features_version": features_version(),
+    }
+
+
+def apply_features(product: Product) -> None:
+    """Recompute a product's feature columns in place"""
+    for column, value in compute_features(product.ingredients_norm, product.price_per_ml, product.retailer).items():
+        setattr(product, column, value)
+
+
+@event.listens_for(Product, "before_insert")
+def _features_on_insert(mapper, connection, target: Product) -> None:
+    apply_features(target)
+
+
+@event.listens_for(Product, "before_update")
+def _features_on_update(mapper, connection, target: Product) -> None:
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in FEATURE_INPUTS):
+        apply_features(target)
+
+
+def score_expression(required_ingredients: List[str], now: Optional[datetime] = None) -> Optional[ColumnElement]:
+    """
+    SQL equivalent of ProductService._calculate_score over the stored features
+
+    Only valid once features_current() is true; rows without current
+    features would get no ingredient position points.
+
+    Args:
+        required_ingredients: Normalised required ingredients
+        now: Naive local time freshness is measured from (default datetime.now())
+
+    Returns:
+        Score expression rounded to 2 decimals, or None if a required
+        ingredient has no canonical id (score those products in Python)
+    """
+    ids = [canonical_id(ingredient) for ingredient in required_ingredients]
+    if any(index is None for index in ids):
+        return None
+
+    score = cast(0, Float)
+
+    # Ingredient position (Postgres arrays are 1-based)
+    for index in ids:
+        position = Product.active_positions[index + 1]
+        score = score + case((position >= 0, (10 - position) * 5), else_=0)
+
+    # Freshness, in whole days on a 30-day scale. Like _calculate_score and
+    # naive_seconds, last_seen's wall-clock time (in the session zone, as the
+    # driver returns it) is compared with the server's naive local clock
+    last_seen = func.timezone(func.current_setting("TimeZone"), Product.last_seen)
+    local_now = literal(now or datetime.now(), DateTime())
+    days_old = func.floor(extract("epoch", local_now - last_seen) / 86400)
+    score = score + func.coalesce(func.greatest(0, 20 - days_old / 30 * 20), 0)
+
+    score = score + func.coalesce(Product.price_score, 0) + func.coalesce(Product.retailer_score, 0)
+
+    return func.round(cast(score, Numeric), 2)
+
+
+def refresh_stale_features(recompute_all: bool = False, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Recompute feature columns for products written without them
+
+    Covers rows that predate the feature columns, rows written outside the
+    ORM (which skip the listeners) once their features are cleared, and
+    every row after the alias dictionary changes. Runs synchronously; call
+    it from a script or a thread.
+
+    Args:
+        recompute_all: Recompute every product, not just stale ones
+        batch_size: Rows per page and per update transaction
+
+    Returns:
+        Count of products updated
+    """
+    counts = {"updated": 0}
+    version = features_version()
+    table = Product.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("product_id"))
+        .values(
+            active_positions=bindparam("positions"),
+            price_score=bindparam("price_points"),
+            retailer_score=bindparam("retailer_points"),
+            features_version=bindparam("version"),
+            # Features are not index inputs, so keep the refresh watermark still
+            updated_at=table.c.updated_at
+        )
+    )
+
+    db = SessionLocal()
+    try:
+        after_id = None
+        while True:
+            query = db.query(Product.id, Product.ingredients_norm, Product.price_per_ml, Product.retailer)
+            if not recompute_all:
+                query = query.filter(or_(Product.features_version.is_(None), Product.features_version != version))
+            if after_id is not None:
+                query = query.filter(Product.id > after_id)
+            page = query.order_by(Product.id).limit(batch_size).all()
+            if not page:
+                break
+
+            rows = []
+            for row in page:
+                features = compute_features(row.ingredients_norm, row.price_per_ml, row.retailer)
+                rows.append({
+                    "product_id": row.id,
+                    "positions": features["active_positions"],
+                    "price_points": features["price_score"],
+                    "retailer_points": features["retailer_score"],
+                    "version": features["features_version"],
+                })
+            db.execute(statement, rows)
+            db.commit()
+
+            counts["updated"] += len(rows)
+            after_id = page[-1].id
+    finally:
+        db.close()
+
+    logger.info(f"🧩 Recomputed scoring features for {counts['updated']} products (version {version})")
+    return counts
+
+
+def features_current() -> bool:
+    """Whether stored features are known to be current for every product"""
+    return _features_current
+
+
+async def start_feature_refresh() -> None:
+    """Backfill stale feature rows in the background (called on startup)"""
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_on_startup(), name="product-features")
+
+
+async def _refresh_on_startup() -> None:
+    """Run refresh_stale_features off the event loop, then allow SQL ranking"""
+    global _features_current
+    try:
+        await asyncio.to_thread(refresh_stale_features)
+    except Exception as e:
+        logger.error(f"❌ Failed to refresh scoring features: {e} - ranking stays in Python")
+        return
+    _features_current = True
@@ -0,0 +1,462 @@
+"""
+In-memory inverted ingredient index for product candidate retrieval
+"""
+import asyncio
+import dataclasses
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from ..models.database import SessionLocal
+from ..models.product import Product
+from ..config import settings
+from .product_query import CandidateQuery
+from .product_scoring import (
+    LEADING_POSITIONS,
+    encode_leading_terms,
+    naive_seconds,
+    retailer_score,
+    score_candidates,
+    top_k
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows re-read on each refresh, to catch transactions that committed after the last refresh ran
+REFRESH_OVERLAP = timedelta(seconds=5)
+LOAD_BATCH_SIZE = 10_000
+# Term bitsets kept per partition (n/8 bytes each); the alias vocabulary is far smaller
+TERM_BITSET_CACHE_SIZE = 512
+
+
+def _changed_at():
+    """When a product row last changed (updated_at is only set on update)"""
+    return func.coalesce(Product.updated_at, Product.created_at)
+
+
+def _index_columns() -> tuple:
+    """Columns loaded into the index: filters plus scoring features"""
+    return (
+        Product.id,
+        Product.country,
+        Product.retailer,
+        Product.ingredients_norm,
+        Product.ingredients_norm_set,
+        Product.price,
+        Product.price_per_ml,
+        Product.last_seen,
+        _changed_at().label("changed_at")
+    )
+
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    """Pack a boolean row mask into a uint64 bitset (bit i of the set is row i)"""
+    packed = np.packbits(mask, bitorder="little")
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def _bitset_positions(words: np.ndarray) -> np.ndarray:
+    """Row positions of the set bits, unpacking only the non-empty words"""
+    nonzero = np.flatnonzero(words)
+    bits = np.flatnonzero(np.unpackbits(words[nonzero].view(np.uint8), bitorder="little"))
+    return nonzero[bits >> 6] * 64 + (bits & 63)
+
+
+@dataclass
+class IndexPartition:
+    """
+    Inverted index over the products of one country
+
+    Products are addressed by row position. Each ingredient term maps to a
+    sorted int32 array of the positions listing it (a compressed posting
+    list). Queries turn the postings they need into packed uint64 bitsets,
+    cached per term, and combine them with vectorised AND / OR / NOT, so a
+    lookup touches n/64 words per term instead of n rows. Scoring features
+    are kept as columns alongside: the first ingredients of each product as
+    an (n, LEADING_POSITIONS) term-id matrix, price per ml, retailer points
+    and last_seen. Partitions are immutable once published: updates build a
+    new partition that replaces the old one, so readers never see a
+    half-applied change.
+    """
+    ids: List[Any]
+    positions: Dict[Any, int]
+    postings: Dict[str, np.ndarray]
+    term_ids: Dict[str, int]  # Vocabulary of leading_terms
+    leading_terms: np.ndarray  # (n, LEADING_POSITIONS) term ids, -1 padded
+    price: np.ndarray  # NaN where unknown
+    price_per_ml: np.ndarray  # NaN where unknown
+    retailer_scores: np.ndarray
+    last_seen: np.ndarray  # Naive seconds (see naive_seconds), NaN where unknown
+    changed_at: np.ndarray  # Naive seconds
+    alive: np.ndarray  # False for rows superseded by a later version
+    alive_bits: np.ndarray = field(init=False)
+    _term_bits: Dict[str, np.ndarray] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.alive_bits = _pack(self.alive)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @property
+    def live_count(self) -> int:
+        return int(self.alive.sum())
+
+    def _bits_for_term(self, term: str) -> Optional[np.ndarray]:
+        """Bitset of rows listing a term (cached for a bounded number of terms)"""
+        bits = self._term_bits.get(term)
+        if bits is not None:
+            return bits
+
+        postings = self.postings.get(term)
+        if postings is None:
+            return None
+
+        mask = np.zeros(self.size, dtype=bool)
+        mask[postings] = True
+        bits = _pack(mask)
+        if len(self._term_bits) < TERM_BITSET_CACHE_SIZE:
+            self._term_bits[term] = bits
+        return bits
+
+    def terms_bits(self, terms: Iterable[str]) -> np.ndarray:
+        """Bitset of rows listing any of the terms"""
+        words = np.zeros(len(self.alive_bits), dtype=np.uint64)
+        for term in terms:
+            bits = self._bits_for_term(term)
+            if bits is not None:
+                words |= bits
+        return words
+
+    def _positions(self, words: np.ndarray, seed_terms: Optional[List[str]]) -> np.ndarray:
+        """
+        Row positions set in a result bitset
+
+        Testing the postings of the rarest required class against the bitset
+        touches far fewer rows than unpacking every non-empty word.
+        """
+        seed_postings = [self.postings[term] for term in seed_terms or () if term in self.postings]
+        if not seed_postings:
+            return _bitset_positions(words)
+
+        seeds = np.concatenate(seed_postings)
+        hits = (words[seeds >> 6] >> (seeds & 63).astype(np.uint64)) & np.uint64(1)
+        return np.unique(seeds[hits.astype(bool)]).astype(np.int64)
+
+    def match(self, query: CandidateQuery) -> np.ndarray:
+        """
+        Positions of live rows matching a compiled candidate query
+
+        Returns:
+            int array of matching positions, in row order
+        """
+        words = self.alive_bits.copy()
+
+        # Rarest class first so an empty intersection stops early
+        classes = sorted(
+            query.required_classes,
+            key=lambda alias_class: sum(len(self.postings.get(term, ())) for term in alias_class)
+        )
+        for alias_class in classes:
+            words &= self.terms_bits(alias_class)
+            if not words.any():
+                return np.empty(0, dtype=np.int64)
+
+        if query.avoid_terms:
+            words &= ~self.terms_bits(query.avoid_terms)
+
+        matches = self._positions(words, classes[0] if classes else None)
+        if query.max_price is not None:
+            prices = self.price[matches]
+            matches = matches[np.isnan(prices) | (prices <= query.max_price)]
+
+        return matches
+
+    def score(self, positions: np.ndarray, required_ingredients: List[str]) -> np.ndarray:
+        """Score the products at the given positions (see score_candidates)"""
+        return score_candidates(
+            self.leading_terms[positions],
+            self.term_ids,
+            self.last_seen[positions],
+            self.price_per_ml[positions],
+            self.retailer_scores[positions],
+            required_ingredients
+        )
+
+
+def _to_float(value: Any) -> float:
+    """Numeric column value as float, NaN when missing"""
+    return float(value) if value is not None else np.nan
+
+
+def build_partition(rows: List[Any], base: Optional[IndexPartition] = None) -> IndexPartition:
+    """
+    Build a partition from product rows, optionally on top of an existing one
+
+    Args:
+        rows: Rows with the _index_columns() fields
+        base: Partition to extend; rows for products it already holds supersede them
+
+    Returns:
+        New partition (base is left untouched)
+    """
+    offset = base.size if base else 0
+    new_postings: Dict[str, List[int]] = defaultdict(list)
+    ids = list(base.ids) if base else []
+    positions = dict(base.positions) if base else {}
+    term_ids = dict(base.term_ids) if base else {}
+    superseded = []
+
+    for index, row in enumerate(rows):
+        position = offset + index
+        previous = positions.get(row.id)
+        if previous is not None:
+            superseded.append(previous)
+        positions[row.id] = position
+        ids.append(row.id)
+        for term in row.ingredients_norm_set or ():
+            new_postings[term].append(position)
+
+    postings = dict(base.postings) if base else {}
+    for term, term_positions in new_postings.items():
+        added = np.asarray(term_positions, dtype=np.int32)
+        postings[term] = np.concatenate([postings[term], added]) if term in postings else added
+
+    leading_terms = np.array(
+        [encode_leading_terms(row.ingredients_norm, term_ids) for row in rows], dtype=np.int32
+    ).reshape(len(rows), LEADING_POSITIONS)
+    price = np.array([_to_float(row.price) for row in rows], dtype=np.float64)
+    price_per_ml = np.array([_to_float(row.price_per_ml) for row in rows], dtype=np.float64)
+    retailer_scores = np.array([retailer_score(row.retailer) for row in rows], dtype=np.float64)
+    last_seen = np.array([naive_seconds(row.last_seen) for row in rows], dtype=np.float64)
+    changed_at = np.array([naive_seconds(row.changed_at) for row in rows], dtype=np.float64)
+    alive = np.ones(len(rows), dtype=bool)
+
+    if base:
+        leading_terms = np.concatenate([base.leading_terms, leading_terms])
+        price = np.concatenate([base.price, price])
+        price_per_ml = np.concatenate([base.price_per_ml, price_per_ml])
+        retailer_scores = np.concatenate([base.retailer_scores, retailer_scores])
+        last_seen = np.concatenate([base.last_seen, last_seen])
+        changed_at = np.concatenate([base.changed_at, changed_at])
+        alive = np.concatenate([base.alive, alive])
+    alive[superseded] = False
+
+    return IndexPartition(
+        ids, positions, postings, term_ids, leading_terms,
+        price, price_per_ml, retailer_scores, last_seen, changed_at, alive
+    )
+
+
+class ProductIngredientIndex:
+    """
+    Process-wide inverted ingredient index, partitioned by country
+
+    Built from the products table at startup and kept current by a
+    background task that re-reads rows changed since the last refresh
+    (coalesce(updated_at, created_at)). Deleted products are only noticed
+    by the periodic full rebuild, which also compacts partitions once too
+    many rows have been superseded. Until the first build finishes,
+    candidate_ids returns None and callers fall back to SQL.
+    """
+
+    def __init__(self):
+        self.enabled = settings.PRODUCT_INDEX_ENABLED
+        self.refresh_interval = settings.PRODUCT_INDEX_REFRESH_SECONDS
+        self.rebuild_interval = settings.PRODUCT_INDEX_REBUILD_SECONDS
+        self.max_dead_fraction = settings.PRODUCT_INDEX_MAX_DEAD_FRACTION
+
+        self._partitions: Dict[str, IndexPartition] = {}
+        self._watermark: Optional[datetime] = None
+        self._built_at: Optional[float] = None
+        self._runner: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "builds": 0,
+            "refreshes": 0,
+            "refreshed_rows": 0,
+            "failures": 0,
+            "lookups": 0,
+            "last_lookup_candidates": 0,
+            "last_build_seconds": None,
+        }
+
+    @property
+    def ready(self) -> bool:
+        """Whether a complete build has been published"""
+        return self._built_at is not None
+
+    async def start(self) -> None:
+        """Build the index and keep it fresh in the background"""
+        if not self.enabled or self._runner is not None:
+            return
+        self._runner = asyncio.create_task(self._run(), name="product-index")
+
+    async def stop(self) -> None:
+        """Stop background maintenance"""
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+
+    async def _run(self) -> None:
+        """Initial build, then periodic refreshes and rebuilds"""
+        while True:
+            try:
+                if not self.ready or time.monotonic() - self._built_at >= self.rebuild_interval:
+                    await asyncio.to_thread(self.rebuild)
+                else:
+                    await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"❌ Product index maintenance failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def rebuild(self) -> None:
+        """Build every partition from scratch and publish them (runs in a worker thread)"""
+        started = time.perf_counter()
+        rows_by_country: Dict[str, List[Any]] = defaultdict(list)
+        watermark = None
+
+        db = SessionLocal()
+        try:
+            query = db.query(*_index_columns()).execution_options(yield_per=LOAD_BATCH_SIZE)
+
+            for row in query:
+                rows_by_country[row.country].append(row)
+                if row.changed_at and (watermark is None or row.changed_at > watermark):
+                    watermark = row.changed_at
+        finally:
+            db.close()
+
+        partitions = {country: build_partition(rows) for country, rows in rows_by_country.items()}
+
+        self._partitions = partitions
+        self._watermark = watermark
+        self._built_at = time.monotonic()
+        self.stats["builds"] += 1
+        self.stats["last_build_seconds"] = round(time.perf_counter() - started, 3)
+
+        logger.info(f"✅ Product index built - {sum(p.size for p in partitions.values())} products, "
+                   f"{len(partitions)} countries in {self.stats['last_build_seconds']}s")
+
+    def refresh(self) -> None:
+        """Apply products changed since the last refresh (runs in a worker thread)"""
+        if self._watermark is None:
+            self.rebuild()
+            return
+
+        db = SessionLocal()
+        try:
+            rows = db.query(*_index_columns()).filter(_changed_at() > self._watermark - REFRESH_OVERLAP).all()
+        finally:
+            db.close()
+
+        partitions = self._partitions
+        changed: Dict[str, List[Any]] = defaultdict(list)
+        watermark = self._watermark
+
+        for row in rows:
+            if row.changed_at and row.changed_at > watermark:
+                watermark = row.changed_at
+
+            # Skip rows already indexed at this version (the overlap window re-reads them)
+            partition = partitions.get(row.country)
+            position = partition.positions.get(row.id) if partition else None
+            if position is not None and partition.changed_at[position] == naive_seconds(row.changed_at):
+                continue
+            changed[row.country].append(row)
+
+        if changed:
+            updated = dict(partitions)
+            for country, country_rows in changed.items():
+                updated[country] = build_partition(country_rows, partitions.get(country))
+
+            # A product that moved country leaves its old row behind in the previous partition
+            stale: Dict[str, List[int]] = defaultdict(list)
+            for country, country_rows in changed.items():
+                for row in country_rows:
+                    for other_country, partition in updated.items():
+                        if other_country != country and row.id in partition.positions:
+                            stale[other_country].append(partition.positions[row.id])
+            for country, stale_positions in stale.items():
+                partition = self._copy_with_alive(updated[country])
+                partition.alive[stale_positions] = False
+                updated[country] = partition
+
+            self._partitions = updated
+            changed_count = sum(len(country_rows) for country_rows in changed.values())
+            self.stats["refreshed_rows"] += changed_count
+            logger.info(f"🔄 Product index refreshed - {changed_count} changed products")
+
+        self._watermark = watermark
+        self.stats["refreshes"] += 1
+
+        if any(
+            partition.size and 1 - partition.live_count / partition.size > self.max_dead_fraction
+            for partition in self._partitions.values()
+        ):
+            logger.info("🔄 Product index compacting superseded rows")
+            self.rebuild()
+
+    @staticmethod
+    def _copy_with_alive(partition: IndexPartition) -> IndexPartition:
+        """Copy a partition with its own alive mask so the published one is not modified"""
+        return dataclasses.replace(partition, alive=partition.alive.copy())
+
+    def top_candidates(
+        self,
+        query: CandidateQuery,
+        required_ingredients: List[str],
+        limit: int
+    ) -> Optional[List[Tuple[Any, float]]]:
+        """
+        Score every product matching a compiled query and return the best
+
+        Args:
+            query: Compiled candidate query (country, alias classes, avoids, price)
+            required_ingredients: Normalised required ingredients, for position scoring
+            limit: Number of products to return
+
+        Returns:
+            (product id, score) pairs, best first, or None if the index is not ready
+        """
+        if not self.enabled or not self.ready:
+            return None
+
+        self.stats["lookups"] += 1
+        partition = self._partitions.get(query.country)
+        if partition is None:
+            return []
+
+        matches = partition.match(query)
+        self.stats["last_lookup_candidates"] = len(matches)
+
+        scores = partition.score(matches, required_ingredients)
+        best = top_k(scores, limit)
+        return [(partition.ids[matches[index]], float(scores[index])) for index in best]
+
+    def get_status(self) -> dict:
+        """Get index size and maintenance counters"""
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "products": {country: partition.live_count for country, partition in self._partitions.items()},
+            "terms": {country: len(partition.postings) for country, partition in self._partitions.items()},
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            **self.stats,
+        }
+
+
+# Global product index instance
+product_index = ProductIngredientIndex()
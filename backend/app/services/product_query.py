@@ -0,0 +1,92 @@
+"""
+Candidate query compiler for product matching
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.sql import ColumnElement, Select
+
+from ..models.product import Product
+from ..models.schemas import ProductMatchRequest
+from ..utils.ingredients import build_alias_classes, ingredient_alias_class
+
+
+@dataclass
+class CandidateQuery:
+    """
+    Compiled candidate filter for one match request
+
+    Every required ingredient becomes one alias class matched with a single
+    array-overlap (&&) test, and all avoided ingredients share one negated
+    overlap, so the statement has one GIN-indexable predicate per required
+    class instead of one containment test per alias. Country and price sit
+    in the same WHERE clause for the planner to combine with the GIN
+    bitmaps.
+    """
+    country: str
+    required_classes: List[List[str]] = field(default_factory=list)
+    avoid_terms: List[str] = field(default_factory=list)
+    max_price: Optional[float] = None
+
+    def conditions(self) -> list:
+        """WHERE clauses for the candidate query"""
+        clauses = [Product.country == self.country]
+
+        for alias_class in self.required_classes:
+            clauses.append(Product.ingredients_norm_set.overlap(alias_class))
+
+        if self.avoid_terms:
+            clauses.append(~Product.ingredients_norm_set.overlap(self.avoid_terms))
+
+        if self.max_price is not None:
+            clauses.append(or_(Product.price.is_(None), Product.price <= self.max_price))
+
+        return clauses
+
+    def statement(self, limit: int = 200) -> Select:
+        """Complete SELECT, freshest products first"""
+        return (
+            select(Product)
+            .where(*self.conditions())
+            .order_by(Product.last_seen.desc())
+            .limit(limit)
+        )
+
+    def ranked_statement(self, score: ColumnElement, limit: int) -> Select:
+        """SELECT of (product id, score) for the best-scoring candidates, ties by id"""
+        score = score.label("score")
+        return (
+            select(Product.id, score)
+            .where(*self.conditions())
+            .order_by(score.desc(), Product.id)
+            .limit(limit)
+        )
+
+
+def compile_candidate_query(
+    request: ProductMatchRequest,
+    required_terms: List[str],
+    avoid_terms: List[str]
+) -> CandidateQuery:
+    """
+    Compile a match request into a candidate query
+
+    Args:
+        request: Product matching request (country and price limit)
+        required_terms: Normalised required ingredients
+        avoid_terms: Normalised ingredients to avoid
+
+    Returns:
+        CandidateQuery with sorted term lists, so equal requests give identical SQL
+    """
+    avoid_union = set()
+    for ingredient in avoid_terms:
+        avoid_union |= ingredient_alias_class(ingredient)
+
+    return CandidateQuery(
+        country=request.country,
+        required_classes=[sorted(alias_class) for alias_class in build_alias_classes(required_terms)],
+        avoid_terms=sorted(avoid_union),
+        max_price=request.max_price
+    )
@@ -0,0 +1,133 @@
+"""
+Vectorised product scoring over the ingredient index
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..utils.ingredients import expand_ingredient_search_terms
+
+# Only the first positions of an INCI list earn position points
+LEADING_POSITIONS = 10
+
+# Retailer reputation points; unknown retailers get DEFAULT_RETAILER_SCORE
+RETAILER_SCORES = {
+    'boots': 10,
+    'amazon': 8,
+    'superdrug': 7,
+    'lookfantastic': 6
+}
+DEFAULT_RETAILER_SCORE = 5
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def naive_seconds(value: Optional[datetime]) -> float:
+    """
+    Seconds since 1970 of a timestamp's wall-clock time, ignoring its zone
+
+    Matches _calculate_score, which drops the timezone before comparing
+    with datetime.now(). NaN when missing.
+    """
+    if value is None:
+        return np.nan
+    return (value.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def retailer_score(retailer: Optional[str]) -> float:
+    """Reputation points for a retailer"""
+    return float(RETAILER_SCORES.get((retailer or '').lower(), DEFAULT_RETAILER_SCORE))
+
+
+def encode_leading_terms(ingredients_norm: Optional[List[str]], term_ids: Dict[str, int]) -> List[int]:
+    """
+    Encode the first LEADING_POSITIONS ingredients as term ids, padded with -1
+
+    Args:
+        ingredients_norm: Ordered normalised ingredient list
+        term_ids: Vocabulary, extended in place with unseen terms
+
+    Returns:
+        LEADING_POSITIONS term ids
+    """
+    encoded = []
+    for term in (ingredients_norm or [])[:LEADING_POSITIONS]:
+        term_id = term_ids.get(term)
+        if term_id is None:
+            term_id = len(term_ids)
+            term_ids[term] = term_id
+        encoded.append(term_id)
+    return encoded + [-1] * (LEADING_POSITIONS - len(encoded))
+
+
+def score_candidates(
+    leading_terms: np.ndarray,
+    term_ids: Dict[str, int],
+    last_seen: np.ndarray,
+    price_per_ml: np.ndarray,
+    retailer_scores: np.ndarray,
+    required_ingredients: List[str],
+    now: Optional[datetime] = None
+) -> np.ndarray:
+    """
+    Score many products at once, equivalent to ProductService._calculate_score
+
+    Args:
+        leading_terms: (n, LEADING_POSITIONS) term ids of each product's first ingredients
+        term_ids: Vocabulary used to encode leading_terms
+        last_seen: Naive seconds (see naive_seconds), NaN when unknown
+        price_per_ml: Price per ml, NaN when unknown
+        retailer_scores: Reputation points per product
+        required_ingredients: Normalised required ingredients
+        now: Reference time for freshness (default datetime.now())
+
+    Returns:
+        float array of scores rounded to 2 decimals
+    """
+    scores = np.zeros(len(leading_terms), dtype=np.float64)
+    if not len(leading_terms):
+        return scores
+
+    # Ingredient position (max 50 points per ingredient, "water" never counts)
+    water_id = term_ids.get('water', -2)
+    points_by_position = (LEADING_POSITIONS - np.arange(LEADING_POSITIONS)) * 5.0
+    for ingredient in required_ingredients:
+        alias_ids = [term_ids[term] for term in expand_ingredient_search_terms([ingredient]) if term in term_ids]
+        if not alias_ids:
+            continue
+
+        hits = np.isin(leading_terms, alias_ids) & (leading_terms != water_id)
+        first = hits.argmax(axis=1)
+        scores += np.where(hits[np.arange(len(hits)), first], points_by_position[first], 0.0)
+
+    # Freshness (max 20 points, whole days old on a 30-day scale)
+    reference = naive_seconds(now or datetime.now())
+    days_old = np.floor((reference - last_seen) / 86400)
+    freshness = np.maximum(0.0, 20 - days_old / 30 * 20)
+    scores += np.where(np.isnan(last_seen), 0.0, freshness)
+
+    # Price efficiency (max 20 points)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_points = np.minimum(20.0, 100 / price_per_ml)
+    scores += np.where(price_per_ml > 0, price_points, 0.0)
+
+    # Retailer reputation (max 10 points)
+    scores += retailer_scores
+
+    return np.round(scores, 2)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first
+
+    Uses argpartition so only the selected k are fully sorted.
+    """
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > k:
+        selected = np.argpartition(-scores, k - 1)[:k]
+    else:
+        selected = np.arange(len(scores))
+    return selected[np.argsort(-scores[selected], kind='stable')]
@@ -11,6 +11,8 @@ from fastapi import HTTPException, Depends
 import redis
 import json
 import hashlib
+import base64
+import bisect
 
 from ..models.database import get_db
 from ..models.product import Product, LiveSnapshot
@@ -23,12 +25,38 @@ from ..utils.ingredients import (
 )
 from ..utils.pricing import format_price
 from ..config import settings
+from .product_query import CandidateQuery, compile_candidate_query
+from .product_index import product_index
+from .product_features import features_current, score_expression
+from .ttl_store import TTLStore
+from .product_scoring import DEFAULT_RETAILER_SCORE, RETAILER_SCORES
 from .retailers.amazon_rainforest import AmazonRainforestAdapter
 from .retailers.boots import BootsAdapter
 
 logger = logging.getLogger(__name__)
 
 
+def _encode_cursor(ranking_key: str, score: float, product_id: str) -> str:
+    """Opaque cursor for the position after (score, product_id) in a ranking"""
+    payload = json.dumps({"k": ranking_key, "s": score, "i": product_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, float, str]:
+    """
+    Decode a cursor from _encode_cursor
+    
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(payload["k"]), float(payload["s"]), str(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 class ProductService:
     """Service for product matching and live verification"""
     
@@ -58,6 +86,18 @@ class ProductService:
         self.country_whitelist = getattr(settings, 'COUNTRY_WHITELIST', 'GB').split(',')
         self.cache_duration = 15 * 60  # 15 minutes
         
+        # In-memory inverted ingredient index (falls back to SQL until built)
+        self.index = product_index
+        
+        # Pagination: each ranking is cached so later pages reuse it
+        self.max_page_size = settings.PRODUCT_MATCH_MAX_PAGE_SIZE
+        self.ranking_size = settings.PRODUCT_MATCH_RANKING_SIZE
+        self.rankings = TTLStore(
+            "products:ranking:",
+            settings.PRODUCT_MATCH_RANKING_TTL_SECONDS,
+            settings.PRODUCT_MATCH_RANKING_MAX_ENTRIES
+        )
+        
     def validate_request(self, request: ProductMatchRequest) -> None:
         """
         Validate product match request
@@ -89,6 +129,13 @@ class ProductService:
                 detail="Maximum price must be greater than 0"
             )
         
+        # Validate page size
+        if request.page_size is not None and not 1 <= request.page_size <= self.max_page_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Page size must be between 1 and {self.max_page_size}"
+            )
+        
         logger.info(f"✅ Product match request validated - Country: {request.country}, "
                    f"Required: {len(request.required_ingredients)}, "
                    f"Avoid: {len(request.avoid_ingredients or [])}")
@@ -102,42 +149,124 @@ class ProductService:
         
         return required_normalised, avoid_normalised
     
-    def _build_candidate_query(
-        self, 
-        db: Session, 
-        request: ProductMatchRequest, 
-        required_terms: List[str],
-        avoid_terms: List[str]
-    ):
-        """Build SQLAlchemy query for candidate products"""
-        query = db.query(Product).filter(Product.country == request.country)
-        
-        # Expand search terms to include aliases
-        required_search_terms = expand_ingredient_search_terms(required_terms)
-        avoid_search_terms = expand_ingredient_search_terms(avoid_terms) if avoid_terms else set()
-        
-        # Filter by required ingredients (must contain ALL)
-        for term in required_search_terms:
-            query = query.filter(Product.ingredients_norm_set.contains([term]))
-        
-        # Filter by avoid ingredients (must contain NONE)
-        if avoid_search_terms:
-            for term in avoid_search_terms:
-                query = query.filter(~Product.ingredients_norm_set.contains([term]))
-        
-        # Price filter
-        if request.max_price is not None:
-            query = query.filter(
-                or_(
-                    Product.price.is_(None),
-                    Product.price <= request.max_price
-                )
-            )
-        
+    def _build_candidate_query(self, db: Session, candidate_query: CandidateQuery):
+        """Build SQLAlchemy query for candidate products (one overlap test per alias class)"""
         # Order by last seen (fresher data first)
-        query = query.order_by(Product.last_seen.desc())
+        return (
+            db.query(Product)
+            .filter(*candidate_query.conditions())
+            .order_by(Product.last_seen.desc())
+        )
+    
+    def _rank_candidates(
+        self,
+        db: Session,
+        candidate_query: CandidateQuery,
+        required_normalised: List[str]
+    ) -> List[Tuple[str, float]]:
+        """
+        Rank candidate products, best first (ties by id; runs in a worker thread)
+        
+        With the ingredient index ready, every matching product is scored
+        at once in NumPy. Until then the ranking runs in SQL over the
+        stored scoring features, or, when a required ingredient has no
+        stored feature or the startup backfill of stale features has not
+        finished, the 200 freshest SQL candidates are scored one by one.
+        Only ids and scores are returned; product rows are loaded per page.
+        
+        Returns:
+            Up to ranking_size (product id, score) pairs
+        """
+        logger.info(f"🧮 Candidate query - {len(candidate_query.required_classes)} required alias classes, "
+                   f"{len(candidate_query.avoid_terms)} avoided terms")
+        
+        ranked = self.index.top_candidates(candidate_query, required_normalised, self.ranking_size)
+        score = score_expression(required_normalised) if ranked is None and features_current() else None
+        if score is not None:
+            ranked = db.execute(candidate_query.ranked_statement(score, self.ranking_size)).all()
+            logger.info("🗄️ Ranked candidates in SQL over stored scoring features")
+        elif ranked is None:
+            if not features_current():
+                logger.info("🐢 Stored scoring features not refreshed yet - scoring candidates in Python")
+            candidates = self._build_candidate_query(db, candidate_query).limit(200).all()
+            ranked = [(product.id, self._calculate_score(product, required_normalised)) for product in candidates]
+        else:
+            logger.info(f"⚡ Scored {self.index.stats['last_lookup_candidates']} candidates from the ingredient index")
         
-        return query
+        ranking = sorted(((str(product_id), float(value)) for product_id, value in ranked), key=lambda x: (-x[1], x[0]))
+        return ranking[:self.ranking_size]
+    
+    def _ranking_key(self, request: ProductMatchRequest, required_normalised: List[str], avoid_normalised: List[str]) -> str:
+        """Cache key of a ranking: everything that filters or scores, nothing that pages"""
+        key_data = {
+            'country': request.country,
+            'required': sorted(required_normalised),
+            'avoid': sorted(avoid_normalised),
+            'max_price': request.max_price
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()[:32]
+    
+    async def _get_ranking(
+        self,
+        db: Session,
+        ranking_key: str,
+        candidate_query: CandidateQuery,
+        required_normalised: List[str]
+    ) -> List[Tuple[str, float]]:
+        """Cached ranking for a match, computed on a miss"""
+        cached = await self.rankings.get(ranking_key)
+        if cached is not None:
+            logger.info(f"♻️ Reusing cached ranking {ranking_key}")
+            return [(product_id, score) for product_id, score in json.loads(cached)]
+        
+        # Index scoring of a whole country partition (or the SQL fallback) blocks, so keep it off the event loop
+        ranking = await asyncio.to_thread(self._rank_candidates, db, candidate_query, required_normalised)
+        await self.rankings.set(ranking_key, json.dumps(ranking))
+        return ranking
+    
+    def _page_start(self, ranking: List[Tuple[str, float]], ranking_key: str, cursor: Optional[str]) -> int:
+        """
+        Index in the ranking where the page after a cursor starts
+        
+        Keyset pagination on (score desc, id): if the ranking was rebuilt
+        since the cursor was issued, the page still starts after the last
+        product the client saw.
+        
+        Raises:
+            HTTPException: 400 if the cursor belongs to a different match
+        """
+        if not cursor:
+            return 0
+        
+        cursor_key, score, product_id = _decode_cursor(cursor)
+        if cursor_key != ranking_key:
+            raise HTTPException(status_code=400, detail="Cursor does not belong to this match request")
+        
+        return bisect.bisect_right([(-value, key) for key, value in ranking], (-score, product_id))
+    
+    def _load_page(
+        self,
+        db: Session,
+        page: List[Tuple[str, float]],
+        required_normalised: List[str],
+        avoid_normalised: List[str]
+    ) -> List[Tuple[Product, float]]:
+        """Load a page of ranked products, in ranking order"""
+        if not page:
+            return []
+        
+        products = {str(product.id): product for product in db.query(Product).filter(Product.id.in_([key for key, _ in page])).all()}
+        
+        scored_products = []
+        for product_id, score in page:
+            product = products.get(product_id)
+            # Double-check ingredient matching (redundant safety check)
+            if (product is not None and
+                check_ingredient_match(product.ingredients_norm or [], required_normalised) and
+                not check_avoid_ingredients(product.ingredients_norm or [], avoid_normalised)):
+                scored_products.append((product, score))
+        
+        return scored_products
     
     def _calculate_score(self, product: Product, required_ingredients: List[str]) -> float:
         """
@@ -172,17 +301,11 @@ class ProductService:
         # Price efficiency scoring (max 20 points)
         if product.price_per_ml and product.price_per_ml > 0:
             # Inverse relationship: lower price per ml = higher score
-            price_score = min(20, 100 / product.price_per_ml)
+            price_score = min(20, 100 / float(product.price_per_ml))
             score += price_score
         
         # Retailer reputation scoring (max 10 points)
-        retailer_scores = {
-            'boots': 10,
-            'amazon': 8,
-            'superdrug': 7,
-            'lookfantastic': 6
-        }
-        score += retailer_scores.get(product.retailer.lower(), 5)
+        score += RETAILER_SCORES.get(product.retailer.lower(), DEFAULT_RETAILER_SCORE)
         
         return round(score, 2)
     
@@ -232,8 +355,8 @@ class ProductService:
     ) -> List[Tuple[Product, float, Dict]]:
         """Perform concurrent live verification on top products"""
         
-        # Limit to top N products for live checking
-        products_to_check = products[:self.top_n_live_check]
+        # Callers pass one page, at most max_page_size products
+        products_to_check = products[:self.max_page_size]
         
         async def verify_single_product(product_score_pair: Tuple[Product, float]) -> Tuple[Product, float, Dict]:
             product, score = product_score_pair
@@ -372,33 +495,29 @@ class ProductService:
             # Normalise ingredients
             required_normalised, avoid_normalised = self._normalise_request_ingredients(request)
             
-            # Build and execute candidate query
-            query = self._build_candidate_query(db, request, required_normalised, avoid_normalised)
-            candidates = query.limit(200).all()  # Limit initial candidates
+            # Rank candidates (ingredient index, or SQL until it is built), reusing the ranking across pages
+            candidate_query = compile_candidate_query(request, required_normalised, avoid_normalised)
+            ranking_key = self._ranking_key(request, required_normalised, avoid_normalised)
+            ranking = await self._get_ranking(db, ranking_key, candidate_query, required_normalised)
+            
+            # Slice the requested page; only it is loaded and verified
+            start = self._page_start(ranking, ranking_key, request.cursor)
+            page = ranking[start:start + (request.page_size or self.top_n_live_check)]
+            next_cursor = None
+            if page and start + len(page) < len(ranking):
+                next_cursor = _encode_cursor(ranking_key, page[-1][1], page[-1][0])
             
-            logger.info(f"📊 Found {len(candidates)} candidate products")
+            scored_products = self._load_page(db, page, required_normalised, avoid_normalised)
             
-            if not candidates:
+            if not scored_products:
                 return ProductMatchResponse(
                     generated_at=datetime.now().isoformat(),
                     currency=request.currency or settings.CURRENCY,
-                    results=[]
+                    results=[],
+                    next_cursor=next_cursor
                 )
             
-            # Calculate scores and sort
-            scored_products = []
-            for product in candidates:
-                # Double-check ingredient matching (redundant safety check)
-                if (check_ingredient_match(product.ingredients_norm or [], required_normalised) and
-                    not check_avoid_ingredients(product.ingredients_norm or [], avoid_normalised)):
-                    
-                    score = self._calculate_score(product, required_normalised)
-                    scored_products.append((product, score))
-            
-            # Sort by score (highest first)
-            scored_products.sort(key=lambda x: x[1], reverse=True)
-            
-            logger.info(f"🎯 Scored {len(scored_products)} matching products")
+            logger.info(f"🎯 Page of {len(scored_products)} products from a ranking of {len(ranking)}")
             
             # Perform live verification on top products
             postcode = None
@@ -449,7 +568,8 @@ class ProductService:
             return ProductMatchResponse(
                 generated_at=datetime.now().isoformat(),
                 currency=request.currency or settings.CURRENCY,
-                results=results
+                results=results,
+                next_cursor=next_cursor
             )
             
         except HTTPException:
@@ -0,0 +1,219 @@
+"""
+Token budgeting for skin analysis prompts and completions
+"""
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+
+def _load_encoding():
+    """
+    Load the tokenizer for the configured model, if tiktoken is installed
+
+    tiktoken downloads encodings on first use, so any failure (unknown
+    model, no network) falls back to length-based estimates.
+    """
+    if tiktoken is None:
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"⚠️ Tokenizer unavailable, estimating tokens from length: {e}")
+        return None
+
+
+class PromptBudget:
+    """
+    Keeps analysis prompts and completions within fixed token budgets
+
+    User-supplied survey text is trimmed to per-field limits before it is
+    rendered into the prompt, and every request is measured so the static
+    system prefix, dynamic user text and completion cap are reported together.
+    """
+
+    def __init__(self):
+        self.max_completion_tokens = settings.OPENAI_MAX_COMPLETION_TOKENS
+        self.max_user_context_tokens = settings.PROMPT_MAX_USER_CONTEXT_TOKENS
+        self.max_list_items = settings.PROMPT_MAX_LIST_ITEMS
+        self.max_list_item_tokens = settings.PROMPT_MAX_LIST_ITEM_TOKENS
+
+        # Loaded on first use (or by load_encoding at startup), never at import
+        self._encoding = None
+        self._encoding_loaded = False
+        self._encoding_lock = threading.Lock()
+        self._static_prefix_tokens: Optional[int] = None
+
+        self.stats = {
+            "requests": 0,
+            "trimmed_requests": 0,
+            "prompt_tokens_total": 0,
+            "prompt_tokens_max": 0,
+            "truncated_completions": 0,
+        }
+
+    def load_encoding(self, blocking: bool = True) -> None:
+        """
+        Load the tokenizer once (may download, so prefer a worker thread)
+
+        Args:
+            blocking: Wait for a load already running in another thread
+        """
+        if self._encoding_loaded or not self._encoding_lock.acquire(blocking=blocking):
+            return
+        try:
+            if not self._encoding_loaded:
+                self._encoding = _load_encoding()
+                self._encoding_loaded = True
+        finally:
+            self._encoding_lock.release()
+
+    @property
+    def encoding(self):
+        """Tokenizer, or None while it is unavailable or still loading elsewhere"""
+        self.load_encoding(blocking=False)
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count tokens in text
+
+        Args:
+            text: Text to measure
+
+        Returns:
+            Token count (approximated as characters / 4 without a tokenizer)
+        """
+        if not text:
+            return 0
+        encoding = self.encoding
+        if encoding is None:
+            return len(text) // 4 + 1
+        return len(encoding.encode(text))
+
+    def _truncate(self, text: str, max_tokens: int) -> Tuple[str, bool]:
+        """Truncate text to a token limit on a token boundary"""
+        encoding = self.encoding
+        if encoding is None:
+            max_chars = max_tokens * 4
+            if len(text) <= max_chars:
+                return text, False
+            return text[:max_chars].rstrip() + "…", True
+
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text, False
+        return encoding.decode(tokens[:max_tokens]).rstrip() + "…", True
+
+    def _fit_list(self, items: List[Any]) -> Tuple[List[str], bool]:
+        """Cap a list's length and the size of each entry"""
+        trimmed = len(items) > self.max_list_items
+        fitted = []
+        for item in items[:self.max_list_items]:
+            text, item_trimmed = self._truncate(str(item), self.max_list_item_tokens)
+            trimmed = trimmed or item_trimmed
+            fitted.append(text)
+        return fitted, trimmed
+
+    def fit_survey_data(
+        self,
+        survey_data: Optional[Dict[str, Any]]
+    ) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """
+        Trim oversized survey fields to their budgets
+
+        Args:
+            survey_data: Optional user survey data for personalization
+
+        Returns:
+            Tuple of (fitted survey data, names of fields that were trimmed)
+        """
+        if not survey_data:
+            return survey_data, []
+
+        fitted = dict(survey_data)
+        trimmed_fields = []
+
+        if fitted.get('userContext'):
+            fitted['userContext'], trimmed = self._truncate(
+                str(fitted['userContext']), self.max_user_context_tokens
+            )
+            if trimmed:
+                trimmed_fields.append('userContext')
+
+        for field in ('safetyWarnings', 'ageRecommendations'):
+            items = fitted.get(field) or []
+            if not isinstance(items, list):
+                items = [items]
+            fitted[field], trimmed = self._fit_list(items)
+            if trimmed:
+                trimmed_fields.append(field)
+
+        return fitted, trimmed_fields
+
+    def measure(self, system_prompt: str, user_prompt: str, trimmed_fields: List[str]) -> dict:
+        """
+        Measure one request against the budget and record it
+
+        Args:
+            system_prompt: Static system prompt
+            user_prompt: Per-request user text
+            trimmed_fields: Survey fields trimmed by fit_survey_data
+
+        Returns:
+            Per-request budget report
+        """
+        # The system prompt is a constant, so it only needs counting once -
+        # but not while the tokenizer is still loading and the count is an estimate
+        static_tokens = self._static_prefix_tokens
+        if static_tokens is None:
+            encoding_loaded = self._encoding_loaded
+            static_tokens = self.count_tokens(system_prompt)
+            if encoding_loaded:
+                self._static_prefix_tokens = static_tokens
+
+        user_tokens = self.count_tokens(user_prompt)
+        prompt_tokens = static_tokens + user_tokens
+
+        self.stats["requests"] += 1
+        self.stats["prompt_tokens_total"] += prompt_tokens
+        self.stats["prompt_tokens_max"] = max(self.stats["prompt_tokens_max"], prompt_tokens)
+        if trimmed_fields:
+            self.stats["trimmed_requests"] += 1
+
+        return {
+            "static_prefix_tokens": static_tokens,
+            "user_text_tokens": user_tokens,
+            "prompt_text_tokens": prompt_tokens,
+            "max_completion_tokens": self.max_completion_tokens,
+            "trimmed_fields": trimmed_fields,
+        }
+
+    def record_truncated_completion(self) -> None:
+        """Record a completion that stopped at the token cap"""
+        self.stats["truncated_completions"] += 1
+
+    def get_status(self) -> dict:
+        """Get budget configuration and aggregate measurements"""
+        requests = self.stats["requests"]
+        return {
+            "tokenizer": self._encoding.name if self._encoding is not None else ("estimate" if self._encoding_loaded else "loading"),
+            "max_completion_tokens": self.max_completion_tokens,
+            "max_user_context_tokens": self.max_user_context_tokens,
+            "max_list_items": self.max_list_items,
+            "static_prefix_tokens": self._static_prefix_tokens,
+            "prompt_tokens_avg": round(self.stats["prompt_tokens_total"] / requests, 1) if requests else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,186 @@
+"""
+Per-caller rate limiting for LLM-backed endpoints
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.services.redis_client import get_redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Atomic token bucket: refill by elapsed time, then take one token if available.
+# Uses the Redis clock so every worker sees the same time.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+def client_ip(request: Request) -> str:
+    """
+    Client address used as the rate limit key for anonymous callers
+
+    With RATE_LIMIT_TRUSTED_PROXIES set, the address is read from
+    X-Forwarded-For at that position from the right, so entries a client
+    adds itself are ignored.
+    """
+    trusted = settings.RATE_LIMIT_TRUSTED_PROXIES
+    forwarded = request.headers.get("X-Forwarded-For")
+    if trusted > 0 and forwarded:
+        hops: List[str] = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(trusted, len(hops))]
+
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """
+    Token bucket per caller: a burst allowance refilled at a steady rate
+
+    Signed-in callers are keyed by Firebase uid and anonymous callers by
+    client IP, each with its own rate. Buckets are kept in-process, or in
+    Redis when RATE_LIMIT_REDIS is on and REDIS_URL is reachable so all
+    workers share one budget per caller. If Redis fails mid-request the
+    in-process bucket is used rather than rejecting the request.
+    """
+
+    def __init__(self):
+        self.enabled = settings.RATE_LIMIT_ENABLED
+        self.key_prefix = "ratelimit:analysis:"
+        self.max_tracked = settings.RATE_LIMIT_MAX_TRACKED_CALLERS
+
+        # key -> [tokens, updated_at]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        self.stats = {
+            "allowed": 0,
+            "limited": 0,
+            "redis_errors": 0,
+        }
+
+    @property
+    def redis_client(self):
+        """Redis client for shared buckets, if enabled"""
+        if not settings.RATE_LIMIT_REDIS:
+            return None
+        return get_redis_client()
+
+    @staticmethod
+    def _limits(authenticated: bool) -> Tuple[float, int]:
+        """Refill rate (tokens per second) and burst size for a kind of caller"""
+        if authenticated:
+            return settings.RATE_LIMIT_USER_PER_MINUTE / 60, settings.RATE_LIMIT_USER_BURST
+        return settings.RATE_LIMIT_ANONYMOUS_PER_MINUTE / 60, settings.RATE_LIMIT_ANONYMOUS_BURST
+
+    def _take_memory(self, key: str, rate: float, capacity: int) -> Tuple[bool, float]:
+        """Take a token from the in-process bucket"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(capacity), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_tracked:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return True, 0.0
+
+        bucket[0] = tokens
+        return False, (1 - tokens) / rate
+
+    async def _take(self, key: str, rate: float, capacity: int) -> Tuple[bool, float]:
+        """Take a token from the shared bucket, falling back to the in-process one"""
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                allowed, retry_after = await asyncio.to_thread(
+                    redis_client.eval, _TOKEN_BUCKET_SCRIPT, 1, self.key_prefix + key, rate, capacity
+                )
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"⚠️ Rate limit check in Redis failed, using in-process bucket: {e}")
+
+        return self._take_memory(key, rate, capacity)
+
+    async def check(self, firebase_uid: Optional[str], ip_address: str) -> None:
+        """
+        Spend one request from the caller's budget
+
+        Args:
+            firebase_uid: Signed-in caller's Firebase uid, or None if anonymous
+            ip_address: Client address, used for anonymous callers
+
+        Raises:
+            HTTPException: 429 with Retry-After if the caller is over their limit
+        """
+        if not self.enabled:
+            return
+
+        authenticated = firebase_uid is not None
+        key = f"uid:{firebase_uid}" if authenticated else f"ip:{ip_address}"
+        rate, capacity = self._limits(authenticated)
+        if rate <= 0:
+            return
+
+        allowed, retry_after = await self._take(key, rate, capacity)
+        if allowed:
+            self.stats["allowed"] += 1
+            return
+
+        self.stats["limited"] += 1
+        logger.info(f"🚦 Rate limited {'signed-in' if authenticated else 'anonymous'} caller {key}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many analysis requests. Please wait before trying again.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def get_status(self) -> dict:
+        """Get limits and counters"""
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if self.redis_client else "memory",
+            "user_per_minute": settings.RATE_LIMIT_USER_PER_MINUTE,
+            "user_burst": settings.RATE_LIMIT_USER_BURST,
+            "anonymous_per_minute": settings.RATE_LIMIT_ANONYMOUS_PER_MINUTE,
+            "anonymous_burst": settings.RATE_LIMIT_ANONYMOUS_BURST,
+            "tracked_callers": len(self._buckets),
+            **self.stats,
+        }
+
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
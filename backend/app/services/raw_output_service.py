@@ -0,0 +1,335 @@
+"""
+Storage and re-parsing of raw LLM completions
+"""
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Set
+
+from fastapi import HTTPException
+
+from app.models.database import SessionLocal
+from app.models.schemas import SkinAnalysisResponse
+from app.services.database_service import DatabaseService
+from app.services.ttl_store import TTLStore
+from app.utils.parsing import (
+    parse_skin_analysis_response,
+    parse_skin_classification_response,
+    merge_two_phase_response
+)
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# How a stored output is turned back into a SkinAnalysisResponse
+FORMAT_ANALYSIS = "analysis"  # One complete response
+FORMAT_TWO_PHASE = "two_phase"  # JSON object with "classification" and "recommendations" texts
+
+
+def parse_stored_output(output_format: str, raw_output: str) -> SkinAnalysisResponse:
+    """
+    Parse a stored raw output with the current parser and schema
+
+    Args:
+        output_format: FORMAT_ANALYSIS or FORMAT_TWO_PHASE
+        raw_output: Decompressed raw output
+
+    Returns:
+        Validated SkinAnalysisResponse
+
+    Raises:
+        HTTPException: If the output does not parse
+    """
+    if output_format == FORMAT_TWO_PHASE:
+        parts = json.loads(raw_output)
+        classification = parse_skin_classification_response(parts["classification"])
+        return merge_two_phase_response(classification, parts["recommendations"])
+
+    return parse_skin_analysis_response(raw_output)
+
+
+def describe_parse_error(error: Exception) -> str:
+    """Short description of a parse failure"""
+    return str(error.detail) if isinstance(error, HTTPException) else f"{type(error).__name__}: {error}"
+
+
+class RawOutputStore:
+    """
+    Keeps every raw completion, compressed, under its analysis cache key
+
+    Saving is fire-and-forget so the request never waits on the database.
+    A failed parse no longer loses the completion: a repeat of the same
+    request (same cache key) within the result cache TTL re-parses the
+    stored output instead of calling the model again, and schema changes
+    can be applied to stored outputs in bulk with reparse_stored_outputs.
+    Outputs that parsed are never served from here (the result cache
+    covers them), and rows older than RAW_OUTPUT_RETENTION_DAYS are purged.
+    """
+
+    def __init__(self):
+        self.enabled = settings.RAW_OUTPUT_STORAGE_ENABLED
+        self.compression_level = settings.RAW_OUTPUT_COMPRESSION_LEVEL
+        self.retention_days = settings.RAW_OUTPUT_RETENTION_DAYS
+        self._pending: Set[asyncio.Task] = set()
+
+        # Cache keys whose completion failed to parse, so only those cost a database lookup
+        self.failed_keys = TTLStore(
+            "analysis:parse_failed:",
+            settings.ANALYSIS_CACHE_TTL_SECONDS,
+            settings.ANALYSIS_CACHE_MAX_ENTRIES
+        )
+
+        self.stats = {
+            "saved": 0,
+            "save_failures": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+            "repaired": 0,
+            "repair_failures": 0,
+            "purged": 0,
+        }
+
+    def save(
+        self,
+        cache_key: str,
+        raw_output: str,
+        output_format: str = FORMAT_ANALYSIS,
+        parse_error: Optional[str] = None
+    ) -> None:
+        """
+        Store a raw output in the background
+
+        Args:
+            cache_key: Analysis cache key the output answers
+            raw_output: Raw model text (two-phase: JSON of both texts)
+            output_format: FORMAT_ANALYSIS or FORMAT_TWO_PHASE
+            parse_error: Why parsing failed, or None if it succeeded
+        """
+        if not self.enabled:
+            return
+
+        raw_bytes = raw_output.encode("utf-8")
+        compressed = zlib.compress(raw_bytes, self.compression_level)
+        record = {
+            "cache_key": cache_key,
+            "output_format": output_format,
+            "model": settings.OPENAI_MODEL,
+            "raw_output": compressed,
+            "raw_size": len(raw_bytes),
+            "parse_ok": parse_error is None,
+            "parse_error": parse_error,
+        }
+
+        self.stats["raw_bytes"] += len(raw_bytes)
+        self.stats["stored_bytes"] += len(compressed)
+
+        self._spawn(self._write(record))
+
+    def _spawn(self, coroutine) -> None:
+        """Run a background task, tracked so shutdown can wait for it"""
+        task = asyncio.create_task(coroutine)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _write(self, record: Dict[str, Any]) -> None:
+        """Upsert one record off the event loop"""
+        try:
+            stored = await asyncio.to_thread(self._upsert, record)
+        except Exception as e:
+            logger.error(f"❌ Failed to store raw LLM output: {e}")
+            stored = False
+
+        if stored:
+            self.stats["saved"] += 1
+            if not record["parse_ok"]:
+                await self.failed_keys.set(record["cache_key"], "1")
+        else:
+            self.stats["save_failures"] += 1
+
+    @staticmethod
+    def _upsert(record: Dict[str, Any]) -> bool:
+        """Store a record (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            return DatabaseService(db).upsert_llm_output(record)
+        finally:
+            db.close()
+
+    async def repair(self, cache_key: str, analysis_id: int) -> Optional[SkinAnalysisResponse]:
+        """
+        Try to answer a request whose stored output failed to parse
+
+        Only cache keys recorded as failed within the result cache TTL are
+        looked up, so other requests never wait on the database.
+
+        Args:
+            cache_key: Analysis cache key of the request
+            analysis_id: Analysis identifier for logging
+
+        Returns:
+            Parsed response, or None if nothing failed, caching is disabled
+            or the output still does not parse
+        """
+        if not self.enabled or not settings.ANALYSIS_CACHE_ENABLED:
+            return None
+        if await self.failed_keys.get(cache_key) is None:
+            return None
+
+        try:
+            stored = await asyncio.to_thread(self._load, cache_key)
+        except Exception as e:
+            logger.error(f"❌ Failed to load raw LLM output: {e}")
+            return None
+        if stored is None:
+            return None
+
+        output_format, raw_output = stored
+        try:
+            response = parse_stored_output(output_format, raw_output)
+        except Exception as e:
+            self.stats["repair_failures"] += 1
+            logger.info(f"🔁 Stored output for analysis {analysis_id} still does not parse: {describe_parse_error(e)}")
+            return None
+
+        self.stats["repaired"] += 1
+        logger.info(f"🔁 Skin analysis {analysis_id} served from a stored raw output that previously failed to parse")
+
+        await asyncio.to_thread(self._record_results, [{
+            "cache_key": cache_key, "parse_ok": True, "parse_error": None
+        }])
+        await self.failed_keys.delete(cache_key)
+        return response
+
+    @staticmethod
+    def _load(cache_key: str) -> Optional[tuple]:
+        """Load and decompress a stored output that failed to parse (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            output = DatabaseService(db).get_llm_output(cache_key, only_failed=True)
+            if output is None:
+                return None
+            return output.output_format, zlib.decompress(output.raw_output).decode("utf-8")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _record_results(results: list) -> None:
+        """Record parse outcomes (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            DatabaseService(db).update_llm_output_parse_results(results)
+        finally:
+            db.close()
+
+    def start_purge(self) -> None:
+        """Purge outputs past the retention period in the background (called on startup)"""
+        if self.retention_days > 0:
+            self._spawn(self._purge())
+
+    async def _purge(self) -> None:
+        """Delete expired outputs off the event loop"""
+        try:
+            deleted = await asyncio.to_thread(purge_stored_outputs, self.retention_days)
+        except Exception as e:
+            logger.error(f"❌ Failed to purge raw LLM outputs: {e}")
+            return
+        self.stats["purged"] += deleted or 0
+
+    async def flush(self) -> None:
+        """Wait for background saves to finish (used on shutdown)"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def get_status(self) -> dict:
+        """Get storage counters"""
+        return {
+            "enabled": self.enabled,
+            "retention_days": self.retention_days,
+            "pending_writes": len(self._pending),
+            "compression_ratio": round(self.stats["raw_bytes"] / self.stats["stored_bytes"], 2)
+            if self.stats["stored_bytes"] else None,
+            **self.stats,
+        }
+
+
+def reparse_stored_outputs(only_failed: bool = False, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Re-run parsing and validation over every stored raw output
+
+    Used after parser or schema changes: outputs that now parse are marked
+    ok, outputs that no longer parse are flagged with the error. Runs synchronously; call it from a script or a thread.
+
+    Args:
+        only_failed: Only revisit outputs whose last parse failed
+        batch_size: Rows per page and per status update transaction
+
+    Returns:
+        Counts of outputs checked, parsed, failed and changed status
+    """
+    counts = {"checked": 0, "parsed": 0, "failed": 0, "changed": 0}
+    after_key = None
+
+    db = SessionLocal()
+    try:
+        service = DatabaseService(db)
+        while True:
+            page = service.get_llm_outputs_page(after_key, batch_size, only_failed)
+            if not page:
+                break
+
+            results = []
+            for output in page:
+                try:
+                    parse_stored_output(output.output_format, zlib.decompress(output.raw_output).decode("utf-8"))
+                    parse_error = None
+                except Exception as e:
+                    parse_error = describe_parse_error(e)
+
+                ok = parse_error is None
+                counts["checked"] += 1
+                counts["parsed" if ok else "failed"] += 1
+                if ok != output.parse_ok or parse_error != output.parse_error:
+                    counts["changed"] += ok != output.parse_ok
+                    results.append({"cache_key": output.cache_key, "parse_ok": ok, "parse_error": parse_error})
+
+            if results:
+                service.update_llm_output_parse_results(results)
+            after_key = page[-1].cache_key
+            # Rows are not needed once their page is processed
+            db.expunge_all()
+    finally:
+        db.close()
+
+    logger.info(f"🔁 Re-parsed {counts['checked']} stored outputs - {counts['parsed']} ok, "
+               f"{counts['failed']} failed, {counts['changed']} changed status")
+    return counts
+
+
+def purge_stored_outputs(retention_days: int) -> Optional[int]:
+    """
+    Delete stored raw outputs older than the retention period
+
+    Runs synchronously; call it from a script or a thread.
+
+    Args:
+        retention_days: Age in days after which an output is deleted
+
+    Returns:
+        Number of outputs deleted, or None if the transaction failed
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    db = SessionLocal()
+    try:
+        deleted = DatabaseService(db).delete_llm_outputs_before(cutoff)
+    finally:
+        db.close()
+
+    if deleted is not None:
+        logger.info(f"🧹 Purged {deleted} stored raw outputs older than {retention_days} days")
+    return deleted
+
+
+# Global raw output store instance
+raw_output_store = RawOutputStore()
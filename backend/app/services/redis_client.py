@@ -0,0 +1,94 @@
+"""
+Shared Redis connection for optional cross-worker state
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client: Optional[redis.Redis] = None
+_redis_initialised = False
+_async_redis_client: Optional[redis.asyncio.Redis] = None
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """
+    Get the shared Redis client, connecting on first use
+
+    The first call blocks for up to REDIS_CONNECT_TIMEOUT_SECONDS; the app
+    makes it at startup through connect_redis so requests never do.
+
+    Returns:
+        Connected Redis client, or None if REDIS_URL is not configured or unreachable
+    """
+    global _redis_client, _redis_initialised
+
+    if _redis_initialised:
+        return _redis_client
+
+    _redis_initialised = True
+
+    if not settings.REDIS_URL:
+        return None
+
+    try:
+        client = redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS
+        )
+        client.ping()
+        _redis_client = client
+        logger.info("✅ Shared Redis connection established")
+    except Exception as e:
+        logger.warning(f"⚠️ Redis not available, using in-process state only: {e}")
+        _redis_client = None
+
+    return _redis_client
+
+
+def get_async_redis_client() -> Optional[redis.asyncio.Redis]:
+    """
+    asyncio client for the same Redis, for blocking commands such as BRPOP
+
+    Waiting on these through the sync client would hold a default executor
+    thread each. Only available once the shared client has connected.
+
+    Returns:
+        asyncio Redis client, or None if the shared client is not connected
+    """
+    global _async_redis_client
+
+    if _redis_client is None:
+        return None
+
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS
+        )
+
+    return _async_redis_client
+
+
+async def close_async_redis() -> None:
+    """Close the asyncio client's connections (call on shutdown)"""
+    global _async_redis_client
+
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        _async_redis_client = None
+
+
+async def connect_redis() -> Optional[redis.Redis]:
+    """Connect the shared client off the event loop (call once at startup)"""
+    return await asyncio.to_thread(get_redis_client)
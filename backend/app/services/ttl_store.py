@@ -0,0 +1,86 @@
+"""
+Expiring key-value store shared by services that cache JSON payloads
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.services.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class TTLStore:
+    """Two-tier (in-process LRU + optional Redis) store of JSON strings that expire"""
+
+    def __init__(self, key_prefix: str, ttl_seconds: int, max_entries: int):
+        self.key_prefix = key_prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # key -> (expires_at, payload)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    @property
+    def redis_client(self):
+        """Redis tier, if configured"""
+        return get_redis_client()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Get a live payload, or None if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                return payload
+            del self._entries[key]
+
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                payload = await asyncio.to_thread(redis_client.get, self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to read {self.key_prefix} from Redis: {e}")
+                payload = None
+
+            if payload:
+                self._set_memory(key, payload)
+                return payload
+
+        return None
+
+    async def set(self, key: str, payload: str) -> None:
+        """Store a payload in both tiers for ttl_seconds"""
+        self._set_memory(key, payload)
+
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                await asyncio.to_thread(redis_client.setex, self.key_prefix + key, self.ttl_seconds, payload)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to write {self.key_prefix} to Redis: {e}")
+
+    async def delete(self, key: str) -> None:
+        """Remove a payload from both tiers"""
+        self._entries.pop(key, None)
+
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                await asyncio.to_thread(redis_client.delete, self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to delete {self.key_prefix} from Redis: {e}")
+
+    def _set_memory(self, key: str, payload: str) -> None:
+        """Write to the in-process tier, evicting least recently used entries"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
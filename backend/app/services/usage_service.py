@@ -0,0 +1,242 @@
+"""
+Token, latency and cost accounting for LLM calls
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List
+
+from app.models.database import SessionLocal
+from app.services.database_service import DatabaseService
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Analysis the LLM calls in the current context belong to
+_analysis_key: ContextVar[Optional[str]] = ContextVar("llm_usage_analysis_key", default=None)
+
+
+def begin_analysis_usage() -> None:
+    """Attribute LLM calls made from here on in this context to a new analysis"""
+    _analysis_key.set(uuid.uuid4().hex)
+
+
+def extract_token_usage(message: Any) -> Dict[str, int]:
+    """
+    Read prompt and completion token counts from a LangChain message
+
+    Args:
+        message: AIMessage or final AIMessageChunk returned by the chat model
+
+    Returns:
+        Dict with prompt_tokens and completion_tokens (zero when not reported)
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {
+            "prompt_tokens": int(usage.get("input_tokens", 0)),
+            "completion_tokens": int(usage.get("output_tokens", 0)),
+        }
+
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return {
+        "prompt_tokens": int(token_usage.get("prompt_tokens", 0)),
+        "completion_tokens": int(token_usage.get("completion_tokens", 0)),
+    }
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    """Price a call with the configured per-million-token rates (USD)"""
+    return (
+        prompt_tokens * settings.LLM_INPUT_COST_PER_MILLION_TOKENS
+        + completion_tokens * settings.LLM_OUTPUT_COST_PER_MILLION_TOKENS
+    ) / 1_000_000
+
+
+class UsageRecorder:
+    """
+    Records per-call LLM usage into the llm_usage table
+
+    Recording is synchronous and never blocks the request: records go into a
+    bounded buffer that a background task flushes in batches off the event
+    loop. Running totals are kept in memory for the status endpoint; the
+    table is the source for windowed reports.
+    """
+
+    def __init__(self):
+        self.enabled = settings.LLM_USAGE_TRACKING_ENABLED
+        self.flush_interval = settings.LLM_USAGE_FLUSH_INTERVAL_SECONDS
+        self.batch_size = settings.LLM_USAGE_BATCH_SIZE
+
+        self._buffer: deque = deque(maxlen=settings.LLM_USAGE_BUFFER_SIZE)
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost_usd": 0.0,
+            "written": 0,
+            "dropped": 0,
+            "failed_flushes": 0,
+        }
+
+    async def start(self) -> None:
+        """Start the background flusher"""
+        if not self.enabled or self._flusher is not None:
+            return
+        self._flusher = asyncio.create_task(self._run(), name="llm-usage-flusher")
+        logger.info(f"✅ LLM usage recorder started - Flush interval: {self.flush_interval}s")
+
+    async def stop(self) -> None:
+        """Stop the flusher and write anything still buffered"""
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self.flush()
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency_seconds: float,
+        personalized: bool,
+        streamed: bool = False,
+        image_bytes: Optional[int] = None,
+        finish_reason: Optional[str] = None
+    ) -> None:
+        """
+        Record one LLM call
+
+        Args:
+            model: Model that served the call
+            prompt_tokens: Input tokens, including the image
+            completion_tokens: Output tokens
+            latency_seconds: Provider call duration
+            personalized: Whether survey context was sent
+            streamed: Whether the response was streamed
+            image_bytes: Size of the image sent to the model
+            finish_reason: Why generation stopped ("stop", "length", ...)
+        """
+        if not self.enabled:
+            return
+
+        cost = estimate_cost(prompt_tokens, completion_tokens)
+        self.stats["calls"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        self.stats["cost_usd"] += cost
+
+        if len(self._buffer) == self._buffer.maxlen:
+            self.stats["dropped"] += 1
+        self._buffer.append({
+            "model": model,
+            # Calls outside an analysis count as one analysis each
+            "analysis_key": _analysis_key.get() or uuid.uuid4().hex,
+            "personalized": personalized,
+            "streamed": streamed,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_ms": int(latency_seconds * 1000),
+            "image_bytes": image_bytes,
+            "finish_reason": finish_reason,
+            "cost_usd": round(cost, 8),
+        })
+
+    async def _run(self) -> None:
+        """Flush the buffer periodically"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ LLM usage flush error: {e}")
+
+    async def flush(self) -> None:
+        """Write buffered records in batches; failed batches are put back for the next flush"""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            written = await asyncio.to_thread(self._write_batch, batch)
+
+            if written is None:
+                self.stats["failed_flushes"] += 1
+                self._buffer.extendleft(reversed(batch))
+                return
+            self.stats["written"] += written
+
+    @staticmethod
+    def _write_batch(batch: List[Dict[str, Any]]) -> Optional[int]:
+        """Insert a batch in one transaction (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            return DatabaseService(db).create_llm_usage_batch(batch)
+        finally:
+            db.close()
+
+    @staticmethod
+    def build_report(totals: List[Dict[str, Any]], hours: float) -> Dict[str, Any]:
+        """
+        Turn per-group usage totals into a capacity and cost report
+
+        Args:
+            totals: Rows from DatabaseService.get_llm_usage_totals
+            hours: Length of the reporting window
+
+        Returns:
+            Overall figures plus a personalized/basic split
+        """
+        def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+            calls = sum(row["calls"] for row in rows)
+            analyses = sum(row["analyses"] for row in rows)
+            prompt_tokens = sum(row["prompt_tokens"] for row in rows)
+            completion_tokens = sum(row["completion_tokens"] for row in rows)
+            latency_seconds = sum(row["latency_ms"] for row in rows) / 1000
+            cost = sum(row["cost_usd"] for row in rows)
+            image_bytes = [(row["avg_image_bytes"], row["calls"]) for row in rows if row["avg_image_bytes"] is not None]
+            image_calls = sum(count for _, count in image_bytes)
+
+            return {
+                "calls": calls,
+                "analyses": analyses,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "avg_prompt_tokens": round(prompt_tokens / calls, 1) if calls else 0.0,
+                "avg_completion_tokens": round(completion_tokens / calls, 1) if calls else 0.0,
+                "avg_latency_seconds": round(latency_seconds / calls, 3) if calls else 0.0,
+                # Generation speed while a call is in flight, not wall-clock throughput
+                "completion_tokens_per_second": round(completion_tokens / latency_seconds, 1) if latency_seconds else 0.0,
+                "avg_image_bytes": round(sum(size * count for size, count in image_bytes) / image_calls) if image_calls else None,
+                "truncated_calls": sum(row["truncated"] for row in rows),
+                "cost_usd": round(cost, 6),
+                "cost_per_analysis_usd": round(cost / analyses, 6) if analyses else 0.0,
+            }
+
+        return {
+            "window_hours": hours,
+            "pricing_per_million_tokens_usd": {
+                "input": settings.LLM_INPUT_COST_PER_MILLION_TOKENS,
+                "output": settings.LLM_OUTPUT_COST_PER_MILLION_TOKENS,
+            },
+            "overall": summarize(totals),
+            "personalized": summarize([row for row in totals if row["personalized"]]),
+            "basic": summarize([row for row in totals if not row["personalized"]]),
+        }
+
+    def get_status(self) -> dict:
+        """Get in-process totals since startup"""
+        return {
+            "enabled": self.enabled,
+            "running": self._flusher is not None,
+            "buffered": len(self._buffer),
+            **self.stats,
+            "cost_usd": round(self.stats["cost_usd"], 6),
+        }
+
+
+# Global usage recorder instance
+usage_recorder = UsageRecorder()
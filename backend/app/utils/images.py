@@ -0,0 +1,207 @@
+"""
+Image preprocessing utilities for vision model uploads
+"""
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.config import settings
+from app.utils.quality import QualityReport, assess_image_quality
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass
+class ProcessedImage:
+    """Image re-encoded for upload to the vision model"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_size: int
+    quality: Optional[QualityReport] = None
+
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes removed compared to the original upload"""
+        return self.original_size - len(self.data)
+
+
+def _flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """Convert any mode to RGB, compositing transparency onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+
+    if image.mode != "RGB":
+        return image.convert("RGB")
+
+    return image
+
+
+def preprocess_image(
+    contents: bytes,
+    max_edge: int = settings.IMAGE_MAX_EDGE,
+    output_format: str = settings.IMAGE_OUTPUT_FORMAT,
+    quality: int = settings.IMAGE_QUALITY,
+    assess_quality: bool = False
+) -> ProcessedImage:
+    """
+    Decode, orient, downscale and re-encode an uploaded image
+
+    EXIF orientation is applied to the pixels and all metadata is dropped,
+    so the result is both smaller and free of location/device data.
+
+    Args:
+        contents: Raw uploaded image bytes
+        max_edge: Maximum length of the longest edge in pixels
+        output_format: Pillow format name ("JPEG" or "WEBP")
+        quality: Encoder quality (1-100)
+        assess_quality: Also run the photo quality checks on the decoded pixels
+
+    Returns:
+        ProcessedImage with the re-encoded bytes and dimensions
+
+    Raises:
+        HTTPException: If the image cannot be decoded
+    """
+    output_format = output_format.upper()
+    if output_format not in OUTPUT_MIME_TYPES:
+        output_format = "JPEG"
+
+    try:
+        with Image.open(io.BytesIO(contents)) as source:
+            original_width, original_height = source.size
+
+            # Only the first frame of animated images is analysed
+            source.seek(0)
+            image = ImageOps.exif_transpose(source)
+            image = _flatten_to_rgb(image)
+
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+            # Reuse this decode for the quality checks rather than decoding twice
+            quality_report = None
+            if assess_quality:
+                quality_report = assess_image_quality(image, (original_width, original_height))
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=output_format, quality=quality, optimize=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.error(f"❌ Failed to decode uploaded image: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail="Unable to read image. Please upload a valid JPEG, PNG, GIF or WebP photo."
+        )
+
+    processed = ProcessedImage(
+        data=buffer.getvalue(),
+        mime_type=OUTPUT_MIME_TYPES[output_format],
+        width=image.width,
+        height=image.height,
+        original_width=original_width,
+        original_height=original_height,
+        original_size=len(contents),
+        quality=quality_report
+    )
+
+    logger.info(f"🖼️ Image preprocessed - {original_width}x{original_height} -> "
+               f"{processed.width}x{processed.height}, {processed.original_size} -> "
+               f"{len(processed.data)} bytes ({processed.bytes_saved} saved)")
+
+    return processed
+
+
+def tile_images(
+    images: List[bytes],
+    max_edge: int = settings.IMAGE_MAX_EDGE,
+    output_format: str = settings.IMAGE_OUTPUT_FORMAT,
+    quality: int = settings.IMAGE_QUALITY
+) -> ProcessedImage:
+    """
+    Combine several (already preprocessed) photos into one grid image
+
+    Views are laid out left to right, top to bottom in a near-square grid
+    on a white background, each scaled to fit its cell, and the grid is
+    downscaled to max_edge so several views cost one image's tokens.
+
+    Args:
+        images: Encoded images in display order
+        max_edge: Maximum length of the grid's longest edge in pixels
+        output_format: Pillow format name ("JPEG" or "WEBP")
+        quality: Encoder quality (1-100)
+
+    Returns:
+        ProcessedImage with the encoded grid
+
+    Raises:
+        HTTPException: If an image cannot be decoded
+    """
+    output_format = output_format.upper()
+    if output_format not in OUTPUT_MIME_TYPES:
+        output_format = "JPEG"
+
+    try:
+        frames = []
+        for contents in images:
+            with Image.open(io.BytesIO(contents)) as source:
+                # Copy so the pixels outlive the source file
+                frames.append(_flatten_to_rgb(source).copy())
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.error(f"❌ Failed to decode image for tiling: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail="Unable to read image. Please upload a valid JPEG, PNG, GIF or WebP photo."
+        )
+
+    columns = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    cell_width = max(frame.width for frame in frames)
+    cell_height = max(frame.height for frame in frames)
+
+    grid = Image.new("RGB", (columns * cell_width, rows * cell_height), (255, 255, 255))
+    for index, frame in enumerate(frames):
+        frame = ImageOps.contain(frame, (cell_width, cell_height))
+        column, row = index % columns, index // columns
+        # Centre each view in its cell
+        grid.paste(frame, (
+            column * cell_width + (cell_width - frame.width) // 2,
+            row * cell_height + (cell_height - frame.height) // 2
+        ))
+
+    if max(grid.size) > max_edge:
+        grid.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    grid.save(buffer, format=output_format, quality=quality, optimize=True)
+
+    original_size = sum(len(contents) for contents in images)
+    tiled = ProcessedImage(
+        data=buffer.getvalue(),
+        mime_type=OUTPUT_MIME_TYPES[output_format],
+        width=grid.width,
+        height=grid.height,
+        original_width=columns * cell_width,
+        original_height=rows * cell_height,
+        original_size=original_size
+    )
+
+    logger.info(f"🧩 Tiled {len(frames)} images into a {columns}x{rows} grid - "
+               f"{tiled.width}x{tiled.height}, {original_size} -> {len(tiled.data)} bytes")
+
+    return tiled
@@ -3,7 +3,8 @@ Ingredient normalisation utilities for skincare product matching
 """
 import re
 import unicodedata
-from typing import List, Dict, Set
+from functools import lru_cache
+from typing import List, Dict, Set, FrozenSet
 from rapidfuzz import fuzz, process
 
 # INCI alias dictionary for common skincare actives
@@ -259,4 +260,60 @@ def check_avoid_ingredients(product_ingredients: List[str], avoid_ingredients: L
     product_terms = expand_ingredient_search_terms(product_ingredients)
     
     # Check if any avoid term matches any product term
-    return bool(avoid_terms.intersection(product_terms)) 
\ No newline at end of file
+    return bool(avoid_terms.intersection(product_terms)) 
+
+
+@lru_cache(maxsize=2048)
+def _alias_set(ingredient: str) -> FrozenSet[str]:
+    """Cached get_ingredient_aliases (normalisation runs a fuzzy match)"""
+    return frozenset(get_ingredient_aliases(ingredient))
+
+
+def ingredient_alias_class(ingredient: str) -> FrozenSet[str]:
+    """
+    Get every known term that satisfies a requirement for an ingredient
+    
+    check_ingredient_match expands both the requirement and the product's
+    ingredients with aliases, so a product term matches when its aliases
+    share a term with the ingredient's aliases. The class is that relation
+    evaluated over the alias dictionary, i.e. the set of stored tokens a
+    single array-overlap test has to look for.
+    
+    Args:
+        ingredient: Normalised ingredient name
+        
+    Returns:
+        Frozen set of matching terms, including the ingredient's own aliases
+    """
+    aliases = _alias_set(ingredient)
+    
+    known_terms = set(INCI_ALIASES)
+    for alias_list in INCI_ALIASES.values():
+        known_terms.update(alias_list)
+    
+    return frozenset(aliases | {term for term in known_terms if _alias_set(term) & aliases})
+
+
+def build_alias_classes(ingredients: List[str]) -> List[FrozenSet[str]]:
+    """
+    Group required ingredients into alias equivalence classes
+    
+    Each class must be matched by at least one of its terms. Duplicate
+    classes (e.g. niacinamide and vitamin b3) collapse into one, and a
+    class that contains another class is dropped because matching the
+    smaller one already satisfies it.
+    
+    Args:
+        ingredients: List of normalised ingredient names
+        
+    Returns:
+        Minimal list of alias classes, smallest (most selective) first
+    """
+    classes = sorted({ingredient_alias_class(ingredient) for ingredient in ingredients}, key=lambda c: (len(c), sorted(c)))
+    
+    minimal: List[FrozenSet[str]] = []
+    for alias_class in classes:
+        if not any(kept <= alias_class for kept in minimal):
+            minimal.append(alias_class)
+    
+    return minimal
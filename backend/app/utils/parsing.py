@@ -2,45 +2,49 @@
 """
 Parsing utilities for skin analysis LLM responses
 """
-import json
-import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
+import orjson
 from fastapi import HTTPException
-from app.models.schemas import SkinAnalysisResponse, IngredientRecommendation
+from pydantic import TypeAdapter, ValidationError
+from app.models.schemas import SkinAnalysisResponse
 
 logger = logging.getLogger(__name__)
 
+# Built once at import; validating through it skips per-call schema setup
+_RESPONSE_ADAPTER = TypeAdapter(SkinAnalysisResponse)
+
+_DEFAULT_DESCRIPTION = 'Skin analysis completed successfully.'
+
+# Upper bound on trailing commas removed from one response
+_MAX_COMMA_REPAIRS = 20
+
 def parse_skin_analysis_response(llm_response: str) -> SkinAnalysisResponse:
     """
     Parse LLM response text into SkinAnalysisResponse object
     
+    The JSON object is located by its outer braces, decoded with orjson and
+    validated in a single pass. Common near-JSON defects (trailing commas,
+    confidence sent as a string) are repaired rather than rejected, and
+    invalid ingredient recommendations are dropped individually.
+    
     Args:
         llm_response: Raw text response from LLM
-        
+    
     Returns:
         SkinAnalysisResponse object with parsed data
-        
+    
     Raises:
         HTTPException: If parsing fails or response is invalid
     """
     try:
         logger.info("🔍 Parsing skin analysis response...")
         
-        # Clean the response text
-        cleaned_response = clean_llm_response(llm_response)
+        response_data = _decode_object(llm_response)
         
-        # Parse JSON
-        try:
-            response_data = json.loads(cleaned_response)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON parsing failed: {e}")
-            logger.error(f"Response text: {cleaned_response[:500]}...")
-            raise HTTPException(
-                status_code=422,
-                detail="Invalid response format from analysis service"
-            )
+        # Fix up loosely typed fields before validating
+        _normalise_fields(response_data)
         
         # Validate required fields
         if not validate_skin_analysis_response(response_data):
@@ -49,32 +53,14 @@ def parse_skin_analysis_response(llm_response: str) -> SkinAnalysisResponse:
                 detail="Incomplete analysis response - missing required fields"
             )
         
-        # Parse ingredient recommendations
-        ingredient_recommendations = []
-        for ingredient_data in response_data.get('ingredientRecommendations', []):
-            try:
-                ingredient = IngredientRecommendation(**ingredient_data)
-                ingredient_recommendations.append(ingredient)
-            except Exception as e:
-                logger.warning(f"⚠️ Skipping invalid ingredient recommendation: {e}")
-                continue
-        
-        # Create response object
-        analysis_response = SkinAnalysisResponse(
-            confidence=response_data['confidence'],
-            primaryCondition=response_data['primaryCondition'],
-            secondaryConditions=response_data.get('secondaryConditions', []),
-            skinType=response_data['skinType'],
-            ingredientRecommendations=ingredient_recommendations,
-            description=response_data.get('description', 'Skin analysis completed successfully.')
-        )
+        analysis_response = _validate(response_data)
         
         logger.info(f"✅ Successfully parsed skin analysis response - "
                    f"Condition: {analysis_response.primaryCondition}, "
-                   f"Ingredients: {len(ingredient_recommendations)}")
+                   f"Ingredients: {len(analysis_response.ingredientRecommendations)}")
         
         return analysis_response
-        
+    
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -90,36 +76,218 @@ def parse_skin_analysis_response(llm_response: str) -> SkinAnalysisResponse:
         
         # Generic parsing failure
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Failed to parse analysis response: {str(e)}"
         )
 
+def parse_skin_classification_response(llm_response: str) -> Dict[str, Any]:
+    """
+    Parse a two-phase classification response
+    
+    Args:
+        llm_response: Raw text of the phase one (classification) response
+    
+    Returns:
+        Dict with confidence, primaryCondition, secondaryConditions and skinType
+    
+    Raises:
+        HTTPException: If the response is not a usable classification
+    """
+    classification = _decode_object(llm_response)
+    _normalise_fields(classification)
+    
+    confidence = classification.get('confidence')
+    if not classification.get('primaryCondition') or not classification.get('skinType') \
+            or not isinstance(confidence, int) or not 1 <= confidence <= 100:
+        logger.error(f"❌ Incomplete classification. Found: {list(classification.keys())}")
+        raise HTTPException(
+            status_code=422,
+            detail="Incomplete analysis response - missing required fields"
+        )
+    
+    secondary = classification.get('secondaryConditions')
+    return {
+        'confidence': confidence,
+        'primaryCondition': str(classification['primaryCondition']),
+        'secondaryConditions': [str(item) for item in secondary] if isinstance(secondary, list) else [],
+        'skinType': str(classification['skinType'])
+    }
+
+def merge_two_phase_response(classification: Dict[str, Any], recommendations_response: str) -> SkinAnalysisResponse:
+    """
+    Combine a parsed classification with the phase two response into one analysis
+    
+    Args:
+        classification: Result of parse_skin_classification_response
+        recommendations_response: Raw text of the phase two (recommendations) response
+    
+    Returns:
+        SkinAnalysisResponse equivalent to a single-call analysis
+    
+    Raises:
+        HTTPException: If the recommendations response is invalid
+    """
+    response_data = _decode_object(recommendations_response)
+    if not isinstance(response_data.get('ingredientRecommendations'), list):
+        logger.error("❌ ingredientRecommendations must be a list")
+        raise HTTPException(
+            status_code=422,
+            detail="Incomplete analysis response - missing required fields"
+        )
+    
+    # The classification is authoritative for its fields
+    response_data.update(classification)
+    _normalise_fields(response_data)
+    
+    return _validate(response_data)
+
+def _decode_object(llm_response: str) -> Dict[str, Any]:
+    """
+    Locate and decode the JSON object in a response
+    
+    Args:
+        llm_response: Raw text response from LLM
+    
+    Returns:
+        Decoded JSON object
+    
+    Raises:
+        HTTPException: If no JSON object can be decoded
+    """
+    # Locate the JSON object
+    json_text = clean_llm_response(llm_response)
+    
+    # Parse JSON, repairing trailing commas only when the fast path fails
+    try:
+        response_data = _loads_repairing(json_text)
+    except orjson.JSONDecodeError as e:
+        logger.error(f"❌ JSON parsing failed: {e}")
+        logger.error(f"Response text: {json_text[:500]}...")
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid response format from analysis service"
+        )
+    
+    if not isinstance(response_data, dict):
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid response format from analysis service"
+        )
+    
+    return response_data
+
+def _loads_repairing(text: str) -> Any:
+    """
+    Decode JSON with orjson, removing trailing commas it rejects
+    
+    orjson reports the offending comma's position, so each repair is a
+    splice at a known index rather than a rescan of the whole text.
+    
+    Args:
+        text: JSON or near-JSON text
+    
+    Returns:
+        Decoded JSON value
+    
+    Raises:
+        orjson.JSONDecodeError: If the text is malformed beyond trailing commas
+    """
+    repairs = 0
+    while True:
+        try:
+            data = orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            if repairs >= _MAX_COMMA_REPAIRS or not _is_trailing_comma(text, e.pos):
+                raise
+            text = text[:e.pos] + text[e.pos + 1:]
+            repairs += 1
+            continue
+        
+        if repairs:
+            logger.info(f"🔧 Removed {repairs} trailing comma(s) from analysis response")
+        return data
+
+def _is_trailing_comma(text: str, pos: int) -> bool:
+    """Check whether the character at pos is a comma directly before a closer"""
+    if pos >= len(text) or text[pos] != ',':
+        return False
+    rest = text[pos + 1:pos + 64].lstrip()
+    return rest[:1] in ('}', ']')
+
+def _normalise_fields(response_data: Dict[str, Any]) -> None:
+    """Coerce loosely typed fields (e.g. "85%" confidence) in place"""
+    confidence = response_data.get('confidence')
+    if isinstance(confidence, str):
+        try:
+            confidence = float(confidence.strip().rstrip('%').strip())
+        except ValueError:
+            return
+    if isinstance(confidence, float):
+        # Some responses give a 0-1 fraction instead of a percentage (exactly 1 means 1%)
+        if 0 < confidence < 1:
+            confidence *= 100
+        response_data['confidence'] = int(round(confidence))
+    
+    if 'description' not in response_data:
+        response_data['description'] = _DEFAULT_DESCRIPTION
+
+def _validate(response_data: Dict[str, Any]) -> SkinAnalysisResponse:
+    """
+    Validate response data, dropping only the ingredient entries that fail
+    
+    Args:
+        response_data: Decoded and normalised response dictionary
+    
+    Returns:
+        Validated SkinAnalysisResponse
+    """
+    try:
+        return _RESPONSE_ADAPTER.validate_python(response_data)
+    except ValidationError as e:
+        bad_items = set()
+        for error in e.errors():
+            loc = error['loc']
+            if len(loc) >= 2 and loc[0] == 'ingredientRecommendations' and isinstance(loc[1], int):
+                bad_items.add(loc[1])
+            else:
+                raise
+        
+        for index in sorted(bad_items):
+            logger.warning(f"⚠️ Skipping invalid ingredient recommendation at position {index}")
+        
+        response_data['ingredientRecommendations'] = [
+            item for index, item in enumerate(response_data['ingredientRecommendations'])
+            if index not in bad_items
+        ]
+        return _RESPONSE_ADAPTER.validate_python(response_data)
+
 def clean_llm_response(response: str) -> str:
     """
     Clean LLM response text to extract JSON content
     
     Args:
         response: Raw response text from LLM
-        
+    
     Returns:
         Cleaned JSON string
     """
-    # Remove markdown code blocks
-    response = re.sub(r'```json\s*', '', response)
-    response = re.sub(r'```\s*$', '', response)
-    response = re.sub(r'^```\s*', '', response)
-    
-    # Remove any leading/trailing whitespace
-    response = response.strip()
-    
-    # Try to find JSON object boundaries
+    # The outer braces bound the object, which also drops markdown fences
     start_idx = response.find('{')
     end_idx = response.rfind('}')
     
     if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-        response = response[start_idx:end_idx + 1]
+        return response[start_idx:end_idx + 1]
+    
+    # No object found: strip fences so the error log shows the bare text
+    response = response.strip()
+    if response.startswith('```'):
+        response = response[3:]
+        if response.startswith('json'):
+            response = response[4:]
+    if response.endswith('```'):
+        response = response[:-3]
     
-    return response
+    return response.strip()
 
 def validate_skin_analysis_response(response_data: dict) -> bool:
     """
@@ -127,7 +295,7 @@ def validate_skin_analysis_response(response_data: dict) -> bool:
     
     Args:
         response_data: Dictionary containing response data
-        
+    
     Returns:
         True if valid, False otherwise
     """
@@ -149,4 +317,4 @@ def validate_skin_analysis_response(response_data: dict) -> bool:
         logger.error("❌ confidence must be between 1 and 100")
         return False
     
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,152 @@
+"""
+Fast local photo quality checks run before the vision model call
+"""
+import io
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Longest edge the checks run at; large enough for blur detection, cheap to scan
+ANALYSIS_EDGE = 512
+
+# Quality issues and the advice returned for each
+QUALITY_TIPS = {
+    "blurry": "Hold the camera steady, tap to focus on your face and make sure the lens is clean.",
+    "too_dark": "Face a window or a soft light source; avoid shooting with the light behind you.",
+    "too_bright": "Move out of direct sunlight or away from harsh lamps and turn off the flash.",
+    "low_contrast": "Use even lighting and avoid heavy shadows or glare across your face.",
+    "low_resolution": "Use your phone's main camera at full resolution rather than a screenshot or crop.",
+    "no_skin_detected": "Fill most of the frame with your face, without filters or heavy makeup.",
+}
+
+# Issues only ever passed to the model as a hint: the skin-colour range is a
+# fixed heuristic and must not turn uploads away on its own
+HINT_ONLY_ISSUES = {"no_skin_detected"}
+
+
+@dataclass
+class QualityReport:
+    """Measurements and detected issues for one photo"""
+    sharpness: float
+    brightness: float
+    clipped_fraction: float
+    skin_fraction: float
+    min_edge: int
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        """Whether the photo has no detected issues"""
+        return not self.issues
+
+    @property
+    def rejectable(self) -> bool:
+        """Whether any issue is serious enough to reject the photo in "reject" mode"""
+        return any(issue not in HINT_ONLY_ISSUES for issue in self.issues)
+
+    @property
+    def tips(self) -> List[str]:
+        """Actionable advice for each detected issue"""
+        return [QUALITY_TIPS[issue] for issue in self.issues]
+
+    def as_prompt_hint(self) -> Optional[str]:
+        """Short description of the issues for the analysis prompt"""
+        if self.passed:
+            return None
+        issues = ", ".join(issue.replace("_", " ") for issue in self.issues)
+        return (f"PHOTO QUALITY NOTE: an automatic check flagged this photo as {issues}. "
+                f"Account for this in your confidence score and mention it in the description.")
+
+
+def _skin_fraction(image: Image.Image) -> float:
+    """Share of pixels in the classic YCbCr skin-tone range (holds across a wide range of skin tones)"""
+    ycbcr = np.asarray(image.convert("YCbCr"))
+    cb, cr = ycbcr[..., 1], ycbcr[..., 2]
+    return float(((cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)).mean())
+
+
+def assess_image_quality(image: Image.Image, original_size: Optional[tuple] = None) -> QualityReport:
+    """
+    Measure blur, exposure, resolution and skin coverage of a decoded photo
+
+    Args:
+        image: Decoded, correctly oriented RGB image
+        original_size: (width, height) of the upload, if the image was downscaled
+
+    Returns:
+        QualityReport with the measurements and any threshold violations
+    """
+    width, height = original_size or image.size
+
+    # Integer box reduction is several times cheaper than a resampling resize
+    factor = -(-max(image.size) // ANALYSIS_EDGE)
+    sample = image.reduce(factor) if factor > 1 else image
+
+    # Colour conversions run in Pillow's C code; only the arithmetic is NumPy
+    gray = np.asarray(sample.convert("L"), dtype=np.float32)
+
+    # Variance of the 4-neighbour Laplacian: low when edges are smeared
+    laplacian = (
+        gray[1:-1, 2:] + gray[1:-1, :-2] + gray[2:, 1:-1] + gray[:-2, 1:-1]
+        - 4 * gray[1:-1, 1:-1]
+    )
+
+    report = QualityReport(
+        sharpness=float(laplacian.var()) if laplacian.size else 0.0,
+        brightness=float(gray.mean()),
+        clipped_fraction=float(((gray < 10) | (gray > 245)).mean()),
+        skin_fraction=_skin_fraction(sample),
+        min_edge=min(width, height)
+    )
+
+    if report.min_edge < settings.IMAGE_QUALITY_MIN_EDGE:
+        report.issues.append("low_resolution")
+    if report.sharpness < settings.IMAGE_QUALITY_MIN_SHARPNESS:
+        report.issues.append("blurry")
+    if report.brightness < settings.IMAGE_QUALITY_MIN_BRIGHTNESS:
+        report.issues.append("too_dark")
+    elif report.brightness > settings.IMAGE_QUALITY_MAX_BRIGHTNESS:
+        report.issues.append("too_bright")
+    elif report.clipped_fraction > settings.IMAGE_QUALITY_MAX_CLIPPED_FRACTION:
+        report.issues.append("low_contrast")
+    if report.skin_fraction < settings.IMAGE_QUALITY_MIN_SKIN_FRACTION:
+        report.issues.append("no_skin_detected")
+
+    return report
+
+
+def assess_image_bytes(contents: bytes) -> QualityReport:
+    """
+    Decode an upload and assess its quality (used when preprocessing is off)
+
+    Args:
+        contents: Raw image bytes
+
+    Returns:
+        QualityReport for the image
+
+    Raises:
+        HTTPException: If the image cannot be decoded
+    """
+    try:
+        with Image.open(io.BytesIO(contents)) as source:
+            original_size = source.size
+            # JPEG can decode straight to a smaller size, which is all the checks need
+            source.draft("RGB", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+            image = ImageOps.exif_transpose(source).convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.error(f"❌ Failed to decode uploaded image: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail="Unable to read image. Please upload a valid JPEG, PNG, GIF or WebP photo."
+        )
+
+    return assess_image_quality(image, original_size)
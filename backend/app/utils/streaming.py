@@ -0,0 +1,137 @@
+"""
+Incremental parsing of streamed skin analysis responses
+"""
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+from app.models.schemas import IngredientRecommendation
+
+logger = logging.getLogger(__name__)
+
+# Top-level fields that are emitted as soon as their value is complete
+STREAMED_FIELDS = {"confidence", "primaryCondition", "secondaryConditions", "skinType", "description"}
+INGREDIENTS_FIELD = "ingredientRecommendations"
+
+
+class IncrementalAnalysisParser:
+    """
+    Single-pass scanner that extracts completed fields from a partial JSON response
+
+    Text is fed in arbitrary chunks as it streams from the model. Each character
+    is scanned once; whenever a top-level field value or an individual
+    ingredient recommendation closes, it is decoded and returned as an event.
+    Anything before the first "{" (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[Tuple[int, int]] = None
+        self._current_key: Optional[str] = None
+        self._value_start = -1
+        self._item_start = -1
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume the next chunk of streamed text
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            List of (event name, value) tuples completed by this chunk
+        """
+        events: List[Tuple[str, Any]] = []
+        self.buffer += chunk
+        buffer = self.buffer
+
+        for i in range(self._pos, len(buffer)):
+            if self._finished:
+                break
+
+            char = buffer[i]
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = (self._string_start, i + 1)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+                if char == "{" and self._depth == 3 and self._current_key == INGREDIENTS_FIELD:
+                    self._item_start = i
+            elif char in "}]":
+                if char == "}" and self._depth == 3 and self._item_start != -1:
+                    self._emit_ingredient(buffer[self._item_start:i + 1], events)
+                    self._item_start = -1
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_field(buffer[self._value_start:i], events)
+                    self._finished = True
+            elif self._depth == 1:
+                if char == ":" and self._last_string is not None:
+                    start, end = self._last_string
+                    self._current_key = self._decode(buffer[start:end])
+                    self._value_start = i + 1
+                    self._last_string = None
+                elif char == ",":
+                    self._emit_field(buffer[self._value_start:i], events)
+
+        self._pos = len(buffer)
+        return events
+
+    @staticmethod
+    def _decode(raw: str) -> Any:
+        """Decode a JSON fragment, returning None if it is malformed"""
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _emit_field(self, raw: str, events: List[Tuple[str, Any]]) -> None:
+        """Emit a completed top-level field if it is one we stream"""
+        key = self._current_key
+        self._current_key = None
+
+        if key not in STREAMED_FIELDS:
+            return
+
+        value = self._decode(raw.strip())
+        if value is not None:
+            events.append((key, value))
+
+    def _emit_ingredient(self, raw: str, events: List[Tuple[str, Any]]) -> None:
+        """Emit a completed ingredient recommendation if it validates"""
+        data = self._decode(raw)
+        if not isinstance(data, dict):
+            return
+
+        try:
+            ingredient = IngredientRecommendation(**data)
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping invalid streamed ingredient recommendation: {e}")
+            return
+
+        events.append(("ingredient", ingredient.model_dump()))
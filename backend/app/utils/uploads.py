@@ -0,0 +1,156 @@
+"""
+Bounded upload reading, image type sniffing and data URL encoding
+"""
+import binascii
+import logging
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Read size per await; a multiple of 3 so base64 chunks need no padding
+UPLOAD_CHUNK_SIZE = 256 * 1024 - (256 * 1024) % 3
+
+# Leading bytes needed to identify every supported format
+SNIFF_BYTES = 12
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """
+    Identify an image format from its magic bytes
+
+    Args:
+        header: First bytes of the file (at least SNIFF_BYTES for WebP)
+
+    Returns:
+        MIME type of the detected format, or None if unrecognised
+    """
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _too_large(max_size: int) -> HTTPException:
+    """Build the error returned for oversized uploads"""
+    max_size_mb = max_size / (1024 * 1024)
+    return HTTPException(
+        status_code=400,
+        detail=f"File too large. Maximum size is {max_size_mb:.0f}MB."
+    )
+
+
+async def read_upload_bounded(
+    file: UploadFile,
+    max_size: int,
+    allowed_types: list
+) -> bytearray:
+    """
+    Read an upload in chunks, enforcing the size limit and image type as it goes
+
+    The buffer is preallocated when the size is declared, and reading stops
+    as soon as the limit is passed or the first chunk is not a supported image,
+    so an oversized or bogus upload is never held in memory in full.
+
+    Args:
+        file: FastAPI UploadFile object
+        max_size: Maximum accepted size in bytes
+        allowed_types: MIME types accepted after sniffing
+
+    Returns:
+        Image bytes (a bytearray, usable wherever bytes are)
+
+    Raises:
+        HTTPException: 400 if the upload is too large or not a supported image
+    """
+    declared_size = file.size
+    if declared_size is not None and declared_size > max_size:
+        raise _too_large(max_size)
+
+    buffer = bytearray(declared_size) if declared_size else bytearray()
+    view = memoryview(buffer) if declared_size else None
+    total = 0
+
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if total == 0:
+                detected_type = sniff_image_type(chunk[:SNIFF_BYTES])
+                if detected_type is None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid file type. Please upload an image."
+                    )
+                if detected_type not in allowed_types:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Unsupported image format. Allowed formats: {', '.join(allowed_types)}"
+                    )
+
+            end = total + len(chunk)
+            if end > max_size:
+                raise _too_large(max_size)
+
+            if view is not None and end <= len(buffer):
+                view[total:end] = chunk
+            else:
+                # Declared size was wrong (or absent): fall back to growing the buffer
+                if view is not None:
+                    view.release()
+                    view = None
+                    del buffer[total:]
+                buffer += chunk
+            total = end
+    finally:
+        if view is not None:
+            view.release()
+
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+
+    # Trim if fewer bytes arrived than were declared
+    if total < len(buffer):
+        del buffer[total:]
+
+    return buffer
+
+
+def encode_data_url(contents: bytes, mime_type: str) -> str:
+    """
+    Base64-encode image bytes straight into a data URL
+
+    The output is written chunk by chunk into one preallocated buffer that
+    already holds the "data:...;base64," prefix, instead of building the
+    base64 string and then copying it again into the URL.
+
+    Args:
+        contents: Raw image bytes
+        mime_type: MIME type for the data URL
+
+    Returns:
+        data: URL containing the base64 encoded image
+    """
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    encoded_size = 4 * ((len(contents) + 2) // 3)
+
+    output = bytearray(len(prefix) + encoded_size)
+    output[:len(prefix)] = prefix
+
+    source = memoryview(contents)
+    position = len(prefix)
+    for start in range(0, len(contents), UPLOAD_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(source[start:start + UPLOAD_CHUNK_SIZE], newline=False)
+        output[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    source.release()
+
+    return output.decode("ascii")
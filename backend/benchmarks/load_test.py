@@ -0,0 +1,223 @@
+"""
+End-to-end load test for the skin analysis endpoint, fully offline
+
+Drives /api/v1/analyze/skin in-process (httpx ASGI transport) with the fake
+LLM backend, at a fixed arrival rate, and reports throughput, latency
+percentiles and a per-stage breakdown taken from the Server-Timing
+response headers. Optional thresholds turn it into a
+regression gate: the script exits non-zero when any is exceeded.
+
+Usage:
+    python benchmarks/load_test.py --rps 20 --duration 30 --max-p95-ms 2500
+
+The fake backend is configured with the usual FAKE_LLM_* environment
+variables (latency median/sigma, error and 429 rates, response corpus).
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before the app (and its settings) are imported
+os.environ.setdefault("LLM_BACKEND", "fake")
+# The load is generated from one client address, which the rate limiter would throttle
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# Background raw-output and usage writes would queue Postgres connection attempts on the shared thread pool
+os.environ.setdefault("RAW_OUTPUT_STORAGE_ENABLED", "false")
+os.environ.setdefault("LLM_USAGE_TRACKING_ENABLED", "false")
+
+import httpx
+from PIL import Image
+
+from app.main import app
+from app.services.llm_service import llm_service
+
+ENDPOINT = "/api/v1/analyze/skin"
+
+# Stages reported in the Server-Timing header, in pipeline order
+STAGES = ("validate", "read", "cache", "preprocess", "encode", "llm_queue", "llm", "parse", "persist", "total")
+
+# stage name -> durations in seconds, from successful responses
+stage_timings: Dict[str, List[float]] = defaultdict(list)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Parse a Server-Timing header ("stage;dur=12.3, ...") into seconds per stage"""
+    spans = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                spans[name] = float(value) / 1000
+    return spans
+
+
+def make_images(count: int, width: int, height: int) -> List[bytes]:
+    """Generate distinct JPEG uploads (distinct so the result cache misses)"""
+    rng = random.Random(42)
+    images = []
+    for _ in range(count):
+        # Skin-like tones with texture, so the photo quality check passes them
+        red = rng.randint(120, 235)
+        tone = (red, int(red * rng.uniform(0.7, 0.8)), int(red * rng.uniform(0.55, 0.65)))
+        image = Image.new("RGB", (width, height), tone)
+        noise = Image.effect_noise((width, height), 40).convert("RGB")
+        image = Image.blend(image, noise, 0.25)
+
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+async def send_one(client: httpx.AsyncClient, image: bytes, results: list) -> None:
+    """Upload one image and record status and latency"""
+    started = time.perf_counter()
+    try:
+        response = await client.post(ENDPOINT, files={"file": ("face.jpg", image, "image/jpeg")})
+        status = response.status_code
+        if status == 200:
+            for stage, seconds in parse_server_timing(response.headers.get("server-timing", "")).items():
+                stage_timings[stage].append(seconds)
+    except Exception as e:
+        status = f"error:{type(e).__name__}"
+    results.append((status, time.perf_counter() - started))
+
+
+async def run_load(rps: float, duration: float, images: List[bytes]) -> tuple:
+    """Send requests at a fixed arrival rate (open loop) and wait for them all"""
+    results: list = []
+    transport = httpx.ASGITransport(app=app)
+    timeout = httpx.Timeout(300.0)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+        total = int(rps * duration)
+        interval = 1.0 / rps
+        tasks = []
+        started = time.perf_counter()
+
+        for i in range(total):
+            # Schedule against the start time so slow sends do not lower the rate
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_one(client, images[i % len(images)], results)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return results, elapsed
+
+
+def report(results: list, elapsed: float) -> dict:
+    """Print the summary and return the headline numbers"""
+    statuses = Counter(status for status, _ in results)
+    ok_latencies = [latency for status, latency in results if status == 200]
+    all_latencies = [latency for _, latency in results]
+    errors = len(results) - statuses.get(200, 0)
+
+    summary = {
+        "requests": len(results),
+        "throughput": len(ok_latencies) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(results) if results else 0.0,
+        "p50_ms": percentile(ok_latencies, 50) * 1000,
+        "p95_ms": percentile(ok_latencies, 95) * 1000,
+        "p99_ms": percentile(ok_latencies, 99) * 1000,
+    }
+
+    print(f"\n📊 {summary['requests']} requests in {elapsed:.1f}s")
+    print(f"   Throughput: {summary['throughput']:.2f} successful req/s")
+    print(f"   Status codes: {dict(sorted(statuses.items(), key=str))}")
+    print(f"   Latency (200s): p50 {summary['p50_ms']:.0f}ms, p95 {summary['p95_ms']:.0f}ms, "
+          f"p99 {summary['p99_ms']:.0f}ms, max {max(all_latencies, default=0) * 1000:.0f}ms")
+
+    print(f"\n{'stage':<12}{'calls':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage in STAGES:
+        timings = stage_timings.get(stage, [])
+        if not timings:
+            continue
+        print(f"{stage:<12}{len(timings):>8}{statistics.mean(timings) * 1000:>10.1f}"
+              f"{percentile(timings, 50) * 1000:>10.1f}{percentile(timings, 95) * 1000:>10.1f}"
+              f"{percentile(timings, 99) * 1000:>10.1f}")
+
+    limiter = llm_service.limiter.get_status()
+    print(f"\n🚦 LLM limiter: limit {limiter['limit']}, rejected {limiter['rejected']}, "
+          f"queue timeouts {limiter['queue_timeouts']}, avg queue wait {limiter['queue_wait_avg_seconds']}s")
+    print(f"🧪 Fake LLM: {llm_service.get_status().get('fake')}")
+
+    return summary
+
+
+def check_gates(summary: dict, args: argparse.Namespace) -> bool:
+    """Compare the run against the configured thresholds"""
+    gates = [
+        ("p95 latency", args.max_p95_ms, summary["p95_ms"], "ms", lambda value, limit: value <= limit),
+        ("p99 latency", args.max_p99_ms, summary["p99_ms"], "ms", lambda value, limit: value <= limit),
+        ("throughput", args.min_throughput, summary["throughput"], " req/s", lambda value, limit: value >= limit),
+        ("error rate", args.max_error_rate, summary["error_rate"], "", lambda value, limit: value <= limit),
+    ]
+
+    passed = True
+    for name, limit, value, unit, check in gates:
+        if limit is None:
+            continue
+        ok = check(value, limit)
+        passed = passed and ok
+        print(f"{'✅' if ok else '❌'} {name}: {value:.2f}{unit} (limit {limit}{unit})")
+    return passed
+
+
+def main():
+    """Run the load test and apply regression gates"""
+    parser = argparse.ArgumentParser(description="Offline load test for /api/v1/analyze/skin")
+    parser.add_argument("--rps", type=float, default=10.0, help="Target arrival rate (requests/second)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to send requests for")
+    parser.add_argument("--unique-images", type=int, default=0,
+                        help="Distinct images to cycle through (0 = one per request, so every request misses the cache)")
+    parser.add_argument("--image-size", default="1600x1200", help="Generated image size, WIDTHxHEIGHT")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if p95 latency exceeds this")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if p99 latency exceeds this")
+    parser.add_argument("--min-throughput", type=float, help="Fail if successful req/s falls below this")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if the non-200 fraction exceeds this")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    if not llm_service.uses_fake_backend:
+        print("❌ Refusing to run against the real OpenAI backend (set LLM_BACKEND=fake)")
+        sys.exit(2)
+
+    width, height = (int(part) for part in args.image_size.lower().split("x"))
+    image_count = args.unique_images or int(args.rps * args.duration)
+    print(f"🖼️ Generating {image_count} images ({width}x{height})...")
+    images = make_images(image_count, width, height)
+
+    print(f"🚀 {args.rps} req/s for {args.duration}s against {ENDPOINT}")
+    results, elapsed = asyncio.run(run_load(args.rps, args.duration, images))
+
+    summary = report(results, elapsed)
+    if not check_gates(summary, args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
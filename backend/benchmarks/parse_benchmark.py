@@ -0,0 +1,112 @@
+"""
+Micro-benchmark for the skin analysis response parser
+
+Runs parse_skin_analysis_response over a corpus of recorded LLM responses and
+compares it with the previous regex + json.loads implementation.
+
+Usage:
+    python benchmarks/parse_benchmark.py [--iterations N] [--corpus PATH]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from app.models.schemas import SkinAnalysisResponse, IngredientRecommendation
+from app.utils.parsing import parse_skin_analysis_response
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_responses.jsonl")
+
+def legacy_parse(llm_response: str) -> SkinAnalysisResponse:
+    """Previous implementation (regex cleanup, json.loads, per-item models)"""
+    response = re.sub(r'```json\s*', '', llm_response)
+    response = re.sub(r'```\s*$', '', response)
+    response = re.sub(r'^```\s*', '', response)
+    response = response.strip()
+    start_idx = response.find('{')
+    end_idx = response.rfind('}')
+    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+        response = response[start_idx:end_idx + 1]
+
+    data = json.loads(response)
+    required_fields = ['confidence', 'primaryCondition', 'skinType', 'ingredientRecommendations']
+    if not all(field in data for field in required_fields) or not isinstance(data['confidence'], int):
+        raise ValueError("Incomplete analysis response")
+
+    ingredients = []
+    for item in data.get('ingredientRecommendations', []):
+        try:
+            ingredients.append(IngredientRecommendation(**item))
+        except Exception:
+            continue
+
+    return SkinAnalysisResponse(
+        confidence=data['confidence'],
+        primaryCondition=data['primaryCondition'],
+        secondaryConditions=data.get('secondaryConditions', []),
+        skinType=data['skinType'],
+        ingredientRecommendations=ingredients,
+        description=data.get('description', 'Skin analysis completed successfully.')
+    )
+
+def load_corpus(path: str) -> list:
+    """Load recorded responses as (name, text) pairs"""
+    with open(path, encoding="utf-8") as f:
+        return [(row["name"], row["response"]) for row in map(json.loads, f) if row]
+
+def run_parser(parser, text: str) -> bool:
+    """Parse once, returning whether the response was accepted"""
+    try:
+        parser(text)
+        return True
+    except (HTTPException, ValueError):
+        return False
+
+def time_parser(parser, text: str, iterations: int) -> float:
+    """Median microseconds per parse over several timing rounds"""
+    rounds = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            run_parser(parser, text)
+        rounds.append((time.perf_counter() - started) / iterations * 1_000_000)
+    return statistics.median(rounds)
+
+def main():
+    """Run the benchmark and print a per-sample comparison"""
+    arg_parser = argparse.ArgumentParser(description="Benchmark the LLM response parser")
+    arg_parser.add_argument("--iterations", type=int, default=2000, help="Parses per timing round")
+    arg_parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file of recorded responses")
+    args = arg_parser.parse_args()
+
+    # Parser logging would dominate the timings
+    logging.disable(logging.CRITICAL)
+
+    corpus = load_corpus(args.corpus)
+    print(f"📊 {len(corpus)} recorded responses, {args.iterations} iterations x 5 rounds\n")
+    print(f"{'sample':<22}{'bytes':>8}{'legacy µs':>12}{'current µs':>12}{'speedup':>10}  accepted (legacy/current)")
+
+    legacy_total = current_total = 0.0
+    for name, text in corpus:
+        legacy_ok = run_parser(legacy_parse, text)
+        current_ok = run_parser(parse_skin_analysis_response, text)
+
+        legacy_us = time_parser(legacy_parse, text, args.iterations)
+        current_us = time_parser(parse_skin_analysis_response, text, args.iterations)
+        legacy_total += legacy_us
+        current_total += current_us
+
+        print(f"{name:<22}{len(text):>8}{legacy_us:>12.1f}{current_us:>12.1f}{legacy_us / current_us:>9.2f}x"
+              f"  {'✅' if legacy_ok else '❌'} / {'✅' if current_ok else '❌'}")
+
+    print(f"\n{'total':<30}{legacy_total:>12.1f}{current_total:>12.1f}{legacy_total / current_total:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+EXPLAIN check for the product candidate query on a seeded Postgres
+
+Seeds the products table with synthetic products (1M by default, marked by a
+"bench-" retailer SKU and reused on later runs), then runs EXPLAIN (ANALYZE,
+BUFFERS) for a set of match requests compiled by the candidate query
+compiler and by the previous one-containment-test-per-alias filters.
+Exits with status 1 if a compiled query does not use the ingredients GIN
+index, so it can gate changes to the compiler or the indexes.
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/product_query_explain.py [--products N] [--cleanup]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, or_, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+from app.models.product import Product
+from app.models.schemas import ProductMatchRequest
+from app.services.product_query import compile_candidate_query
+from app.utils.ingredients import expand_ingredient_search_terms, normalise_list
+
+GIN_INDEX = "idx_products_ingredients_gin"
+SEED_BATCH = 100_000
+
+# Share of products listing each ingredient: bases are common, actives are rare
+INGREDIENT_WEIGHTS = {
+    "water": 0.9,
+    "glycerin": 0.6,
+    "phenoxyethanol": 0.45,
+    "butylene glycol": 0.3,
+    "dimethicone": 0.25,
+    "propylene glycol": 0.15,
+    "tocopherol": 0.15,
+    "sodium benzoate": 0.1,
+    "potassium sorbate": 0.1,
+    "tocopheryl acetate": 0.05,
+    "sodium hyaluronate": 0.06,
+    "hyaluronic acid": 0.05,
+    "niacinamide": 0.04,
+    "nicotinamide": 0.005,
+    "ceramide np": 0.03,
+    "ceramides": 0.01,
+    "salicylic acid": 0.02,
+    "bha": 0.003,
+    "ascorbic acid": 0.02,
+    "vitamin c": 0.01,
+    "magnesium ascorbyl phosphate": 0.005,
+    "retinol": 0.02,
+    "retinyl palmitate": 0.01,
+    "glycolic acid": 0.02,
+    "lactic acid": 0.02,
+    "zinc oxide": 0.02,
+    "peptides": 0.01,
+    "palmitoyl pentapeptide": 0.005,
+    "azelaic acid": 0.005,
+}
+
+SCENARIOS = [
+    ("niacinamide + hyaluronic acid, no retinol, <= 25", ["niacinamide", "hyaluronic acid"], ["retinol"], 25.0),
+    ("vitamin c, no salicylic acid", ["vitamin c"], ["salicylic acid"], None),
+    ("ceramides + peptides", ["ceramides", "peptides"], [], None),
+    ("azelaic acid, <= 15", ["azelaic acid"], [], 15.0),
+]
+
+SEED_SQL = text("""
+INSERT INTO products (
+    id, retailer, retailer_sku, brand, name, country, currency, price, price_per_ml,
+    pdp_url, ingredients_raw, ingredients_norm, ingredients_norm_set, last_seen
+)
+SELECT
+    gen_random_uuid(),
+    (ARRAY['boots', 'amazon', 'superdrug', 'lookfantastic'])[1 + i % 4],
+    'bench-' || i,
+    'Bench Brand ' || (i % 500),
+    'Bench Product ' || i,
+    CASE WHEN i % 10 = 0 THEN 'US' ELSE 'GB' END,
+    'GBP',
+    CASE WHEN i % 20 = 0 THEN NULL ELSE round((2 + random() * 58)::numeric, 2) END,
+    round((0.02 + random() * 0.8)::numeric, 4),
+    'https://example.com/bench/' || i,
+    '',
+    ingredients.terms,
+    ingredients.terms,
+    now() - random() * interval '90 days'
+FROM generate_series(:start, :stop) AS i
+CROSS JOIN LATERAL (
+    SELECT ARRAY(
+        SELECT term
+        FROM unnest(CAST(:terms AS text[]), CAST(:weights AS float8[])) AS vocabulary(term, weight)
+        WHERE random() < weight + i * 0
+        UNION ALL
+        SELECT DISTINCT 'bench ingredient ' || ((random() * 5000)::int + i * 0)
+        FROM generate_series(1, 8)
+    ) AS terms
+) AS ingredients
+ON CONFLICT (retailer, retailer_sku) DO NOTHING
+""")
+
+
+def seed_products(engine, count: int) -> None:
+    """Insert synthetic products until count bench rows exist"""
+    with engine.connect() as conn:
+        existing = conn.execute(text("SELECT count(*) FROM products WHERE retailer_sku LIKE 'bench-%'")).scalar()
+
+    if existing >= count:
+        print(f"Reusing {existing:,} seeded products")
+        return
+
+    print(f"Seeding {count - existing:,} products...")
+    started = time.perf_counter()
+    for start in range(existing + 1, count + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH - 1, count)
+        with engine.begin() as conn:
+            conn.execute(SEED_SQL, {
+                "start": start,
+                "stop": stop,
+                "terms": list(INGREDIENT_WEIGHTS),
+                "weights": list(INGREDIENT_WEIGHTS.values()),
+            })
+        print(f"  {stop:,} rows ({time.perf_counter() - started:.0f}s)")
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE products"))
+
+
+def legacy_statement(request: ProductMatchRequest, required: list, avoid: list, limit: int = 200):
+    """Previous candidate query: one containment test per alias"""
+    statement = select(Product).where(Product.country == request.country)
+    for term in expand_ingredient_search_terms(required):
+        statement = statement.where(Product.ingredients_norm_set.contains([term]))
+    for term in expand_ingredient_search_terms(avoid) if avoid else set():
+        statement = statement.where(~Product.ingredients_norm_set.contains([term]))
+    if request.max_price is not None:
+        statement = statement.where(or_(Product.price.is_(None), Product.price <= request.max_price))
+    return statement.order_by(Product.last_seen.desc()).limit(limit)
+
+
+def plan_nodes(node: dict):
+    """Walk an EXPLAIN JSON plan tree"""
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(engine, statement) -> dict:
+    """Run EXPLAIN ANALYZE and summarise the plan"""
+    compiled = statement.compile(dialect=postgresql.dialect())
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled), compiled.params
+        ).scalar()
+
+    plan = result[0]
+    nodes = list(plan_nodes(plan["Plan"]))
+    return {
+        "rows": plan["Plan"].get("Actual Rows", 0),
+        "ms": plan["Execution Time"],
+        "gin": any(node.get("Index Name") == GIN_INDEX for node in nodes),
+        "nodes": [node["Node Type"] for node in nodes],
+        "shared_hit": sum(node.get("Shared Hit Blocks", 0) for node in nodes),
+        "shared_read": sum(node.get("Shared Read Blocks", 0) for node in nodes),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN check for the product candidate query")
+    parser.add_argument("--products", type=int, default=1_000_000, help="Synthetic products to seed")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--cleanup", action="store_true", help="Delete the seeded products afterwards")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    seed_products(engine, args.products)
+
+    failures = 0
+    for name, required, avoid, max_price in SCENARIOS:
+        request = ProductMatchRequest(
+            country="GB",
+            required_ingredients=required,
+            avoid_ingredients=avoid,
+            max_price=max_price
+        )
+        required_terms = normalise_list(required)
+        avoid_terms = normalise_list(avoid)
+
+        compiled = explain(engine, compile_candidate_query(request, required_terms, avoid_terms).statement())
+        legacy = explain(engine, legacy_statement(request, required_terms, avoid_terms))
+
+        print(f"\n{name}")
+        for label, summary in (("compiled", compiled), ("legacy", legacy)):
+            print(f"  {label:8s} rows={summary['rows']:4d}  {summary['ms']:8.1f} ms  "
+                  f"GIN={'yes' if summary['gin'] else 'no '}  "
+                  f"buffers hit/read={summary['shared_hit']}/{summary['shared_read']}  "
+                  f"plan={' > '.join(summary['nodes'])}")
+
+        if not compiled["gin"]:
+            failures += 1
+            print(f"  FAIL: compiled query does not use {GIN_INDEX}")
+
+    if args.cleanup:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM products WHERE retailer_sku LIKE 'bench-%'"))
+        print("\nSeeded products deleted")
+
+    print(f"\n{len(SCENARIOS) - failures}/{len(SCENARIOS)} scenarios use {GIN_INDEX}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Throughput benchmark for product scoring
+
+Scores synthetic candidate sets (10k to 1M products by default) with the
+vectorised scorer in app/services/product_scoring.py plus top-k selection,
+and with the per-product ProductService._calculate_score loop followed by a
+full sort. The loop is timed on at most --legacy-limit products and
+extrapolated beyond that. Every run also checks that both scorers agree.
+
+Usage:
+    python benchmarks/scoring_benchmark.py [--sizes 10000,100000,1000000] [--top-k 20] [--legacy-limit 100000]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.product_scoring import (
+    LEADING_POSITIONS,
+    encode_leading_terms,
+    naive_seconds,
+    retailer_score,
+    score_candidates,
+    top_k
+)
+from app.services.product_service import ProductService
+
+REQUIRED = ["niacinamide", "hyaluronic acid"]
+ACTIVES = ["niacinamide", "nicotinamide", "hyaluronic acid", "sodium hyaluronate", "ceramide np", "retinol"]
+BASES = ["water", "glycerin", "butylene glycol", "dimethicone", "phenoxyethanol"]
+RETAILERS = ["boots", "amazon", "superdrug", "lookfantastic", "other"]
+
+
+def make_products(count: int, seed: int = 0) -> list:
+    """Synthetic candidates shaped like Product rows"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    fillers = [f"ingredient {i}" for i in range(2000)]
+    products = []
+    for i in range(count):
+        ingredients = rng.sample(BASES, 3) + rng.sample(fillers, rng.randint(5, 20))
+        for active in rng.sample(ACTIVES, 2):
+            ingredients.insert(rng.randint(0, len(ingredients)), active)
+        products.append(SimpleNamespace(
+            ingredients_norm=ingredients,
+            last_seen=None if i % 50 == 0 else now - timedelta(days=rng.random() * 90),
+            price_per_ml=None if i % 20 == 0 else Decimal(f"{rng.uniform(0.5, 40):.4f}"),
+            retailer=rng.choice(RETAILERS)
+        ))
+    return products
+
+
+def build_columns(products: list) -> dict:
+    """Feature columns as kept by the ingredient index"""
+    term_ids = {}
+    leading_terms = np.array(
+        [encode_leading_terms(product.ingredients_norm, term_ids) for product in products], dtype=np.int32
+    ).reshape(len(products), LEADING_POSITIONS)
+    return {
+        "leading_terms": leading_terms,
+        "term_ids": term_ids,
+        "last_seen": np.array([naive_seconds(product.last_seen) for product in products]),
+        "price_per_ml": np.array(
+            [float(product.price_per_ml) if product.price_per_ml is not None else np.nan for product in products]
+        ),
+        "retailer_scores": np.array([retailer_score(product.retailer) for product in products]),
+    }
+
+
+def run_vectorised(columns: dict, k: int, repeats: int) -> tuple:
+    """Best-of-repeats time for score + top-k"""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        scores = score_candidates(required_ingredients=REQUIRED, **columns)
+        selected = top_k(scores, k)
+        best = min(best, time.perf_counter() - started)
+    return best, scores, selected
+
+
+def run_legacy(service: ProductService, products: list, k: int) -> tuple:
+    """Per-product loop and full sort, as in match_products before the index"""
+    started = time.perf_counter()
+    scored = [(index, service._calculate_score(product, REQUIRED)) for index, product in enumerate(products)]
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return time.perf_counter() - started, np.array([score for _, score in scored]), scored[:k]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Product scoring throughput benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated candidate counts")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--legacy-limit", type=int, default=100_000, help="Max products timed with the loop")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    # _calculate_score only reads its arguments, so skip adapter and Redis setup
+    service = ProductService.__new__(ProductService)
+    failures = 0
+
+    print(f"{'candidates':>12s}  {'loop':>10s}  {'vectorised':>11s}  {'loop/s':>12s}  {'vectorised/s':>13s}  {'speed-up':>8s}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        products = make_products(size)
+        columns = build_columns(products)
+        vector_time, scores, selected = run_vectorised(columns, args.top_k, args.repeats)
+
+        sample = min(size, args.legacy_limit)
+        legacy_time, legacy_scores, legacy_top = run_legacy(service, products[:sample], args.top_k)
+        legacy_time *= size / sample
+
+        # Both scorers must give the same scores and the same top-k scores
+        mismatches = int(np.sum(np.abs(np.sort(scores[:sample])[::-1] - legacy_scores) > 0.01))
+        if sample == size and not np.allclose(scores[selected], [score for _, score in legacy_top], atol=0.01):
+            mismatches += 1
+        failures += mismatches
+
+        print(f"{size:>12,d}  {legacy_time * 1000:>8.1f}ms{'*' if sample < size else ' '} "
+              f"{vector_time * 1000:>9.2f}ms  {size / legacy_time:>12,.0f}  {size / vector_time:>13,.0f}  "
+              f"{legacy_time / vector_time:>7.0f}x"
+              + (f"  MISMATCH x{mismatches}" if mismatches else ""))
+
+    print("\n* extrapolated from --legacy-limit products")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,12 +35,46 @@ CREATE TABLE IF NOT EXISTS skin_analyses (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create llm_usage table (token usage and cost per LLM call)
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    model VARCHAR(100) NOT NULL,
+    personalized BOOLEAN NOT NULL DEFAULT FALSE,
+    streamed BOOLEAN NOT NULL DEFAULT FALSE,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL,
+    image_bytes INTEGER,
+    finish_reason VARCHAR(32),
+    cost_usd NUMERIC(12, 8) NOT NULL DEFAULT 0,
+    analysis_key VARCHAR(32),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Added after llm_usage was first created: groups the calls of one analysis
+ALTER TABLE llm_usage ADD COLUMN IF NOT EXISTS analysis_key VARCHAR(32);
+
+-- Create llm_outputs table (compressed raw completions for re-parsing)
+CREATE TABLE IF NOT EXISTS llm_outputs (
+    cache_key VARCHAR(255) PRIMARY KEY,
+    output_format VARCHAR(20) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    raw_output BYTEA NOT NULL,
+    raw_size INTEGER NOT NULL,
+    parse_ok BOOLEAN NOT NULL DEFAULT FALSE,
+    parse_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    parsed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_firebase_uid ON users(firebase_uid);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_user_surveys_user_id ON user_surveys(user_id);
 CREATE INDEX IF NOT EXISTS idx_skin_analyses_user_id ON skin_analyses(user_id);
 CREATE INDEX IF NOT EXISTS idx_skin_analyses_survey_id ON skin_analyses(survey_id);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_outputs_parse_ok ON llm_outputs(parse_ok);
 
 -- Create updated_at trigger function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
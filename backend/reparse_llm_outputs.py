@@ -0,0 +1,90 @@
+"""
+Re-run parsing and validation over stored raw LLM outputs
+
+Run after changing the response parser or schema to see which stored
+completions still parse, and to mark previously failed ones that now do.
+Failed outputs left unmarked are instead re-parsed and served on the next
+matching upload within the result cache TTL.
+
+Usage:
+    python reparse_llm_outputs.py                 # every stored output
+    python reparse_llm_outputs.py --only-failed   # only outputs whose last parse failed
+    python reparse_llm_outputs.py --key <cache key> --show
+    python reparse_llm_outputs.py --purge [--retention-days 30]
+"""
+import argparse
+import json
+import logging
+import sys
+import zlib
+
+from app.models.database import SessionLocal
+from app.services.database_service import DatabaseService
+from app.config import settings
+from app.services.raw_output_service import (
+    describe_parse_error,
+    parse_stored_output,
+    purge_stored_outputs,
+    reparse_stored_outputs
+)
+
+
+def reparse_one(cache_key: str, show: bool) -> int:
+    """Re-parse a single stored output and print the result"""
+    db = SessionLocal()
+    try:
+        output = DatabaseService(db).get_llm_output(cache_key)
+        if output is None:
+            print(f"❌ No stored output for {cache_key}")
+            return 1
+
+        raw_output = zlib.decompress(output.raw_output).decode("utf-8")
+        try:
+            response = parse_stored_output(output.output_format, raw_output)
+        except Exception as e:
+            print(f"❌ Still does not parse: {describe_parse_error(e)}")
+            if show:
+                print(raw_output)
+            return 1
+
+        print(f"✅ Parses ({output.output_format}, {output.raw_size} bytes raw, "
+              f"{len(output.raw_output)} stored)")
+        if show:
+            print(json.dumps(response.model_dump(), indent=2))
+        return 0
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse stored raw LLM outputs")
+    parser.add_argument("--only-failed", action="store_true", help="Only outputs whose last parse failed")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per page and update transaction")
+    parser.add_argument("--key", help="Re-parse a single output by cache key (read-only)")
+    parser.add_argument("--show", action="store_true", help="With --key, print the parsed result or raw text")
+    parser.add_argument("--purge", action="store_true", help="Delete outputs older than the retention period")
+    parser.add_argument("--retention-days", type=int, default=settings.RAW_OUTPUT_RETENTION_DAYS,
+                        help="With --purge, age in days after which outputs are deleted")
+    args = parser.parse_args()
+
+    # Per-output parser logging would drown the summary
+    logging.disable(logging.INFO)
+
+    if args.key:
+        sys.exit(reparse_one(args.key, args.show))
+
+    if args.purge:
+        deleted = purge_stored_outputs(args.retention_days)
+        if deleted is None:
+            print("❌ Purge failed")
+            sys.exit(1)
+        print(f"🧹 Purged {deleted} stored outputs older than {args.retention_days} days")
+        return
+
+    counts = reparse_stored_outputs(only_failed=args.only_failed, batch_size=args.batch_size)
+    print(f"🔁 Checked {counts['checked']} stored outputs - {counts['parsed']} ok, "
+          f"{counts['failed']} failed, {counts['changed']} changed status")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Recompute the scoring features stored on products
+
+Run once after adding the feature columns, after changing the ingredient
+alias dictionary (every row's features become stale), and after bulk
+writes that bypass the ORM (clear features_version on the rows they touch).
+
+Usage:
+    python reparse_product_features.py          # products with missing or stale features
+    python reparse_product_features.py --all    # every product
+"""
+import argparse
+import logging
+
+from app.services.product_features import canonical_ingredients, features_version, refresh_stale_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute stored product scoring features")
+    parser.add_argument("--all", action="store_true", help="Recompute every product, not just stale ones")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per page and update transaction")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    print(f"🧩 Feature layout version {features_version()} ({len(canonical_ingredients())} canonical ingredients)")
+    counts = refresh_stale_features(recompute_all=args.all, batch_size=args.batch_size)
+    print(f"✅ Recomputed features for {counts['updated']} products")
+
+
+if __name__ == "__main__":
+    main()